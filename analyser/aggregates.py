@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+# Aggregates of the live objects of a model, kept up to date as the
+# model changes, so that data collectors can read them without scanning
+# every object (see Model.get_aggregates).
+#
+# The incoming references of the objects are kept as a histogram, a
+# list counting the objects with each number of incoming references.
+# The mean follows from the sum of the references, the minimum is the
+# first non-empty bucket, which is almost always one of the first, and
+# the maximum the last one, the empty buckets at the end being dropped
+# when it's read.
+
+
+class Aggregates(object):
+
+    def __init__(self):
+        self.live = 0
+        self.builtin = 0
+        # Type -> number of live objects
+        self.types = {}
+        # Number of incoming references -> number of live objects
+        self.in_hist = [0]
+        self.in_sum = 0
+
+    def add_obj(self, obj_type, builtin):
+        """
+        Count a new object, without any references.
+        """
+        self.live += 1
+        if builtin:
+            self.builtin += 1
+        self.types[obj_type] = self.types.get(obj_type, 0) + 1
+        self.in_hist[0] += 1
+
+    def remove_obj(self, obj_type, builtin, in_refs):
+        self.live -= 1
+        if builtin:
+            self.builtin -= 1
+        count = self.types[obj_type] - 1
+        if count:
+            self.types[obj_type] = count
+        else:
+            del self.types[obj_type]
+        self.in_hist[in_refs] -= 1
+        self.in_sum -= in_refs
+
+    def set_type(self, old_type, old_builtin, obj_type, builtin):
+        if old_builtin:
+            self.builtin -= 1
+        if builtin:
+            self.builtin += 1
+        count = self.types[old_type] - 1
+        if count:
+            self.types[old_type] = count
+        else:
+            del self.types[old_type]
+        self.types[obj_type] = self.types.get(obj_type, 0) + 1
+
+    def inc_in_refs(self, in_refs):
+        """
+        Move an object with in_refs incoming references up by one.
+        """
+        hist = self.in_hist
+        hist[in_refs] -= 1
+        if in_refs + 1 == len(hist):
+            hist.append(1)
+        else:
+            hist[in_refs + 1] += 1
+        self.in_sum += 1
+
+    def dec_in_refs(self, in_refs):
+        """
+        Move an object with in_refs incoming references down by one.
+        """
+        hist = self.in_hist
+        hist[in_refs] -= 1
+        hist[in_refs - 1] += 1
+        self.in_sum -= 1
+
+    def move_in_refs(self, old, new):
+        hist = self.in_hist
+        hist[old] -= 1
+        while new >= len(hist):
+            hist.append(0)
+        hist[new] += 1
+        self.in_sum += new - old
+
+    def live_count(self):
+        return self.live
+
+    def builtin_count(self):
+        return self.builtin
+
+    def custom_count(self):
+        return self.live - self.builtin
+
+    def type_counts(self):
+        return dict(self.types)
+
+    def min_in_refs(self):
+        if not self.live:
+            return 0
+        for in_refs, count in enumerate(self.in_hist):
+            if count:
+                return in_refs
+
+    def max_in_refs(self):
+        if not self.live:
+            return 0
+        hist = self.in_hist
+        while not hist[-1]:
+            hist.pop()
+        return len(hist) - 1
+
+    def avg_in_refs(self):
+        if not self.live:
+            return 0.0
+        return self.in_sum / float(self.live)
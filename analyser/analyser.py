@@ -1,6 +1,12 @@
 #!/usr/bin/env python
-import sys, os, gc, time, json
+import sys, os, gc, time, json, gzip, itertools
 import graphmodel
+import bintrace
+import checkpoint
+import pipeline
+import querycompiler
+import snapshot
+import symbols
 from combinators import *
 
 #TODO: Documentation
@@ -15,97 +21,270 @@ class Opcodes:
     VSTORE = "7"
 
 
-def process(model, event):
-    if event[0] == Opcodes.ALLOC:
-        if not model.has_obj(event[1]):
-            model.add_obj(event[1], event[2])
-        else:
-            # Shouldn't happen, but most often in the logs, the object
-            # constructor method event (4) is run before allocation event (1),
-            # meaning that the object is has to be added to the graph without
-            # a type, and then have it set in this following allocation event.
-            # Since this is the allocation event, and therefore the first time
-            # the object SHOULD be observed, it makes sense to reset the
-            # object's queries, whatever they were up until this moment.
-            model.set_obj_type(event[1], event[2])
-            model.reset_obj_queries(event[1])
-    
-    elif event[0] == Opcodes.FLOAD:
-        pass
-    
-    elif event[0] == Opcodes.FSTORE:
-        if not model.has_obj(event[5]):
-            model.add_obj(event[5])
-        # The event implies that there is a reference between caller and
-        # oldObjID, but this must be verified due to an observed anomaly.
-        if event[3] != "0" and model.has_heap_ref(event[5], event[3]):
-            model.remove_heap_ref(event[5], event[3])
-        if event[2] != "0":
-            model.add_heap_ref(event[5], event[2])
-    
-    elif event[0] == Opcodes.MCALL:
-        # If caller doesn't exist
-        # (should never happen, but has been observed in JVM startup events)
-        if not model.has_obj(event[2]):
-            model.add_obj(event[2])
-        # If methodOwner doesn't exist 
-        # (e.g. when methodName is <init>)
-        if not model.has_obj(event[3]):
-            model.add_obj(event[3])
-        for arg in event[4:]:
-            # If passed argument doesn't exist 
-            # (e.g. unallocated string object)
-            if not model.has_obj(arg):
-                model.add_obj(arg)
-            # Adding a stack reference from the method owner to the passed
-            # object, since the method owner must have had a reference to the
-            # object to be able to pass it.
-            model.add_stack_ref(event[3], arg)
-    
-    elif event[0] == Opcodes.DEALLOC:
-        # Objects for which the deallocation event occur seem to have
-        # remaining incoming references, therefore we force the removal of the
-        # object. Don't know what it depends on, but probably some
-        # inaccuracies in Erik's tool.
-        model.remove_obj(event[1], force=True)
-    
-    elif event[0] == Opcodes.MEXIT:
-        for arg in event[5:]:
-            if model.has_stack_ref(event[4], arg):
-                model.remove_stack_ref(event[4], arg)
-    
-    elif event[0] == Opcodes.VSTORE:
-        # The event implies that there is a reference between caller and
-        # oldObjID, but this must be verified due to an observed anomaly.
-        if event[2] != "0" and model.has_stack_ref(event[3], event[2]):
-            model.remove_stack_ref(event[3], event[2])
-        if event[1] != "0":
-            model.add_stack_ref(event[3], event[1])
-    
+# Handlers of the events, one per opcode. The existence checks done 
+# before most changes to the model are fused into the operations of 
+# the model (ensure_obj, remove_*_ref_if_present, ...), which can do 
+# them with a single lookup.
+
+def alloc_site(model, caller):
+    # The class allocating an object: the type of the calling object, 
+    # or the static class itself, left as its name by intern_events
+    if caller.__class__ is not str:
+        return model.get_obj_type(caller) if model.has_obj(caller) \
+               else "(unknown)"
+    return caller
+
+
+def process_alloc(model, event):
+    if not model.has_obj(event[1]):
+        model.add_obj(event[1], event[2], alloc_site(model, event[3]))
     else:
-        #raise Exception("OPCODE {0} NOT RECOGNISED".format(event[0]))
-        print "ERROR: OPCODE {0} NOT RECOGNISED".format(event[0])
+        # Shouldn't happen, but most often in the logs, the object
+        # constructor method event (4) is run before allocation event (1),
+        # meaning that the object is has to be added to the graph without
+        # a type, and then have it set in this following allocation event.
+        # Since this is the allocation event, and therefore the first time
+        # the object SHOULD be observed, it makes sense to reset the
+        # object's queries, whatever they were up until this moment.
+        model.set_obj_type(event[1], event[2])
+        model.set_obj_site(event[1], alloc_site(model, event[3]))
+        model.reset_obj_queries(event[1])
 
 
-def execute(model, log_lines, query_rate, collect_rate, update_rate):
-    for i, line in enumerate(log_lines):
-        event = line.strip().split(" ")
-        
+def process_fload(model, event):
+    pass
+
+
+def process_fstore(model, event):
+    model.ensure_obj(event[5])
+    # The event implies that there is a reference between caller and
+    # oldObjID, but this must be verified due to an observed anomaly.
+    if event[3] != 0:
+        model.remove_heap_ref_if_present(event[5], event[3])
+    if event[2] != 0:
+        model.add_heap_ref(event[5], event[2])
+
+
+def process_mcall(model, event):
+    # If caller doesn't exist
+    # (should never happen, but has been observed in JVM startup events)
+    model.ensure_obj(event[2])
+    # If methodOwner doesn't exist 
+    # (e.g. when methodName is <init>)
+    owner = event[3]
+    model.ensure_obj(owner)
+    call_stack = model.get_call_stack()
+    if call_stack is not None:
+        # The references are kept in a frame of the call, and removed 
+        # along with it (see callstack.py)
+        call_stack.call(model, event[1], event[2], owner, event[4:])
+        return
+    for arg in event[4:]:
+        # Adding a stack reference from the method owner to the passed
+        # object, since the method owner must have had a reference to the
+        # object to be able to pass it. The passed object is added if it 
+        # doesn't exist (e.g. unallocated string object).
+        model.ensure_and_add_stack_ref(owner, arg)
+
+
+def process_dealloc(model, event):
+    # Objects for which the deallocation event occur seem to have
+    # remaining incoming references, therefore we force the removal of the
+    # object. Don't know what it depends on, but probably some
+    # inaccuracies in Erik's tool.
+    model.remove_obj(event[1], force=True)
+
+
+def process_mexit(model, event):
+    call_stack = model.get_call_stack()
+    if call_stack is not None and call_stack.exit(model, event[1], event[3]):
+        return
+    # Without a frame of the call, the references to the objects going 
+    # out of scope are removed one by one
+    owner = event[4]
+    for arg in event[5:]:
+        model.remove_stack_ref_if_present(owner, arg)
+
+
+def process_vstore(model, event):
+    call_stack = model.get_call_stack()
+    if call_stack is not None:
+        call_stack.store(model, event[3], event[1], event[2])
+        return
+    # The event implies that there is a reference between caller and
+    # oldObjID, but this must be verified due to an observed anomaly.
+    if event[2] != 0:
+        model.remove_stack_ref_if_present(event[3], event[2])
+    if event[1] != 0:
+        model.add_stack_ref(event[3], event[1])
+
+
+def process_unknown(model, event):
+    #raise Exception("OPCODE {0} NOT RECOGNISED".format(event[0]))
+    print "ERROR: OPCODE {0} NOT RECOGNISED".format(event[0])
+
+
+HANDLERS = {
+    Opcodes.ALLOC: process_alloc,
+    Opcodes.FLOAD: process_fload,
+    Opcodes.FSTORE: process_fstore,
+    Opcodes.MCALL: process_mcall,
+    Opcodes.DEALLOC: process_dealloc,
+    Opcodes.MEXIT: process_mexit,
+    Opcodes.VSTORE: process_vstore
+}
+
+
+def process(model, event):
+    HANDLERS.get(event[0], process_unknown)(model, event)
+
+
+class QueryModes:
+    # Apply the queries of every object in the model
+    FULL = "full"
+    # Only apply the queries of objects changed since the last pass
+    DIRTY = "dirty"
+    # As DIRTY, but verify that a full pass wouldn't have changed the 
+    # state of any of the skipped queries
+    CHECK = "check"
+    # Apply the queries after every event, only to the objects changed 
+    # in a property the queries depend on (see querycompiler.query_deps). 
+    # Gives the same results as FULL with a query rate of 1.
+    EVENTS = "events"
+
+
+def check_clean_queries(model, dirty):
+    for obj in model.get_obj_ids():
+        if obj in dirty:
+            continue
+        for qry in model.get_obj_queries(obj):
+            c = qry.clone()
+            c.apply()
+            if c.isAccepting() != qry.isAccepting() or \
+               c.isFrozen() != qry.isFrozen():
+                raise Exception("check_clean_queries: "
+                                "Query {0} of unchanged object {1} "
+                                "changed state when applied" \
+                                .format(qry.toString(), obj))
+
+
+def apply_queries(model, query_mode, apply=None):
+    # The dirty set is popped in every mode, to keep it from growing. 
+    # The queries are applied with model.apply_queries, unless another 
+    # function is given (see Profiler.query_applier). Objects whose 
+    # queries are all frozen are left out of the passes.
+    dirty = model.pop_dirty_obj_ids()
+    objs = model.get_active_obj_ids() if query_mode == QueryModes.FULL \
+           else dirty
+    if apply is None:
+        apply = model.apply_queries
+    apply(objs)
+    if query_mode == QueryModes.CHECK:
+        check_clean_queries(model, dirty)
+
+
+def parse_lines(log_lines):
+    for line in log_lines:
+        yield line.strip().split(" ")
+
+
+# The tokens of each event that are object IDs: the positions of single 
+# IDs, and the position from which all remaining tokens are IDs
+OBJ_ID_TOKENS = {
+    Opcodes.ALLOC: ((1,), None),
+    Opcodes.FSTORE: ((2, 3, 5), None),
+    Opcodes.MCALL: ((2, 3), 4),
+    Opcodes.DEALLOC: ((1,), None),
+    Opcodes.MEXIT: ((3, 4), 5),
+    Opcodes.VSTORE: ((1, 2, 3), None)
+}
+
+
+def intern_events(events, symbol_table):
+    """
+    Replace the object IDs of the events with their keys in the symbol 
+    table (see symbols.py), which are ints. The caller of an allocation 
+    is only used for its type, and is left as the class name if it's 
+    one (see alloc_site).
+    """
+    obj_id = symbol_table.obj_id
+    positions = OBJ_ID_TOKENS
+    for event in events:
+        p = positions.get(event[0])
+        if p is not None:
+            fixed, rest = p
+            for i in fixed:
+                event[i] = obj_id(event[i])
+            if rest is not None:
+                for i in xrange(rest, len(event)):
+                    event[i] = obj_id(event[i])
+            elif event[0] == Opcodes.ALLOC:
+                caller = event[3]
+                if caller.__class__ is str and caller.isdigit():
+                    event[3] = int(caller)
+        yield event
+
+
+# The progress passed to the data collectors when it isn't known
+UNKNOWN_PROGRESS = float("nan")
+
+
+def execute(model, events, query_rate, collect_rate, update_rate,
+            progress=None, query_mode=QueryModes.FULL, start=0,
+            checkpoint_rate=None, save_checkpoint=None, profiler=None,
+            snapshot_at=(), snapshot_trigger=None, save_snapshot=None):
+    # The progress function maps an event index to the progress passed 
+    # to the data collectors. A list of events knows its own length, a 
+    # LogStream has to estimate it from the bytes consumed. When it 
+    # can't, e.g. on stdin without a line count, the progress is None, 
+    # and the collectors get NaN instead.
+    if progress is None:
+        progress = lambda i: i / float(len(events))
+
+    # With a profiler, the events, handlers, queries and data collectors 
+    # are wrapped to be timed (see profiler.py).
+    events_iter, handlers, unknown, apply = \
+        events, HANDLERS, process_unknown, None
+    if profiler is not None:
+        events_iter = profiler.events(events, start)
+        handlers, unknown = profiler.handlers(HANDLERS, process_unknown)
+        apply = profiler.query_applier(model)
+        data_collectors = profiler.install_collectors(model)
+        start_time = time.time()
+
+    # When resuming from a checkpoint, the events start at index start.
+    # Every checkpoint_rate events, save_checkpoint is called with the 
+    # index of the next event. So is save_snapshot, when that index is 
+    # in snapshot_at, or snapshot_trigger returns True for the model 
+    # and the event just processed.
+    for i, event in enumerate(events_iter, start):
         if i % update_rate == 0:
             print "Processing line", i
             
         if i % collect_rate == 0:
-            model.collect_data(i / float(len(log_lines)))
+            p = progress(i)
+            model.collect_data(p if p is not None else UNKNOWN_PROGRESS)
             
-        process(model, event)
+        # Same as process(model, event), without the extra call
+        handlers.get(event[0], unknown)(model, event)
         
         if i % query_rate == 0:
-            for obj in model.get_obj_ids():
-                for qry in model.get_obj_queries(obj):
-                    qry.apply()
+            apply_queries(model, query_mode, apply)
+
+        if checkpoint_rate and (i + 1) % checkpoint_rate == 0:
+            save_checkpoint(i + 1)
+
+        if save_snapshot is not None and \
+           ((i + 1) in snapshot_at or
+            snapshot_trigger is not None and snapshot_trigger(model, event)):
+            save_snapshot(i + 1)
     
     model.collect_data(1.0)
 
+    if profiler is not None:
+        profiler.restore_collectors(model, data_collectors)
+        profiler.finish(time.time() - start_time)
+
 
 #Theoretically, after all events are processed, no objects should 
 #remain in the model, but it has to be taken into account that 
@@ -119,6 +298,20 @@ def get_remaining_results(model, results):
              "queries" : model.get_obj_queries(obj)}
 
 
+def split_results(model, results):
+    """
+    Split the results of a model with several sets of query factories 
+    into one results dictionary per set, keyed by the name of the set.
+    """
+    split = {}
+    for name, start, end in model.get_query_sets():
+        split[name] = \
+            dict((obj, {"type": data["type"],
+                        "queries": list(data["queries"])[start:end]}) \
+                 for obj, data in results.iteritems())
+    return split
+
+
 def format_time(seconds):
     seconds = int(seconds)
     m, s = divmod(seconds, 60)
@@ -137,26 +330,263 @@ def read_fn(log_fn):
         return read_file(log_file)
 
 
-def run(model, log_fn=None, query_rate=1, collect_rate=1, update_rate=1000):
-    print "Reading logs..."
-    log_lines = read_file(sys.stdin) if log_fn is None else read_fn(log_fn)
-    print "Done"
+class LogStream(object):
+    """
+    Iterate lazily over the events of a log, instead of reading all of 
+    its lines into memory with readlines(). The log is read from stdin 
+    if no file name is given. Log files compressed with gzip or zstd 
+    are recognised by their magic number and decompressed on the fly, 
+    decompressing zstd requires the 'zstandard' package. Binary traces 
+    (see bintrace.py) are read directly, without parsing any text.
+
+    Since the number of lines isn't known in advance, progress is 
+    estimated from the number of (compressed) bytes consumed from the 
+    file. If line_count is provided, progress is instead computed from 
+    the number of lines read. When reading from stdin without a line 
+    count, the total is unknown and the progress is None.
+
+    With int_tokens, the integer tokens of binary traces are returned 
+    as ints rather than strings, to be used as object IDs directly (see 
+    intern_events).
+    """
+
+    GZIP_MAGIC = "\x1f\x8b"
+    ZSTD_MAGIC = "\x28\xb5\x2f\xfd"
+
+    def __init__(self, log_fn=None, line_count=None, int_tokens=False):
+        self.log_fn = log_fn
+        self.line_count = line_count
+        self._trace = None
+        # The file lines are read from, if it supports seeking
+        self._file = None
+        if log_fn is None:
+            self._raw = sys.stdin
+            self.total_bytes = None
+            self._lines = self._read_lines(sys.stdin)
+            return
+        if not os.path.isfile(log_fn):
+            raise Exception("LOG FILE {} DOESN'T EXIST".format(log_fn))
+        if bintrace.is_binary_trace(log_fn):
+            self._trace = bintrace.TraceReader(log_fn, int_tokens)
+            self.total_bytes = self._trace.total_bytes
+            return
+        self._raw = open(log_fn, "rb")
+        self.total_bytes = os.path.getsize(log_fn)
+        magic = self._raw.read(4)
+        self._raw.seek(0)
+        if magic.startswith(LogStream.GZIP_MAGIC):
+            self._file = gzip.GzipFile(fileobj=self._raw)
+            self._lines = self._read_lines(self._file)
+        elif magic.startswith(LogStream.ZSTD_MAGIC):
+            self._lines = self._read_zstd_lines(self._raw)
+        else:
+            self._file = self._raw
+            self._lines = self._read_lines(self._file)
+
+    def _read_lines(self, f):
+        # readline() instead of iterating the file, since iterating uses 
+        # a read-ahead buffer which makes tell() unreliable.
+        readline = f.readline
+        line = readline()
+        while line:
+            yield line
+            line = readline()
+
+    def _read_zstd_lines(self, f):
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("LOG FILE {} IS ZSTD COMPRESSED, "
+                            "BUT 'zstandard' IS NOT INSTALLED" \
+                            .format(self.log_fn))
+        rest = ""
+        for chunk in zstandard.ZstdDecompressor().read_to_iter(f):
+            lines = (rest + chunk).split("\n")
+            rest = lines.pop()
+            for line in lines:
+                yield line
+        if rest:
+            yield rest
+
+    def __iter__(self):
+        if self._trace is not None:
+            return iter(self._trace)
+        return parse_lines(self._lines)
+
+    def progress(self, i):
+        if self.line_count:
+            return i / float(self.line_count)
+        if self._trace is not None:
+            return self._trace.progress(i)
+        if self.total_bytes:
+            return self._raw.tell() / float(self.total_bytes)
+        return None
+
+    def tell(self):
+        """
+        Return the offset of the next event in the (decompressed) log, 
+        or None if the log doesn't support seeking.
+        """
+        if self._trace is not None:
+            return self._trace.position
+        if self._file is None:
+            return None
+        return self._file.tell()
+
+    def seek(self, offset):
+        """
+        Continue reading from an offset returned by tell(). Must be 
+        called before iterating over the events.
+        """
+        if self._trace is not None:
+            self._trace.seek(offset)
+        else:
+            self._file.seek(offset)
+
+    def close(self):
+        if self._trace is not None:
+            self._trace.close()
+        elif self._raw is not sys.stdin:
+            self._raw.close()
+
+
+def run(model, log_fn=None, query_rate=1, collect_rate=1, update_rate=1000,
+        stream=False, line_count=None, query_mode=QueryModes.FULL,
+        query_sets=None, collector_sets=None, checkpoint_fn=None,
+        checkpoint_rate=None, resume=False, restore_queries=True,
+        profiler=None, pipeline_mode=None, result_sink=None,
+        snapshot_fn=None, snapshot_at=None, snapshot_trigger=None):
+    # Several named sets of query factories and data collectors can be 
+    # evaluated in a single pass over the events, sharing one model. 
+    # The results are then returned per query set.
+    if query_sets is not None:
+        model.set_query_sets(sorted(query_sets.items()))
+    # Changes of properties no query depends on don't make objects dirty
+    query_deps = None
+    if query_mode == QueryModes.EVENTS:
+        query_rate = 1
+        query_deps = querycompiler.query_deps(model.qry_fs)
+        model.set_query_deps(query_deps)
+    if collector_sets is not None:
+        # In the order of the sets, which the offsets of the collector 
+        # files saved in checkpoints follow
+        for _, data_collectors in sorted(collector_sets.items()):
+            model.add_data_collectors(data_collectors)
+    # With a result sink, the queries of removed objects are finalised 
+    # as they are removed instead of being kept (see results.py)
+    if result_sink is not None:
+        model.set_result_sink(result_sink)
+
+    # Resume from the checkpoint, if there is one. Without restoring 
+    # the queries, the checkpoint only provides a warmed-up heap to 
+    # start the queries from.
+    start_index, offset = 0, None
+    # The names used as object IDs (see intern_events)
+    symbol_table = symbols.SymbolTable()
+    if resume and os.path.isfile(checkpoint_fn):
+        print "Loading checkpoint..."
+        saved = checkpoint.load(checkpoint_fn)
+        symbol_table.load_state(saved["symbols"])
+        model.load_state(saved["model"], restore_queries=restore_queries)
+        if result_sink is not None and restore_queries and \
+           saved.get("sink") is not None:
+            result_sink.load_state(saved["sink"])
+        start_index, offset = saved["index"], saved["offset"]
+        print "Done"
+
+    if pipeline_mode is not None:
+        # The log is streamed by a reader thread or process (see 
+        # pipeline.py)
+        stream = True
+        events = pipeline.PipelinedStream(
+            lambda: LogStream(log_fn, line_count, int_tokens=True),
+            offset=offset, start=start_index,
+            use_process=pipeline_mode == "process")
+        progress = events.progress
+        position = events.tell
+        events_iter = iter(events)
+    elif stream or (log_fn is not None and bintrace.is_binary_trace(log_fn)):
+        stream = True
+        events = LogStream(log_fn, line_count, int_tokens=True)
+        progress = events.progress
+        position = events.tell
+        if offset is not None:
+            events.seek(offset)
+            events_iter = iter(events)
+        else:
+            events_iter = itertools.islice(events, start_index, None)
+    else:
+        print "Reading logs..."
+        start = time.time()
+        log_lines = read_file(sys.stdin) if log_fn is None else read_fn(log_fn)
+        if profiler is not None:
+            profiler.add_time("read", time.time() - start)
+        events_iter = parse_lines(log_lines[start_index:])
+        progress = lambda i: i / float(len(log_lines))
+        position = lambda: None
+        print "Done"
+    events_iter = intern_events(events_iter, symbol_table)
+    if result_sink is not None:
+        result_sink.set_symbols(symbol_table)
+
+    save_checkpoint = lambda i: checkpoint.save(checkpoint_fn, model,
+                                                i, position(), log_fn,
+                                                result_sink, symbol_table)
+    # Snapshots of the heap are saved to snapshot_fn formatted with the 
+    # number of events processed (see snapshot.py)
+    snapshot_at = frozenset(snapshot_at or ())
+    save_snapshot = None
+    if snapshot_fn is not None:
+        save_snapshot = lambda i: snapshot.save(snapshot_fn.format(i), model,
+                                                i, symbol_table)
     
     print "\nExecuting with parameters:"
     if log_fn:
         print "-- log_fn = {}".format(log_fn)
     print "-- query_rate = {}".format(query_rate)
+    print "-- query_mode = {}".format(query_mode)
+    if query_deps is not None:
+        print "-- query_deps = {}".format(", ".join(sorted(query_deps)))
+    if query_sets is not None:
+        print "-- query_sets = {}".format(", ".join(sorted(query_sets)))
     print "-- collect_rate = {}".format(collect_rate)
     print "-- update_rate = {}".format(update_rate)
+    print "-- stream = {}".format(stream)
+    if pipeline_mode is not None:
+        print "-- pipeline = {}".format(pipeline_mode)
+    print "-- profile = {}".format(profiler is not None)
+    if checkpoint_fn:
+        print "-- checkpoint_fn = {}".format(checkpoint_fn)
+        print "-- checkpoint_rate = {}".format(checkpoint_rate)
+    if snapshot_fn:
+        print "-- snapshot_fn = {}".format(snapshot_fn)
+        if snapshot_at:
+            print "-- snapshot_at = {}".format(
+                ", ".join(str(i) for i in sorted(snapshot_at)))
+        if snapshot_trigger is not None:
+            print "-- snapshot_trigger = {}".format(snapshot_trigger.__name__)
+    if start_index > 0:
+        print "-- resuming from event {}".format(start_index)
     print
 
     start = time.time()
     execute(model,
-            log_lines,
+            events_iter,
             query_rate=query_rate,
             collect_rate=collect_rate,
-            update_rate=update_rate)
+            update_rate=update_rate,
+            progress=progress,
+            query_mode=query_mode,
+            start=start_index,
+            checkpoint_rate=checkpoint_rate if checkpoint_fn else None,
+            save_checkpoint=save_checkpoint,
+            profiler=profiler,
+            snapshot_at=snapshot_at,
+            snapshot_trigger=snapshot_trigger,
+            save_snapshot=save_snapshot)
     end = time.time()
+    if stream:
+        events.close()
     exec_time = format_time(end-start)
 
     print "\nFinished executing"
@@ -165,13 +595,47 @@ def run(model, log_fn=None, query_rate=1, collect_rate=1, update_rate=1000):
     # Get results
     results = model.get_results()
     # Need to collect information about potentially remaining objects in model.
-    get_remaining_results(model, results)
+    if result_sink is not None:
+        for obj in model.get_obj_ids():
+            result_sink.add(obj, model.get_obj_type(obj),
+                            model.get_obj_queries(obj),
+                            model.get_obj_site(obj))
+        result_sink.close()
+        results = result_sink.get_results()
+    else:
+        get_remaining_results(model, results)
 
     exec_info = {
         "log_fn": log_fn,
         "query_rate": query_rate,
+        "query_mode": query_mode,
         "collect_rate": collect_rate,
-        "exec_time": exec_time
+        "exec_time": exec_time,
+        "resumed_from": start_index,
+        "symbols": symbol_table
     }
 
+    if profiler is not None:
+        exec_info["profile"] = profiler.report()
+
+    # The results of a sink only hold the objects it keeps, the number
+    # of objects and the query stats are those of all objects, in total,
+    # per type and per allocation site
+    if result_sink is not None:
+        exec_info["objects"] = result_sink.count
+        for key, stats in [("query_stats", result_sink.query_stats),
+                           ("frozen_stats", result_sink.frozen_stats),
+                           ("type_stats", result_sink.type_stats),
+                           ("site_stats", result_sink.site_stats)]:
+            if query_sets is not None:
+                exec_info[key] = \
+                    dict((name, stats(start, end)) \
+                         for name, start, end in model.get_query_sets())
+            else:
+                exec_info[key] = stats()
+
+    if query_sets is not None:
+        exec_info["query_sets"] = sorted(query_sets)
+        results = split_results(model, results)
+
     return results, exec_info
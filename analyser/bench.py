@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+import sys
+import os
+import json
+import time
+import datetime
+import platform
+import resource
+import subprocess
+import argparse
+import analyser
+import graphmodel
+import compactmodel
+import symbols
+import tracegen
+from combinators import *
+
+# Benchmarks of the analyser, on synthetic traces from tracegen.py.
+#
+# Every configuration (backend and query options) is run on the same
+# trace, each run in a process of its own, so that the peak RSS of one
+# run isn't inherited by the next. The time of a run is split into
+# phases:
+#
+#   parse    Reading the log and splitting it into events
+#   process  Updating the model with the events
+#   query    Applying the queries
+#   collect  Running the data collectors
+#
+# The results are written to a JSON file, which a later run can be
+# compared against with --compare to find regressions.
+
+CONFIGS = [
+    {"name": "graph",
+     "backend": "graph", "compile": False, "vectorize": False,
+     "query_mode": analyser.QueryModes.FULL},
+    {"name": "graph-dirty",
+     "backend": "graph", "compile": False, "vectorize": False,
+     "query_mode": analyser.QueryModes.DIRTY},
+    {"name": "graph-compiled",
+     "backend": "graph", "compile": True, "vectorize": False,
+     "query_mode": analyser.QueryModes.DIRTY},
+    {"name": "compact-compiled",
+     "backend": "compact", "compile": True, "vectorize": False,
+     "query_mode": analyser.QueryModes.DIRTY},
+    {"name": "compact-vectorized",
+     "backend": "compact", "compile": True, "vectorize": True,
+     "query_mode": analyser.QueryModes.DIRTY},
+    # Queries after every event, regardless of the query rate
+    {"name": "compact-events",
+     "backend": "compact", "compile": True, "vectorize": False,
+     "query_mode": analyser.QueryModes.EVENTS}]
+
+# Parameters of the trace, see tracegen.TraceGenerator
+TRACE_DEFAULTS = {"events": 100000,
+                  "seed": 0,
+                  "heap_size": 1000,
+                  "hub_count": 10,
+                  "hub_fan_in": 0.1,
+                  "call_depth": 20,
+                  "dealloc_rate": 1.0}
+
+
+def query_factories():
+    # The same queries as test.py
+    unaliased = lambda m, o: \
+                Observe("Object is unaliased",
+                        lambda: m.in_total_refs(o) <= 1)
+    is_builtin = lambda m, o: \
+                 Observe("Object is built-in",
+                         lambda: m.is_builtin(o))
+    le4_incs = lambda m, o: \
+               Observe("Object has <= 4 incoming references",
+                       lambda: m.in_total_refs(o) <= 4)
+
+    always_unaliased = lambda m, o: Always(unaliased(m, o))
+    custom_obj = lambda m, o: Immediately(Not(is_builtin(m, o)))
+    custom_le4_inc_refs = lambda m, o: All([custom_obj(m, o),
+                                            Always(le4_incs(m, o))])
+
+    return [always_unaliased, custom_obj, custom_le4_inc_refs]
+
+
+def in_refs(model):
+    inc_refs = [model.in_total_refs(o) for o in model.get_obj_ids()]
+    if not inc_refs:
+        return 0, 0, 0.0
+    return min(inc_refs), max(inc_refs), sum(inc_refs)/float(len(inc_refs))
+
+
+def builtin_count(model):
+    return sum(1 for o in model.get_obj_ids() if model.is_builtin(o))
+
+
+def make_model(config):
+    data_collectors = [(os.devnull, in_refs, str),
+                       (os.devnull, builtin_count, str)]
+    if config["backend"] == "compact":
+        return compactmodel.CompactModel(query_factories(), data_collectors,
+                                         compile_queries=config["compile"],
+                                         vectorize_queries=\
+                                             config["vectorize"])
+    return graphmodel.GraphModel(query_factories(), data_collectors,
+                                 compile_queries=config["compile"])
+
+
+def timed(timings, phase, func):
+    def call(*args):
+        start = time.time()
+        result = func(*args)
+        timings[phase] += time.time() - start
+        return result
+    return call
+
+
+def timed_events(stats, events):
+    """
+    Iterate over the events, adding the time spent reading each of them
+    to stats["time"] and counting them in stats["count"].
+    """
+    clock = time.time
+    it = iter(events)
+    while True:
+        start = clock()
+        try:
+            event = next(it)
+        except StopIteration:
+            stats["time"] += clock() - start
+            return
+        stats["time"] += clock() - start
+        stats["count"] += 1
+        yield event
+
+
+def run_benchmark(config, trace_fn, query_rate, collect_rate):
+    """
+    Run a single configuration on a trace, returning the time of each
+    phase and the peak RSS of the process.
+    """
+    # The events are streamed, not to count a list of the whole trace in
+    # the peak RSS, and the time spent reading them is the parse phase
+    stream = {"time": 0.0, "count": 0}
+    start = time.time()
+    log = analyser.LogStream(trace_fn, int_tokens=True)
+    events = timed_events(stream,
+                          analyser.intern_events(log, symbols.SymbolTable()))
+    stream["time"] += time.time() - start
+
+    model = make_model(config)
+    timings = {"query": 0.0, "collect": 0.0}
+    model.apply_queries = timed(timings, "query", model.apply_queries)
+    model.collect_data = timed(timings, "collect", model.collect_data)
+
+    # execute() reports its progress on stdout
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    start = time.time()
+    analyser.execute(model, events,
+                     query_rate=query_rate,
+                     collect_rate=collect_rate,
+                     update_rate=sys.maxint,
+                     progress=log.progress,
+                     query_mode=config["query_mode"])
+    model.get_results()
+    exec_time = time.time() - start
+    log.close()
+    sys.stdout.close()
+    sys.stdout = stdout
+
+    phases = {"parse": stream["time"],
+              "process": exec_time - stream["time"] - timings["query"] -
+                         timings["collect"],
+              "query": timings["query"],
+              "collect": timings["collect"]}
+    return {"name": config["name"],
+            "config": config,
+            "events": stream["count"],
+            "phases": phases,
+            "events_per_sec": stream["count"] /
+                              (exec_time - stream["time"]),
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF) \
+                                   .ru_maxrss}
+
+
+def trace_file(trace_dir, params):
+    name = "trace-{events}-{seed}-{heap_size}-{hub_count}-{hub_fan_in}-" \
+           "{call_depth}-{dealloc_rate}.bin".format(**params)
+    trace_fn = os.path.join(trace_dir, name)
+    if not os.path.isfile(trace_fn):
+        print "Generating trace {}...".format(trace_fn)
+        gen_params = dict(params)
+        count = gen_params.pop("events")
+        tracegen.generate(trace_fn, count, binary=True, **gen_params)
+    return trace_fn
+
+
+def run_in_process(config, trace_fn, query_rate, collect_rate):
+    worker_args = json.dumps({"config": config,
+                              "trace_fn": trace_fn,
+                              "query_rate": query_rate,
+                              "collect_rate": collect_rate})
+    out = subprocess.check_output([sys.executable,
+                                   os.path.abspath(__file__),
+                                   "--worker", worker_args])
+    return json.loads(out.splitlines()[-1])
+
+
+def git_revision():
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(configs, trace_params, trace_dir, query_rate=100,
+                   collect_rate=100, repeat=1):
+    """
+    Run the configurations on the trace given by trace_params, which is
+    generated in trace_dir unless it's already there. Of the repeated
+    runs of a configuration, the fastest one is kept.
+    """
+    trace_fn = trace_file(trace_dir, trace_params)
+    results = []
+    for config in configs:
+        print "Running {}...".format(config["name"])
+        runs = [run_in_process(config, trace_fn, query_rate, collect_rate) \
+                for _ in xrange(repeat)]
+        best = max(runs, key=lambda r: r["events_per_sec"])
+        best["peak_rss_kb"] = max(r["peak_rss_kb"] for r in runs)
+        results.append(best)
+    return {"created": datetime.datetime.now().isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "trace": trace_params,
+            "query_rate": query_rate,
+            "collect_rate": collect_rate,
+            "repeat": repeat,
+            "results": results}
+
+
+def print_results(bench):
+    print "\n{: <20} {: >10} {: >10} {: >8} {: >8} {: >8} {: >8}" \
+          .format("benchmark", "events/s", "rss (MB)",
+                  "parse", "process", "query", "collect")
+    for r in bench["results"]:
+        p = r["phases"]
+        print "{: <20} {: >10.0f} {: >10.1f} {: >8.2f} {: >8.2f} " \
+              "{: >8.2f} {: >8.2f}" \
+              .format(r["name"], r["events_per_sec"],
+                      r["peak_rss_kb"] / 1024.0,
+                      p["parse"], p["process"], p["query"], p["collect"])
+
+
+def compare(bench, baseline, threshold):
+    """
+    Print the change of each benchmark against the baseline, and return
+    the names of those that are slower or use more memory by more than
+    the threshold (a fraction).
+    """
+    if baseline["trace"] != bench["trace"]:
+        print "\nWARNING: Baseline was run on a different trace"
+    base = dict((r["name"], r) for r in baseline["results"])
+    regressions = []
+    print "\n{: <20} {: >10} {: >10}".format("vs baseline", "speed", "rss")
+    for r in bench["results"]:
+        b = base.get(r["name"])
+        if b is None:
+            continue
+        speed = r["events_per_sec"] / b["events_per_sec"] - 1
+        rss = r["peak_rss_kb"] / float(b["peak_rss_kb"]) - 1
+        regressed = speed < -threshold or rss > threshold
+        print "{: <20} {: >+9.1f}% {: >+9.1f}%{}" \
+              .format(r["name"], speed * 100, rss * 100,
+                      "  REGRESSION" if regressed else "")
+        if regressed:
+            regressions.append(r["name"])
+    return regressions
+
+
+def parse_args():
+    prog_desc = ("Benchmark the analyser on a synthetic trace.")
+    out_help = ("The JSON file to write the results to. Default is "
+                "../data/bench/bench-<time>.json.")
+    cmp_help = ("A JSON file of earlier results to compare against.")
+    th_help = ("Relative slowdown or memory growth reported as a "
+               "regression. Default is 0.1.")
+    cfg_help = ("Names of the configurations to run, out of {}. "
+                "Default is all of them." \
+                .format(", ".join(c["name"] for c in CONFIGS)))
+    qr_help = ("The query rate. Default is 100.")
+    cr_help = ("The collect rate. Default is 100.")
+    rp_help = ("Number of runs of each configuration, the fastest is "
+               "kept. Default is 1.")
+    td_help = ("Directory of the generated traces. Default is "
+               "../data/bench.")
+
+    parser = argparse.ArgumentParser(prog="bench", description=prog_desc)
+    parser.add_argument("-o", "--output", help=out_help, default=None)
+    parser.add_argument("-c", "--compare", help=cmp_help, default=None)
+    parser.add_argument("-t", "--threshold",
+                        help=th_help, type=float, default=0.1)
+    parser.add_argument("--configs", help=cfg_help, nargs="+",
+                        choices=[c["name"] for c in CONFIGS], default=None)
+    parser.add_argument("-q", "--qrate", help=qr_help, type=int, default=100)
+    parser.add_argument("--crate", help=cr_help, type=int, default=100)
+    parser.add_argument("-r", "--repeat", help=rp_help, type=int, default=1)
+    parser.add_argument("--tracedir", help=td_help, default="../data/bench")
+    for param, default in sorted(TRACE_DEFAULTS.items()):
+        parser.add_argument("--" + param.replace("_", ""),
+                            dest=param, type=type(default), default=default,
+                            help=("Trace parameter, see tracegen.py. "
+                                  "Default is {}.".format(default)))
+    parser.add_argument("--worker", help=argparse.SUPPRESS, default=None)
+
+    args = parser.parse_args()
+
+    if args.compare is not None and not os.path.isfile(args.compare):
+        parser.error("'{}' is not a file.".format(args.compare))
+
+    configs = CONFIGS if args.configs is None else \
+              [c for c in CONFIGS if c["name"] in args.configs]
+    trace_params = dict((param, getattr(args, param)) \
+                        for param in TRACE_DEFAULTS)
+
+    return args, configs, trace_params
+
+
+def main():
+    args, configs, trace_params = parse_args()
+
+    if args.worker is not None:
+        worker_args = json.loads(args.worker)
+        print json.dumps(run_benchmark(worker_args["config"],
+                                       worker_args["trace_fn"],
+                                       worker_args["query_rate"],
+                                       worker_args["collect_rate"]))
+        return
+
+    if not os.path.isdir(args.tracedir):
+        os.makedirs(args.tracedir)
+    bench = run_benchmarks(configs, trace_params, args.tracedir,
+                           query_rate=args.qrate,
+                           collect_rate=args.crate,
+                           repeat=args.repeat)
+    print_results(bench)
+
+    out_fn = args.output
+    if out_fn is None:
+        now = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        out_fn = os.path.join(args.tracedir, "bench-{}.json".format(now))
+    with open(out_fn, "w") as out_file:
+        json.dump(bench, out_file, indent=2, sort_keys=True)
+    print "\nResults written to", out_fn
+
+    if args.compare is not None:
+        with open(args.compare) as base_file:
+            baseline = json.load(base_file)
+        if compare(bench, baseline, args.threshold):
+            sys.exit(1)
+
+
+
+if __name__ == "__main__":
+    main()
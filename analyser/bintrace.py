@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+import mmap
+import argparse
+import os
+
+# A compact binary format for the logs of the agent, and a converter
+# from the text format.
+#
+# The file starts with the magic number "JAAT" and a version byte. It is
+# followed by a sequence of records, each starting with an opcode byte:
+#
+#   0 length bytes      Definition of the next string in the string table
+#   1-7 count tokens    An event, with the opcode of the event
+#
+# length, count and the tokens are unsigned LEB128 varints. A token
+# with the lowest bit cleared is a decimal integer in the text log (an
+# object ID or 0), shifted left by one. A token with the lowest bit set
+# is the index into the string table, shifted left by one, of any other
+# token, such as a method, field, type or class name. A string is always
+# defined before the first record using it, so the file can be written
+# and read in a single pass.
+#
+# Reading a binary trace skips decoding, stripping and splitting lines,
+# and the file is mapped into memory instead of being read into it.
+
+MAGIC = "JAAT"
+VERSION = 1
+HEADER = MAGIC + chr(VERSION)
+
+STRING = 0
+
+# The first line of the agent's output is binary garbage, and should be
+# replaced with this line (see scripts/get_output.sh)
+FIXED_HEADER_EVENT = "4 <clinit> - sun/launcher/LauncherHelper".split(" ")
+
+# Size of the chunks of the mapped file decoded at a time
+CHUNK_SIZE = 1 << 20
+
+
+def is_binary_trace(log_fn):
+    with open(log_fn, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def encode_varint(n):
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+
+def decode_varint(buf, i):
+    # Return the varint starting at index i of buf, which is a str or a
+    # mapped file, and the index following it
+    n = shift = 0
+    while True:
+        b = ord(buf[i])
+        i += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, i
+        shift += 7
+
+
+def is_int_token(token):
+    # Only tokens that survive the round trip through int() unchanged
+    return token.isdigit() and (token == "0" or token[0] != "0")
+
+
+class TraceWriter(object):
+
+    def __init__(self, out_file):
+        self._out = out_file
+        self._strings = {}
+        self._out.write(HEADER)
+
+    def _token(self, token):
+        if is_int_token(token):
+            return int(token) << 1
+        index = self._strings.get(token)
+        if index is None:
+            index = len(self._strings)
+            self._strings[token] = index
+            self._out.write(chr(STRING) + encode_varint(len(token)) + token)
+        return (index << 1) | 1
+
+    def write_event(self, event):
+        opcode = int(event[0])
+        if not 0 < opcode < 0x80:
+            raise Exception("write_event: "
+                            "Opcode {0} can't be encoded" \
+                            .format(event[0]))
+        tokens = [self._token(token) for token in event[1:]]
+        record = bytearray([opcode]) + encode_varint(len(tokens))
+        for token in tokens:
+            record += encode_varint(token)
+        self._out.write(record)
+
+
+class TraceReader(object):
+    """
+    Iterate over the events of a binary trace, each event being a list
+    of tokens like the split lines of the text log. Progress is given
+    by the number of bytes of the trace decoded so far. With int_tokens,
+    the integer tokens are ints instead of their decimal strings.
+    """
+
+    def __init__(self, log_fn, int_tokens=False):
+        self.int_tokens = int_tokens
+        self._file = open(log_fn, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(HEADER)] != HEADER:
+            raise Exception("TraceReader: "
+                            "{0} is not a binary trace of version {1}" \
+                            .format(log_fn, VERSION))
+        self.total_bytes = len(self._mm)
+        self.position = len(HEADER)
+        self.strings = []
+
+    def __iter__(self):
+        mm, strings, size = self._mm, self.strings, self.total_bytes
+        opcodes = [str(op) for op in range(0x80)]
+        integer = int if self.int_tokens else str
+        start = self.position
+        buf = bytearray(mm[start:start + CHUNK_SIZE])
+        i = 0
+        while start + i < size:
+            record = i
+            try:
+                op = buf[i]
+                i += 1
+                # Inlined varint decoding
+                n = buf[i]
+                i += 1
+                if n >= 0x80:
+                    n &= 0x7f
+                    shift = 7
+                    while True:
+                        b = buf[i]
+                        i += 1
+                        n |= (b & 0x7f) << shift
+                        if b < 0x80:
+                            break
+                        shift += 7
+                if op == STRING:
+                    if i + n > len(buf):
+                        raise IndexError()
+                    strings.append(str(buf[i:i + n]))
+                    i += n
+                    continue
+                event = [opcodes[op]]
+                for _ in xrange(n):
+                    v = buf[i]
+                    i += 1
+                    if v >= 0x80:
+                        v &= 0x7f
+                        shift = 7
+                        while True:
+                            b = buf[i]
+                            i += 1
+                            v |= (b & 0x7f) << shift
+                            if b < 0x80:
+                                break
+                            shift += 7
+                    event.append(strings[v >> 1] if v & 1 else integer(v >> 1))
+            except IndexError:
+                # The record continues past the end of the chunk, decode it
+                # again from the next chunk
+                if start + len(buf) >= size:
+                    raise Exception("TraceReader: "
+                                    "Truncated record at byte {0}" \
+                                    .format(start + record))
+                start += record
+                buf = bytearray(mm[start:start + max(CHUNK_SIZE, 2 * len(buf))])
+                i = 0
+                continue
+            self.position = start + i
+            yield event
+
+    def seek(self, offset):
+        """
+        Continue decoding from the offset of a record, given by position.
+        The string table is rebuilt from the string records before it.
+        """
+        mm = self._mm
+        del self.strings[:]
+        i = len(HEADER)
+        while i < offset:
+            op = ord(mm[i])
+            n, i = decode_varint(mm, i + 1)
+            if op == STRING:
+                self.strings.append(mm[i:i + n])
+                i += n
+                continue
+            for _ in xrange(n):
+                _, i = decode_varint(mm, i)
+        if i != offset:
+            raise Exception("seek: "
+                            "Offset {0} is not the start of a record" \
+                            .format(offset))
+        self.position = offset
+
+    def progress(self, i):
+        return self.position / float(self.total_bytes)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def convert(log_fn, out_fn, fix_header=False):
+    """
+    Convert a text log, possibly compressed, into a binary trace. With
+    fix_header, the first line of the log is replaced like in
+    scripts/get_output.sh.
+    """
+    import analyser
+    log = analyser.LogStream(log_fn)
+    with open(out_fn, "wb") as out_file:
+        writer = TraceWriter(out_file)
+        for i, event in enumerate(log):
+            if fix_header and i == 0:
+                writer.write_event(FIXED_HEADER_EVENT)
+                continue
+            if event == [""]:
+                continue
+            writer.write_event(event)
+    log.close()
+
+
+def parse_args():
+    prog_desc = ("Convert a text log into a binary trace.")
+    in_help = ("The text log, possibly compressed with gzip or zstd.")
+    out_help = ("The binary trace to write.")
+    fh_help = ("Replace the first (binary) line of the raw agent output, "
+               "like scripts/get_output.sh.")
+
+    parser = argparse.ArgumentParser(prog="bintrace", description=prog_desc)
+    parser.add_argument("logfile", help=in_help)
+    parser.add_argument("outfile", help=out_help)
+    parser.add_argument("-f", "--fixheader",
+                        help=fh_help, action="store_true")
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.logfile):
+        parser.error("'{}' is not a file.".format(args.logfile))
+
+    return args.logfile, args.outfile, args.fixheader
+
+
+def main():
+    log_fn, out_fn, fix_header = parse_args()
+    print "\nConverting..."
+    convert(log_fn, out_fn, fix_header)
+    print "Done"
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+# The method calls of the traced program, for scoping the stack
+# references of the model per call (see Model.get_call_stack).
+#
+# Without it, an MCALL event adds a stack reference from the method
+# owner to each argument, and the MEXIT event removes a stack reference
+# from the method owner to each object going out of scope, if there is
+# one. Several calls with the same owner on the stack, e.g. recursive
+# ones, share these counters, the objects going out of scope aren't
+# always the arguments, and the owner of an exit is sometimes that of
+# the calling method instead (see notes/objectives.org, METHOD CALL),
+# and every exit looks up each of its objects in the model.
+#
+# A CallStack instead keeps a frame per call, holding the stack
+# references added by the call, and by the variable stores of the
+# method owner while the call is on top. When the call exits, its frame
+# is popped and all its references are removed at once.
+#
+# The log has no thread IDs, so there is a single stack for the whole
+# trace. An exit is matched with its call by the method name and the
+# caller, which both events have. The frames above it, of calls that
+# never exited, e.g. when an exception unwound them, are popped along
+# with it. An exit without a matching frame changes nothing, which is
+# left to the caller of exit to handle.
+
+
+class Frame(object):
+    __slots__ = ("method", "caller", "owner", "refs")
+
+    def __init__(self, method, caller, owner):
+        self.method = method
+        self.caller = caller
+        self.owner = owner
+        # Referee -> number of stack references from the owner
+        self.refs = {}
+
+
+class CallStack(object):
+
+    def __init__(self):
+        self.frames = []
+
+    def __len__(self):
+        return len(self.frames)
+
+    def call(self, model, method, caller, owner, arg_ids):
+        """
+        Push a frame for a call, and add a stack reference from the
+        owner to each argument, adding the arguments that don't exist.
+        """
+        frame = Frame(method, caller, owner)
+        refs = frame.refs
+        for arg_id in arg_ids:
+            model.ensure_and_add_stack_ref(owner, arg_id)
+            refs[arg_id] = refs.get(arg_id, 0) + 1
+        self.frames.append(frame)
+
+    def exit(self, model, method, caller):
+        """
+        Pop the frame of the call exited, and those above it, removing
+        their stack references. Return False if no frame matches.
+        """
+        frames = self.frames
+        i = len(frames) - 1
+        while i >= 0 and (frames[i].method != method or
+                          frames[i].caller != caller):
+            i -= 1
+        if i < 0:
+            return False
+        has_obj = model.has_obj
+        remove = model.remove_stack_ref_if_present
+        while len(frames) > i:
+            frame = frames.pop()
+            owner = frame.owner
+            # The objects of the frame may have been deallocated since
+            if not frame.refs or not has_obj(owner):
+                continue
+            for referee_id, count in frame.refs.iteritems():
+                if has_obj(referee_id):
+                    while count and remove(owner, referee_id):
+                        count -= 1
+        return True
+
+    def store(self, model, caller, stored_id, old_id):
+        """
+        Move a stack reference of a variable store from the old to the
+        stored object, counting it in the frame on top if the caller is
+        its owner.
+        """
+        frame = self.frames[-1] if self.frames else None
+        refs = frame.refs if frame is not None and frame.owner == caller \
+               else None
+        if old_id != 0 and \
+           model.remove_stack_ref_if_present(caller, old_id) and \
+           refs is not None:
+            count = refs.get(old_id, 0)
+            if count > 1:
+                refs[old_id] = count - 1
+            elif count == 1:
+                del refs[old_id]
+        if stored_id != 0:
+            model.add_stack_ref(caller, stored_id)
+            if refs is not None:
+                refs[stored_id] = refs.get(stored_id, 0) + 1
+
+    def save_state(self):
+        return [(frame.method, frame.caller, frame.owner, frame.refs.items())
+                for frame in self.frames]
+
+    def load_state(self, saved):
+        self.frames = []
+        for method, caller, owner, refs in saved:
+            frame = Frame(method, caller, owner)
+            frame.refs = dict(refs)
+            self.frames.append(frame)
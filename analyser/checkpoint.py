@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+import cPickle
+import gzip
+import os
+
+# Checkpoints of an execution, saved to disk to be able to resume it.
+#
+# A checkpoint holds the state of the model (see Model.save_state),
+# along with the index of the next event to process and its offset in
+# the log, the names used as object IDs (see symbols.py), and the state
+# of the result sink if there is one (see results.py). It is pickled
+# and compressed with gzip, and written to a temporary file first, so
+# that a crash while saving never leaves a broken checkpoint behind.
+
+VERSION = 4
+
+
+def save(checkpoint_fn, model, index, offset, log_fn, result_sink=None,
+         symbol_table=None):
+    checkpoint = {"version": VERSION,
+                  "index": index,
+                  "offset": offset,
+                  "log_fn": log_fn,
+                  "model": model.save_state(),
+                  "symbols": symbol_table.save_state() \
+                             if symbol_table is not None else [],
+                  "sink": result_sink.save_state() \
+                          if result_sink is not None else None}
+    tmp_fn = checkpoint_fn + ".tmp"
+    with gzip.open(tmp_fn, "wb", compresslevel=1) as f:
+        cPickle.dump(checkpoint, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_fn, checkpoint_fn)
+
+
+def load(checkpoint_fn):
+    if not os.path.isfile(checkpoint_fn):
+        raise Exception("CHECKPOINT FILE {} DOESN'T EXIST" \
+                        .format(checkpoint_fn))
+    with gzip.open(checkpoint_fn, "rb") as f:
+        checkpoint = cPickle.load(f)
+    if checkpoint["version"] != VERSION:
+        raise Exception("CHECKPOINT FILE {} HAS VERSION {}, EXPECTED {}" \
+                        .format(checkpoint_fn, checkpoint["version"], VERSION))
+    return checkpoint
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+import os
+import numpy as np
+
+# Columnar output of data collectors.
+#
+# A data collector given None as the function converting its data to a
+# string (see Model.add_data_collectors) is saved to a ColumnFile: each
+# collection is a row of the progress and the numbers returned by the
+# collecting function, buffered and written as a typed array in chunks
+# of chunk_size rows. A chunk is a .npy array appended to the file, so
+# the file is a sequence of arrays read back with read_columns.
+#
+# The type of the rows is a structured dtype taken from the first row,
+# a column "progress" and columns "c0", "c1", ... of integers or floats
+# depending on the collected numbers. When writing to the file resumes
+# (see reopen), the type of the chunks already written is kept.
+#
+# The files of data collectors, and the rows of a result sink (see
+# results.py), are OutputFiles, only opened when first written. The
+# model is created before run knows whether it resumes from a
+# checkpoint, and opening the files right away would truncate the
+# output that the checkpoint continues.
+
+
+class OutputFile(object):
+    """
+    A file written from the start, truncating it when first written,
+    or from an offset when resuming (see reopen).
+    """
+
+    mode = "w+"
+
+    def __init__(self, fn):
+        self.name = fn
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.name, self.mode)
+        return self._file
+
+    def write(self, data):
+        self._open().write(data)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def tell(self):
+        """
+        Write the buffered data and return the offset after it.
+        """
+        self.flush()
+        return self._open().tell()
+
+    def reopen(self, offset):
+        """
+        Continue writing at offset, returned by tell, dropping the data
+        written after it. The data before it is kept, even if the file
+        was written by another process.
+        """
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.name, self.mode.replace("w", "r"))
+        size = os.fstat(self._file.fileno()).st_size
+        if size < offset:
+            self._file.close()
+            raise Exception("reopen: "
+                            "File {0} has {1} bytes, expected at least {2}" \
+                            .format(self.name, size, offset))
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def close(self):
+        # A file never written is still truncated
+        f = self._open()
+        if not f.closed:
+            self.flush()
+            f.close()
+
+
+class ColumnFile(OutputFile):
+
+    mode = "w+b"
+
+    def __init__(self, fn, chunk_size=4096):
+        OutputFile.__init__(self, fn)
+        self.chunk_size = chunk_size
+        self._dtype = None
+        self._rows = []
+
+    def append(self, progress, values):
+        """
+        Buffer a row of the progress and values, a number or a tuple of
+        numbers.
+        """
+        if not isinstance(values, tuple):
+            values = (values,)
+        rows = self._rows
+        rows.append((progress,) + values)
+        if len(rows) == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        # The rows are only converted to a typed array here, appending a
+        # tuple to a list being much cheaper than setting an array row
+        if self._rows:
+            if self._dtype is None:
+                self._dtype = row_dtype(self._rows[0][1:])
+            np.save(self._open(), np.array(self._rows, self._dtype))
+            self._rows = []
+        OutputFile.flush(self)
+
+    def reopen(self, offset):
+        """
+        Continue writing at offset, returned by tell, dropping the chunks
+        written after it.
+        """
+        self._rows = []
+        OutputFile.reopen(self, offset)
+        self._dtype = None
+        if offset > 0:
+            self._file.seek(0)
+            self._dtype = np.load(self._file).dtype
+            self._file.seek(offset)
+
+
+def row_dtype(values):
+    return np.dtype([("progress", np.float64)] +
+                    [("c{0}".format(i),
+                      np.int64 if isinstance(x, (bool, int, long, np.integer))
+                      else np.float64) \
+                     for i, x in enumerate(values)])
+
+
+def open_collector(fn, to_str):
+    """
+    Open the file of a data collector, a ColumnFile if to_str is None.
+    """
+    if to_str is None:
+        return ColumnFile(fn)
+    return OutputFile(fn)
+
+
+def reopen_collector(save_file, offset):
+    """
+    Continue writing the file of a data collector at offset, returning
+    the reopened file.
+    """
+    save_file.reopen(offset)
+    return save_file
+
+
+def read_columns(fn):
+    """
+    Read the chunks of a ColumnFile into a single structured array, or
+    None if nothing was collected.
+    """
+    chunks = []
+    with open(fn, "rb") as col_file:
+        size = os.fstat(col_file.fileno()).st_size
+        while col_file.tell() < size:
+            chunks.append(np.load(col_file))
+    if not chunks:
+        return None
+    return np.concatenate(chunks)
+
+
+def downsample(column, points, how=np.mean):
+    """
+    Reduce a column to at most points values, each reducing one of as
+    many equal parts of the column with np.mean, np.min or np.max.
+    """
+    if len(column) <= points:
+        return np.asarray(column, np.float64)
+    bounds = np.linspace(0, len(column), points + 1).astype(np.int64)[:-1]
+    if how is np.min:
+        return np.minimum.reduceat(column, bounds).astype(np.float64)
+    if how is np.max:
+        return np.maximum.reduceat(column, bounds).astype(np.float64)
+    sums = np.add.reduceat(np.asarray(column, np.float64), bounds)
+    return sums / np.diff(np.append(bounds, len(column)))
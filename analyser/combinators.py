@@ -71,6 +71,11 @@ class Observe(query.Query):
     def toString(self):
         return self.name
 
+    def getState(self):
+        return self.state
+    def setState(self, state):
+        self.state = state
+
 
 class Not(query.Query):
     def __init__(self, q):
@@ -85,6 +90,10 @@ class Not(query.Query):
         return Not(self.q.clone())
     def toString(self):
         return "Not({0})".format(self.q.toString())
+    def getState(self):
+        return self.q.getState()
+    def setState(self, state):
+        self.q.setState(state)
 
 
 class Ever(query.Query):
@@ -105,6 +114,11 @@ class Ever(query.Query):
         return c
     def toString(self):
         return "Ever({0})".format(self.q.toString())
+    def getState(self):
+        return (self.success, self.q.getState())
+    def setState(self, state):
+        self.success, q_state = state
+        self.q.setState(q_state)
 
 
 #Always(q) == Not(Ever(Not(q)))
@@ -126,23 +140,38 @@ class Always(query.Query):
         return c
     def toString(self):
         return "Always({0})".format(self.q.toString())
+    def getState(self):
+        return (self.failure, self.q.getState())
+    def setState(self, state):
+        self.failure, q_state = state
+        self.q.setState(q_state)
 
 
 class Any(query.Query):
     def __init__(self, qs):
         self.qs = qs
+        # Positions of the remaining queries in the original list
+        self.pos = range(len(qs))
         self.str_repr = "Any([{0}])" \
             .format(", ".join([q.toString() for q in qs]))
+        # The subqueries only change when applied through this query, 
+        # so whether it's frozen is only computed after applying them
+        self.frozen = self._frozen()
     def apply(self):
-        if self.isFrozen(): return
-        map(lambda q: q.apply(), self.qs)
+        if self.frozen: return
+        for q in self.qs:
+            q.apply()
         #removing any query frozen in a non-accepting state
-        self.qs = filter(lambda q: q.isAccepting() or 
-                                   not q.isFrozen(), 
-                         self.qs)
+        keep = [i for i, q in enumerate(self.qs)
+                if q.isAccepting() or not q.isFrozen()]
+        self.qs = [self.qs[i] for i in keep]
+        self.pos = [self.pos[i] for i in keep]
+        self.frozen = self._frozen()
     def isAccepting(self):
         return any(map(lambda q: q.isAccepting(), self.qs))
     def isFrozen(self):
+        return self.frozen
+    def _frozen(self):
         any_succ = any(map(lambda q: q.isFrozen() and 
                                      q.isAccepting(), 
                            self.qs))
@@ -151,26 +180,47 @@ class Any(query.Query):
                            self.qs))
         return any_succ or all_fail
     def clone(self):
-        return Any(map(lambda q: q.clone(), self.qs))
+        c = Any(map(lambda q: q.clone(), self.qs))
+        c.pos = list(self.pos)
+        c.str_repr = self.str_repr
+        return c
     def toString(self):
         return self.str_repr
+    def getState(self):
+        return [(p, q.getState()) for p, q in zip(self.pos, self.qs)]
+    def setState(self, state):
+        # Called on a query with all of the original subqueries
+        self.qs = [self.qs[p] for p, _ in state]
+        self.pos = [p for p, _ in state]
+        for q, (_, q_state) in zip(self.qs, state):
+            q.setState(q_state)
+        self.frozen = self._frozen()
 
 
 class All(query.Query):
     def __init__(self, qs):
         self.qs = qs
+        # Positions of the remaining queries in the original list
+        self.pos = range(len(qs))
         self.str_repr = "All([{0}])" \
             .format(", ".join([q.toString() for q in qs]))
+        # As in Any
+        self.frozen = self._frozen()
     def apply(self):
-        if self.isFrozen(): return
-        map(lambda q: q.apply(), self.qs)
+        if self.frozen: return
+        for q in self.qs:
+            q.apply()
         # Removing any query frozen in an accepting state
-        self.qs = filter(lambda q: not q.isAccepting() or \
-                                   not q.isFrozen(), 
-                         self.qs)
+        keep = [i for i, q in enumerate(self.qs)
+                if not q.isAccepting() or not q.isFrozen()]
+        self.qs = [self.qs[i] for i in keep]
+        self.pos = [self.pos[i] for i in keep]
+        self.frozen = self._frozen()
     def isAccepting(self):
         return all(map(lambda q: q.isAccepting(), self.qs))
     def isFrozen(self):
+        return self.frozen
+    def _frozen(self):
         any_fail = any(map(lambda q: q.isFrozen() and 
                                      not q.isAccepting(), 
                            self.qs))
@@ -179,9 +229,21 @@ class All(query.Query):
                            self.qs))
         return any_fail or all_succ
     def clone(self):
-        return All(map(lambda q: q.clone(), self.qs))
+        c = All(map(lambda q: q.clone(), self.qs))
+        c.pos = list(self.pos)
+        c.str_repr = self.str_repr
+        return c
     def toString(self):
         return self.str_repr
+    def getState(self):
+        return [(p, q.getState()) for p, q in zip(self.pos, self.qs)]
+    def setState(self, state):
+        # Called on a query with all of the original subqueries
+        self.qs = [self.qs[p] for p, _ in state]
+        self.pos = [p for p, _ in state]
+        for q, (_, q_state) in zip(self.qs, state):
+            q.setState(q_state)
+        self.frozen = self._frozen()
 
 
 class Immediately(query.Query):
@@ -202,3 +264,8 @@ class Immediately(query.Query):
         return c
     def toString(self):
         return "Immediately({0})".format(self.q.toString())
+    def getState(self):
+        return (self.done, self.q.getState())
+    def setState(self, state):
+        self.done, q_state = state
+        self.q.setState(q_state)
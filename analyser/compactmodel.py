@@ -0,0 +1,732 @@
+#!/usr/bin/env python
+import model
+import querycompiler
+import columns
+import vectorized
+import numpy as np
+from aggregates import Aggregates
+from callstack import CallStack
+from typetable import TypeTable, BUILTIN_PREFIXES
+
+# Implementation of model using integer-indexed arrays instead of a graph.
+#
+# Object IDs are interned to dense slot indices. Types, interned in a
+# TypeTable (see typetable.py), and reference counters are kept in
+# NumPy arrays indexed by slot, edges in a dict keyed by the packed slot
+# pair, holding the packed stack and heap counts. Adjacency sets, needed
+# to drop the edges of a forcibly removed object, are only allocated for
+# objects that have edges.
+# Slots of removed objects are reused by later objects.
+#
+# Memory per live object (Python 2.7, 64-bit, measured with RSS over
+# 10^6 objects with one heap reference each and no queries):
+#   GraphModel   ~2190 bytes
+#   CompactModel  ~820 bytes
+# Most of what remains in CompactModel is the dict entries for the
+# object ID and the edge, and the two adjacency sets. The queries of an
+# object cost the same in both backends.
+#
+# With vectorize_queries=True, the query factories are compiled into a
+# program whose conditions are evaluated on the columns of all objects
+# of a query pass at once (see vectorized.py). The query states are then
+# kept as rows of a matrix instead of per object.
+#
+# With call_frames=True, the stack references of method calls are kept
+# per call frame, as in GraphModel (see callstack.py).
+
+
+def add_at(column, i, n):
+    # Much faster than column[i] += n, which goes through a NumPy scalar
+    # and a cast back to the type of the column
+    column.itemset(i, column.item(i) + n)
+
+
+class CompactModel(model.Model):
+    # Can't use ref_dealloc=True as of now, see GraphModel.
+    def __init__(self, qry_fs, data_collectors=[], ref_dealloc=False,
+                 compile_queries=False, vectorize_queries=False,
+                 aggregates=False, builtin_prefixes=BUILTIN_PREFIXES,
+                 capacity=1024, call_frames=False):
+        self._agg = Aggregates() if aggregates else None
+        self._call_stack = CallStack() if call_frames else None
+        self._compile_queries = compile_queries
+        self._vectorize_queries = vectorize_queries
+        self._capacity = capacity
+        self.set_query_sets([(None, qry_fs)])
+        self.data_collectors = []
+        self.add_data_collectors(data_collectors)
+        self.ref_dealloc = False
+        self.results = {}
+        self.result_sink = None
+        self._dirty = set()
+        # Objects with queries that aren't frozen yet, as in GraphModel
+        self._active = set()
+        self.set_query_deps(querycompiler.ALL_DEPS)
+        # Interned object IDs
+        self._slots = {}
+        self._ids = []
+        self._free = []
+        # Interned type names
+        self._types = TypeTable(builtin_prefixes)
+        # Columns indexed by slot
+        self._type = np.zeros(capacity, dtype=np.int32)
+        # Allocation sites, interned as types
+        self._site = np.zeros(capacity, dtype=np.int32)
+        self._in_stack = np.zeros(capacity, dtype=np.int32)
+        self._in_heap = np.zeros(capacity, dtype=np.int32)
+        self._out_stack = np.zeros(capacity, dtype=np.int32)
+        self._out_heap = np.zeros(capacity, dtype=np.int32)
+        self._queries = []
+        # Edges, (referrer slot, referee slot) -> (stack, heap), both
+        # packed into a single integer
+        self._edges = {}
+        self._succ = []
+        self._pred = []
+
+    def _init_program(self):
+        self._program = None
+        self._qstate = None
+        if self._vectorize_queries:
+            self._program = vectorized.VectorProgram(self, self.qry_fs)
+            self._qstate = np.zeros((self._capacity, len(self._program.ops)),
+                                    dtype=np.uint8)
+            self._initial_qstate = np.frombuffer(
+                bytes(self._program.new_state()), dtype=np.uint8)
+        elif self._compile_queries:
+            self._program = querycompiler.Program(self, self.qry_fs)
+
+    def _slot(self, obj_id, func, role="Object"):
+        slot = self._slots.get(obj_id)
+        if slot is None:
+            raise Exception("{0}: {1} {2} doesn't exist" \
+                            .format(func, role, obj_id))
+        return slot
+
+    def _grow(self):
+        capacity = 2 * len(self._type)
+        for name in ["_type", "_site", "_in_stack", "_in_heap",
+                     "_out_stack", "_out_heap"]:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        if self._qstate is not None:
+            qstate = np.zeros((capacity, self._qstate.shape[1]),
+                              dtype=np.uint8)
+            qstate[:len(self._qstate)] = self._qstate
+            self._qstate = qstate
+
+    def add_obj(self, obj_id, obj_type="(unknown)", site="(unknown)"):
+        if obj_id in self._slots:
+            raise Exception("add_obj: "
+                            "Object {0} already exists" \
+                            .format(obj_id))
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = obj_id
+        else:
+            slot = len(self._ids)
+            if slot == len(self._type):
+                self._grow()
+            self._ids.append(obj_id)
+            self._queries.append(None)
+            self._succ.append(None)
+            self._pred.append(None)
+        self._slots[obj_id] = slot
+        type_id = self._types.intern(obj_type)
+        self._type[slot] = type_id
+        self._site[slot] = self._types.intern(site)
+        self._in_stack[slot] = 0
+        self._in_heap[slot] = 0
+        self._out_stack[slot] = 0
+        self._out_heap[slot] = 0
+        self._queries[slot] = self._new_queries(obj_id)
+        self._dirty.add(obj_id)
+        self._active.add(obj_id)
+        if self._agg is not None:
+            self._agg.add_obj(obj_type, self._types.builtin[type_id])
+
+    def set_obj_type(self, obj_id, obj_type):
+        slot = self._slot(obj_id, "set_obj_type")
+        type_id = self._types.intern(obj_type)
+        if self._agg is not None:
+            old_id = self._type.item(slot)
+            self._agg.set_type(self._types.names[old_id],
+                               self._types.builtin[old_id],
+                               obj_type, self._types.builtin[type_id])
+        self._type[slot] = type_id
+        if self._track_type:
+            self._dirty.add(obj_id)
+
+    def get_obj_type(self, obj_id):
+        slot = self._slot(obj_id, "get_obj_type")
+        return self._types.names[self._type.item(slot)]
+
+    def set_obj_site(self, obj_id, site):
+        slot = self._slot(obj_id, "set_obj_site")
+        self._site[slot] = self._types.intern(site)
+
+    def get_obj_site(self, obj_id):
+        slot = self._slot(obj_id, "get_obj_site")
+        return self._types.names[self._site.item(slot)]
+
+    def _add_ref(self, referrer, referee, stack, heap):
+        # Called before the counters of the referee are incremented
+        if self._agg is not None:
+            self._agg.inc_in_refs(self._in_stack.item(referee) +
+                                  self._in_heap.item(referee))
+        key = (referrer << 32) | referee
+        refs = self._edges.get(key)
+        if refs is None:
+            refs = 0
+            if self._succ[referrer] is None:
+                self._succ[referrer] = set()
+            self._succ[referrer].add(referee)
+            if self._pred[referee] is None:
+                self._pred[referee] = set()
+            self._pred[referee].add(referrer)
+        self._edges[key] = refs + (stack << 32) + heap
+
+    def _remove_edge(self, referrer, referee):
+        del self._edges[(referrer << 32) | referee]
+        self._succ[referrer].discard(referee)
+        if not self._succ[referrer]:
+            self._succ[referrer] = None
+        self._pred[referee].discard(referrer)
+        if not self._pred[referee]:
+            self._pred[referee] = None
+
+    def add_stack_ref(self, referrer_id, referee_id):
+        referrer = self._slot(referrer_id, "add_stack_ref", "Referrer object")
+        referee = self._slot(referee_id, "add_stack_ref", "Referee object")
+        self._add_ref(referrer, referee, 1, 0)
+        add_at(self._out_stack, referrer, 1)
+        add_at(self._in_stack, referee, 1)
+        if self._track_out:
+            self._dirty.add(referrer_id)
+        if self._track_in:
+            self._dirty.add(referee_id)
+
+    def add_heap_ref(self, referrer_id, referee_id):
+        referrer = self._slot(referrer_id, "add_heap_ref", "Referrer object")
+        referee = self._slot(referee_id, "add_heap_ref", "Referee object")
+        self._add_ref(referrer, referee, 0, 1)
+        add_at(self._out_heap, referrer, 1)
+        add_at(self._in_heap, referee, 1)
+        if self._track_out:
+            self._dirty.add(referrer_id)
+        if self._track_in:
+            self._dirty.add(referee_id)
+
+    def remove_obj(self, obj_id, force=False):
+        slot = self._slot(obj_id, "remove_obj")
+        if not force:
+            if self.in_total_refs(obj_id) > 0:
+                raise Exception("remove_obj: "
+                                "Object {0} has incoming references" \
+                                .format(obj_id))
+            if self.out_total_refs(obj_id) > 0:
+                raise Exception("remove_obj: "
+                                "Object {0} has outgoing references" \
+                                .format(obj_id))
+        #Save queries and remove object
+        if self.result_sink is not None:
+            self.result_sink.add(obj_id,
+                                 self._types.names[self._type.item(slot)],
+                                 self._saved_queries(obj_id, slot),
+                                 self._types.names[self._site.item(slot)])
+        else:
+            self.results[obj_id] = \
+                {"type" : self._types.names[self._type.item(slot)],
+                 "queries" : self._saved_queries(obj_id, slot)}
+        if self._agg is not None:
+            type_id = self._type.item(slot)
+            self._agg.remove_obj(self._types.names[type_id],
+                                 self._types.builtin[type_id],
+                                 self._in_stack.item(slot) +
+                                 self._in_heap.item(slot))
+        # Forced removal drops the object's edges, changing the reference
+        # counts of its neighbours
+        for referrer in list(self._pred[slot] or ()):
+            refs = self._edges[(referrer << 32) | slot]
+            add_at(self._out_stack, referrer, -(refs >> 32))
+            add_at(self._out_heap, referrer, -(refs & 0xffffffff))
+            if self._track_out:
+                self._dirty.add(self._ids[referrer])
+            self._remove_edge(referrer, slot)
+        for referee in list(self._succ[slot] or ()):
+            refs = self._edges[(slot << 32) | referee]
+            if self._agg is not None and referee != slot:
+                in_refs = self._in_stack.item(referee) + \
+                          self._in_heap.item(referee)
+                self._agg.move_in_refs(in_refs, in_refs - (refs >> 32) -
+                                                (refs & 0xffffffff))
+            add_at(self._in_stack, referee, -(refs >> 32))
+            add_at(self._in_heap, referee, -(refs & 0xffffffff))
+            if self._track_in:
+                self._dirty.add(self._ids[referee])
+            self._remove_edge(slot, referee)
+        self._dirty.discard(obj_id)
+        self._active.discard(obj_id)
+        del self._slots[obj_id]
+        self._ids[slot] = None
+        self._queries[slot] = None
+        self._free.append(slot)
+
+    def _saved_queries(self, obj_id, slot):
+        if self._qstate is not None:
+            # The row will be reused by another object
+            return querycompiler.CompiledQueries(
+                self._program, obj_id, bytearray(self._qstate[slot].tobytes()))
+        return self.get_obj_queries(obj_id)
+
+    def _remove_ref(self, func, referrer_id, referee_id, stack, heap):
+        referrer = self._slot(referrer_id, func, "Referrer object")
+        referee = self._slot(referee_id, func, "Referee object")
+        key = (referrer << 32) | referee
+        refs = self._edges.get(key)
+        if refs is None:
+            raise Exception("{0}: "
+                            "Referrer {1} and referee {2} "
+                            "have no connection" \
+                            .format(func, referrer_id, referee_id))
+        if (stack and refs >> 32 == 0) or \
+           (heap and refs & 0xffffffff == 0):
+            raise Exception("{0}: "
+                            "No references between "
+                            "referrer {1} and referee {2}" \
+                            .format(func, referrer_id, referee_id))
+        refs -= (stack << 32) + heap
+        if refs == 0:
+            self._remove_edge(referrer, referee)
+        else:
+            self._edges[key] = refs
+        if self._track_out:
+            self._dirty.add(referrer_id)
+        if self._track_in:
+            self._dirty.add(referee_id)
+        # The counters of the referee are decremented by the caller
+        if self._agg is not None:
+            self._agg.dec_in_refs(self._in_stack.item(referee) +
+                                  self._in_heap.item(referee))
+        return referrer, referee
+
+    def remove_stack_ref(self, referrer_id, referee_id):
+        referrer, referee = self._remove_ref("remove_stack_ref",
+                                             referrer_id, referee_id, 1, 0)
+        add_at(self._out_stack, referrer, -1)
+        add_at(self._in_stack, referee, -1)
+        # This is run if we remove objects when reference count
+        # reaches 0, not waiting for deallocation event
+        if self.ref_dealloc and self.in_total_refs(referee_id) == 0:
+            self.remove_obj(referee_id)
+
+    def remove_heap_ref(self, referrer_id, referee_id):
+        referrer, referee = self._remove_ref("remove_heap_ref",
+                                             referrer_id, referee_id, 0, 1)
+        add_at(self._out_heap, referrer, -1)
+        add_at(self._in_heap, referee, -1)
+        # This is run if we remove objects when reference count
+        # reaches 0, not waiting for deallocation event
+        if self.ref_dealloc and self.in_total_refs(referee_id) == 0:
+            self.remove_obj(referee_id)
+
+    def has_obj(self, obj_id):
+        return obj_id in self._slots
+
+    def has_stack_ref(self, referrer_id, referee_id):
+        referrer = self._slot(referrer_id, "has_stack_ref", "Referrer object")
+        referee = self._slot(referee_id, "has_stack_ref", "Referee object")
+        return self._edges.get((referrer << 32) | referee, 0) >> 32 > 0
+
+    def has_heap_ref(self, referrer_id, referee_id):
+        referrer = self._slot(referrer_id, "has_heap_ref", "Referrer object")
+        referee = self._slot(referee_id, "has_heap_ref", "Referee object")
+        return self._edges.get((referrer << 32) | referee, 0) \
+               & 0xffffffff > 0
+
+    def ensure_obj(self, obj_id):
+        if obj_id in self._slots:
+            return False
+        self.add_obj(obj_id)
+        return True
+
+    def ensure_and_add_stack_ref(self, referrer_id, referee_id):
+        slots = self._slots
+        if referrer_id not in slots:
+            self.add_obj(referrer_id)
+        if referee_id not in slots:
+            self.add_obj(referee_id)
+        referrer, referee = slots[referrer_id], slots[referee_id]
+        self._add_ref(referrer, referee, 1, 0)
+        add_at(self._out_stack, referrer, 1)
+        add_at(self._in_stack, referee, 1)
+        if self._track_out:
+            self._dirty.add(referrer_id)
+        if self._track_in:
+            self._dirty.add(referee_id)
+
+    def _remove_ref_if_present(self, func, referrer_id, referee_id,
+                               stack, heap):
+        slots = self._slots
+        referrer = slots.get(referrer_id)
+        referee = slots.get(referee_id)
+        if referrer is None or referee is None:
+            self._slot(referrer_id, func, "Referrer object")
+            self._slot(referee_id, func, "Referee object")
+        key = (referrer << 32) | referee
+        refs = self._edges.get(key)
+        if refs is None or (stack and refs >> 32 == 0) or \
+           (heap and refs & 0xffffffff == 0):
+            return None
+        refs -= (stack << 32) + heap
+        if refs == 0:
+            self._remove_edge(referrer, referee)
+        else:
+            self._edges[key] = refs
+        if self._track_out:
+            self._dirty.add(referrer_id)
+        if self._track_in:
+            self._dirty.add(referee_id)
+        if self._agg is not None:
+            self._agg.dec_in_refs(self._in_stack.item(referee) +
+                                  self._in_heap.item(referee))
+        return referrer, referee
+
+    def remove_stack_ref_if_present(self, referrer_id, referee_id):
+        slots = self._remove_ref_if_present("remove_stack_ref_if_present",
+                                            referrer_id, referee_id, 1, 0)
+        if slots is None:
+            return False
+        referrer, referee = slots
+        add_at(self._out_stack, referrer, -1)
+        add_at(self._in_stack, referee, -1)
+        # This is run if we remove objects when reference count
+        # reaches 0, not waiting for deallocation event
+        if self.ref_dealloc and self.in_total_refs(referee_id) == 0:
+            self.remove_obj(referee_id)
+        return True
+
+    def remove_heap_ref_if_present(self, referrer_id, referee_id):
+        slots = self._remove_ref_if_present("remove_heap_ref_if_present",
+                                            referrer_id, referee_id, 0, 1)
+        if slots is None:
+            return False
+        referrer, referee = slots
+        add_at(self._out_heap, referrer, -1)
+        add_at(self._in_heap, referee, -1)
+        # This is run if we remove objects when reference count
+        # reaches 0, not waiting for deallocation event
+        if self.ref_dealloc and self.in_total_refs(referee_id) == 0:
+            self.remove_obj(referee_id)
+        return True
+
+    #Returns a list of IDs by value, not by reference
+    def get_obj_ids(self):
+        return self._slots.keys()
+
+    def get_refs(self):
+        ids = self._ids
+        return [(ids[key >> 32], ids[key & 0xffffffff],
+                 refs >> 32, refs & 0xffffffff) \
+                for key, refs in self._edges.iteritems()]
+
+    #Returns queries by reference, to be able to apply them
+    def get_obj_queries(self, obj_id):
+        slot = self._slot(obj_id, "get_obj_queries")
+        if self._qstate is not None:
+            return querycompiler.CompiledQueries(self._program, obj_id,
+                                                 self._qstate[slot])
+        if self._program is not None:
+            return querycompiler.CompiledQueries(self._program, obj_id,
+                                                 self._queries[slot])
+        return self._queries[slot]
+
+    def _new_queries(self, obj_id):
+        if self._qstate is not None:
+            self._qstate[self._slots[obj_id]] = self._initial_qstate
+            return None
+        if self._program is not None:
+            return self._program.new_state()
+        return [qf(self, obj_id) for qf in self.qry_fs]
+
+    def _all_frozen(self, slot):
+        if self._qstate is not None:
+            return self._program.all_frozen(self._qstate[slot])
+        if self._program is not None:
+            return self._program.all_frozen(self._queries[slot])
+        for qry in self._queries[slot]:
+            if not qry.isFrozen():
+                return False
+        return True
+
+    def apply_obj_queries(self, obj_id, apply_query=None):
+        slot = self._slot(obj_id, "apply_obj_queries")
+        if apply_query is not None:
+            for i, qry in enumerate(self.get_obj_queries(obj_id)):
+                apply_query(i, qry)
+        elif self._qstate is not None:
+            self._program.apply(obj_id, self._qstate[slot])
+        elif self._program is not None:
+            self._program.apply(obj_id, self._queries[slot])
+        else:
+            for qry in self._queries[slot]:
+                qry.apply()
+        if self._all_frozen(slot):
+            self._active.discard(obj_id)
+
+    def apply_queries(self, obj_ids, apply_query=None):
+        active = self._active
+        if self._qstate is None or apply_query is not None:
+            for obj_id in obj_ids:
+                if obj_id in active:
+                    self.apply_obj_queries(obj_id, apply_query)
+            return
+        obj_ids = [obj_id for obj_id in obj_ids if obj_id in active]
+        rows = np.fromiter((self._slot(obj_id, "apply_queries") \
+                            for obj_id in obj_ids), dtype=np.intp)
+        self._program.apply_rows(self._qstate, rows, self.get_columns(rows))
+        frozen = self._program.all_frozen_rows(self._qstate, rows)
+        active.difference_update(obj_ids[i] for i in np.flatnonzero(frozen))
+
+    def get_active_obj_ids(self):
+        return list(self._active)
+
+    def get_columns(self, rows):
+        """
+        Return the properties of the objects in the given slots as 
+        columns, as used by the conditions of vectorized queries.
+        """
+        cols = {"type": self._type[rows],
+                "types": self._types,
+                "in_stack": self._in_stack[rows],
+                "in_heap": self._in_heap[rows],
+                "out_stack": self._out_stack[rows],
+                "out_heap": self._out_heap[rows]}
+        cols["in_total"] = cols["in_stack"] + cols["in_heap"]
+        cols["out_total"] = cols["out_stack"] + cols["out_heap"]
+        cols["is_builtin"] = self._types.builtin_array()[cols["type"]]
+        return cols
+
+    def reset_obj_queries(self, obj_id):
+        slot = self._slot(obj_id, "reset_obj_queries")
+        self._queries[slot] = self._new_queries(obj_id)
+        self._dirty.add(obj_id)
+        self._active.add(obj_id)
+
+    def pop_dirty_obj_ids(self):
+        dirty = self._dirty
+        self._dirty = set()
+        return dirty
+
+    def set_query_deps(self, deps):
+        self._track_in = "in" in deps
+        self._track_out = "out" in deps
+        self._track_type = "type" in deps
+
+    def set_query_sets(self, query_sets):
+        if getattr(self, "_slots", None):
+            raise Exception("set_query_sets: "
+                            "Model already contains objects")
+        self.qry_fs = []
+        self.qry_sets = []
+        for name, qry_fs in query_sets:
+            self.qry_sets.append((name, len(self.qry_fs),
+                                  len(self.qry_fs) + len(qry_fs)))
+            self.qry_fs.extend(qry_fs)
+        self._init_program()
+
+    def get_query_sets(self):
+        return list(self.qry_sets)
+
+    def add_data_collectors(self, data_collectors):
+        self.data_collectors.extend([(columns.open_collector(fn, to_str),
+                                      func, to_str) \
+                                     for fn, func, to_str in data_collectors])
+
+    def collect_data(self, progress):
+        for save_file, func, to_str in self.data_collectors:
+            if to_str is None:
+                save_file.append(progress, func(self))
+            else:
+                save_file.write("{}, {}\n".format(progress,
+                                                  to_str(func(self))))
+
+    def _query_format(self):
+        if self._qstate is not None:
+            return "vectorized"
+        return "compiled" if self._program is not None else "objects"
+
+    def set_result_sink(self, sink):
+        self.result_sink = sink
+
+    def _save_queries(self, queries):
+        if isinstance(queries, querycompiler.CompiledQueries):
+            return str(bytearray(queries.state))
+        return [qry.getState() for qry in queries]
+
+    def _load_queries(self, obj_id, saved):
+        if self._program is not None:
+            return bytearray(saved)
+        queries = self._new_queries(obj_id)
+        for qry, qry_state in zip(queries, saved):
+            qry.setState(qry_state)
+        return queries
+
+    def save_state(self):
+        for save_file, _, _ in self.data_collectors:
+            save_file.flush()
+        n = len(self._ids)
+        queries = [None] * n
+        if self._qstate is None:
+            for slot, obj_id in enumerate(self._ids):
+                if obj_id is not None:
+                    queries[slot] = \
+                        self._save_queries(self.get_obj_queries(obj_id))
+        return {
+            "query_format": self._query_format(),
+            "ids": list(self._ids),
+            "free": list(self._free),
+            "type_names": self._types.save_state(),
+            "columns": dict((name, getattr(self, name)[:n].copy()) \
+                            for name in ["_type", "_site", "_in_stack",
+                                         "_in_heap", "_out_stack",
+                                         "_out_heap"]),
+            "queries": queries,
+            "qstate": self._qstate[:n].copy() \
+                      if self._qstate is not None else None,
+            "edges": dict(self._edges),
+            "results": [(obj_id, r["type"],
+                         self._save_queries(r["queries"])) \
+                        for obj_id, r in self.results.iteritems()],
+            "dirty": list(self._dirty),
+            "frames": self._call_stack.save_state() \
+                      if self._call_stack is not None else None,
+            "collectors": [save_file.tell() \
+                           for save_file, _, _ in self.data_collectors]}
+
+    def load_state(self, state, restore_queries=True):
+        if state["query_format"] != self._query_format():
+            raise Exception("load_state: "
+                            "State was saved with {0} queries" \
+                            .format(state["query_format"]))
+        if (state["frames"] is not None) != (self._call_stack is not None):
+            raise Exception("load_state: "
+                            "State was saved with call_frames={0}" \
+                            .format(state["frames"] is not None))
+        if self._call_stack is not None:
+            self._call_stack.load_state(state["frames"])
+        self._ids = list(state["ids"])
+        self._free = list(state["free"])
+        self._slots = dict((obj_id, slot) \
+                           for slot, obj_id in enumerate(self._ids) \
+                           if obj_id is not None)
+        self._types.load_state(state["type_names"])
+        n = len(self._ids)
+        while len(self._type) < n:
+            self._grow()
+        for name, column in state["columns"].iteritems():
+            getattr(self, name)[:n] = column
+        self._edges = dict(state["edges"])
+        self._succ = [None] * n
+        self._pred = [None] * n
+        for key in self._edges:
+            referrer, referee = key >> 32, key & 0xffffffff
+            if self._succ[referrer] is None:
+                self._succ[referrer] = set()
+            self._succ[referrer].add(referee)
+            if self._pred[referee] is None:
+                self._pred[referee] = set()
+            self._pred[referee].add(referrer)
+        if self._agg is not None:
+            self._agg = self._build_aggregates()
+        self._queries = [None] * n
+        self.results = {}
+        if not restore_queries:
+            # The new queries have never been applied
+            for obj_id in self._slots:
+                self._queries[self._slots[obj_id]] = \
+                    self._new_queries(obj_id)
+            self._dirty = set(self._slots)
+            self._active = set(self._slots)
+            return
+        if self._qstate is not None:
+            self._qstate[:n] = state["qstate"]
+        else:
+            for slot, saved in enumerate(state["queries"]):
+                if saved is not None:
+                    self._queries[slot] = \
+                        self._load_queries(self._ids[slot], saved)
+        self._active = set(obj_id for obj_id, slot in self._slots.iteritems() \
+                           if not self._all_frozen(slot))
+        for obj_id, obj_type, saved in state["results"]:
+            queries = self._load_queries(obj_id, saved)
+            if self._program is not None:
+                queries = querycompiler.CompiledQueries(self._program,
+                                                        obj_id, queries)
+            self.results[obj_id] = {"type": obj_type, "queries": queries}
+        self._dirty = set(state["dirty"])
+        if len(state["collectors"]) != len(self.data_collectors):
+            raise Exception("load_state: "
+                            "State was saved with {0} data collectors" \
+                            .format(len(state["collectors"])))
+        # Continue writing where the data collectors were at
+        for i, offset in enumerate(state["collectors"]):
+            save_file, func, to_str = self.data_collectors[i]
+            self.data_collectors[i] = \
+                (columns.reopen_collector(save_file, offset), func, to_str)
+
+    def _build_aggregates(self):
+        agg = Aggregates()
+        for slot in self._slots.itervalues():
+            type_id = self._type.item(slot)
+            agg.add_obj(self._types.names[type_id],
+                        self._types.builtin[type_id])
+            in_refs = self._in_stack.item(slot) + self._in_heap.item(slot)
+            if in_refs:
+                agg.move_in_refs(0, in_refs)
+        return agg
+
+    def get_aggregates(self):
+        if self._agg is None:
+            raise Exception("get_aggregates: "
+                            "Model was created without aggregates")
+        return self._agg
+
+    def get_call_stack(self):
+        return self._call_stack
+
+    def get_results(self):
+        for save_file, _, _ in self.data_collectors:
+            save_file.close()
+        return self.results.copy()
+
+    # Own methods, not part of the interface. Used in queries.
+
+    def in_stack_refs(self, obj_id):
+        return self._in_stack.item(self._slot(obj_id, "in_stack_refs"))
+
+    def in_heap_refs(self, obj_id):
+        return self._in_heap.item(self._slot(obj_id, "in_heap_refs"))
+
+    def in_total_refs(self, obj_id):
+        slot = self._slot(obj_id, "in_total_refs")
+        return self._in_stack.item(slot) + self._in_heap.item(slot)
+
+    def out_stack_refs(self, obj_id):
+        return self._out_stack.item(self._slot(obj_id, "out_stack_refs"))
+
+    def out_heap_refs(self, obj_id):
+        return self._out_heap.item(self._slot(obj_id, "out_heap_refs"))
+
+    def out_total_refs(self, obj_id):
+        slot = self._slot(obj_id, "out_total_refs")
+        return self._out_stack.item(slot) + self._out_heap.item(slot)
+
+    def is_instance_of(self, obj_id, obj_type):
+        slot = self._slot(obj_id, "is_instance_of")
+        return self._type.item(slot) == self._types.get_id(obj_type)
+
+    def is_builtin(self, obj_id):
+        slot = self._slot(obj_id, "is_builtin")
+        return self._types.builtin[self._type.item(slot)]
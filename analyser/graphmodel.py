@@ -1,5 +1,11 @@
 #!/usr/bin/env python
 import model
+import querycompiler
+import columns
+from aggregates import Aggregates
+from reachability import ReachabilityIndex
+from callstack import CallStack
+from typetable import TypeTable, BUILTIN_PREFIXES
 import networkx as nx
 
 #TODO: Documentation
@@ -9,66 +15,143 @@ class GraphModel(model.Model):
     # Can't use ref_dealloc=True as of now, some bug in Erik's output
     # makes it possible for an object to appear to lose all references,
     # but still be kept track of and referenced again further on.
-    def __init__(self, qry_fs, data_collectors=[], ref_dealloc=False):
+    # With compile_queries=True, the query factories are compiled into a
+    # single program shared by all objects, and each object only stores
+    # its state in that program (see querycompiler.py).
+    # With aggregates=True, aggregates of the live objects are kept up to 
+    # date for the data collectors (see aggregates.py).
+    # With reachability=True, the owners and reachability of the objects
+    # are kept up to date for the queries (see reachability.py).
+    # With call_frames=True, the stack references of method calls are 
+    # kept per call frame (see callstack.py).
+    # The types and allocation sites of the objects are stored as IDs in 
+    # a type table, where types starting with one of builtin_prefixes 
+    # are builtin (see typetable.py).
+    def __init__(self, qry_fs, data_collectors=[], ref_dealloc=False,
+                 compile_queries=False, aggregates=False,
+                 builtin_prefixes=BUILTIN_PREFIXES, reachability=False,
+                 call_frames=False):
         self._g = nx.DiGraph()
-        self.qry_fs = qry_fs
-        self.data_collectors = [(open(fn, "w+"), func, to_str) \
-                                for fn, func, to_str in data_collectors]
+        self._types = TypeTable(builtin_prefixes)
+        self._agg = Aggregates() if aggregates else None
+        self._reach = ReachabilityIndex(self._g, self._reach_changed) \
+                      if reachability else None
+        self._call_stack = CallStack() if call_frames else None
+        self._compile_queries = compile_queries
+        self.set_query_sets([(None, qry_fs)])
+        self.data_collectors = []
+        self.add_data_collectors(data_collectors)
         #self.ref_dealloc = ref_dealloc
         self.ref_dealloc = False
         self.results = {}
+        self.result_sink = None
+        # Objects whose queries might evaluate differently since the 
+        # last query pass
+        self._dirty = set()
+        # Objects with queries that aren't frozen yet. The queries of 
+        # the others can't change anymore, and aren't applied again.
+        self._active = set()
+        self.set_query_deps(querycompiler.ALL_DEPS)
 
-    def add_obj(self, obj_id, obj_type="(unknown)"):
+    def add_obj(self, obj_id, obj_type="(unknown)", site="(unknown)"):
         if self._g.has_node(obj_id): 
             raise Exception("add_obj: "
                             "Object {0} already exists" \
                             .format(obj_id))
+        # The reference counters are kept up to date when references are 
+        # added and removed, so that they don't have to be summed up over 
+        # the edges of the object every time they are read.
+        type_id = self._types.intern(obj_type)
         self._g.add_node(obj_id, 
-                         type=obj_type,
-                         queries=[qf(self, obj_id) \
-                                  for qf in self.qry_fs])
+                         type=type_id,
+                         site=self._types.intern(site),
+                         queries=self._new_queries(obj_id),
+                         in_stack=0, in_heap=0,
+                         out_stack=0, out_heap=0)
+        self._dirty.add(obj_id)
+        self._active.add(obj_id)
+        if self._agg is not None:
+            self._agg.add_obj(obj_type, self._types.builtin[type_id])
+        if self._reach is not None:
+            self._reach.add_obj(obj_id)
 
     def set_obj_type(self, obj_id, obj_type):
         if not self._g.has_node(obj_id):
             raise Exception("set_obj_type: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        self._g.node[obj_id]["type"] = obj_type
+        type_id = self._types.intern(obj_type)
+        if self._agg is not None:
+            old_id = self._g.node[obj_id]["type"]
+            self._agg.set_type(self._types.names[old_id],
+                               self._types.builtin[old_id],
+                               obj_type, self._types.builtin[type_id])
+        self._g.node[obj_id]["type"] = type_id
+        if self._track_type:
+            self._dirty.add(obj_id)
 
     def get_obj_type(self, obj_id):
-        if not self._g.has_node(obj_id):
+        node = self._g._node.get(obj_id)
+        if node is None:
             raise Exception("get_obj_type: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        return self._g.node[obj_id]["type"]
+        return self._types.names[node["type"]]
+
+    def set_obj_site(self, obj_id, site):
+        node = self._g._node.get(obj_id)
+        if node is None:
+            raise Exception("set_obj_site: "
+                            "Object {0} doesn't exist" \
+                            .format(obj_id))
+        node["site"] = self._types.intern(site)
+
+    def get_obj_site(self, obj_id):
+        node = self._g._node.get(obj_id)
+        if node is None:
+            raise Exception("get_obj_site: "
+                            "Object {0} doesn't exist" \
+                            .format(obj_id))
+        return self._types.names[node["site"]]
     
-    def add_stack_ref(self, referrer_id, referee_id):
-        if not self._g.has_node(referrer_id):
-            raise Exception("add_stack_ref: "
-                            "Referrer object {0} doesn't exist" \
-                            .format(referrer_id))
-        if not self._g.has_node(referee_id):
-            raise Exception("add_stack_ref: "
-                            "Referee object {0} doesn't exist" \
-                            .format(referee_id))
+    # The operations done for most events access the dicts behind the 
+    # graph (_node, _succ) directly, since networkx creates a new view 
+    # on every access of G.node or G.adj, which takes about ten times 
+    # as long as the lookup itself.
+
+    def _add_ref(self, func, referrer_id, referee_id, kind):
+        nodes = self._g._node
+        if referrer_id not in nodes:
+            raise Exception("{0}: "
+                            "Referrer object {1} doesn't exist" \
+                            .format(func, referrer_id))
+        if referee_id not in nodes:
+            raise Exception("{0}: "
+                            "Referee object {1} doesn't exist" \
+                            .format(func, referee_id))
+        refs = self._g._succ[referrer_id].get(referee_id)
         #if there aren't any edges yet
-        if not self._g.has_edge(referrer_id, referee_id):
+        if refs is None:
             self._g.add_edge(referrer_id, referee_id, stack=0, heap=0)
-        self._g.adj[referrer_id][referee_id]["stack"] += 1
+            refs = self._g._succ[referrer_id][referee_id]
+        refs[kind] += 1
+        nodes[referrer_id]["out_" + kind] += 1
+        referee = nodes[referee_id]
+        if self._agg is not None:
+            self._agg.inc_in_refs(referee["in_stack"] + referee["in_heap"])
+        referee["in_" + kind] += 1
+        if self._reach is not None:
+            self._reach.add_ref(referrer_id, referee_id, refs, kind)
+        if self._track_out:
+            self._dirty.add(referrer_id)
+        if self._track_in:
+            self._dirty.add(referee_id)
+
+    def add_stack_ref(self, referrer_id, referee_id):
+        self._add_ref("add_stack_ref", referrer_id, referee_id, "stack")
 
     def add_heap_ref(self, referrer_id, referee_id):
-        if not self._g.has_node(referrer_id):
-            raise Exception("add_heap_ref: "
-                            "Referrer object {0} doesn't exist" \
-                            .format(referrer_id))
-        if not self._g.has_node(referee_id):
-            raise Exception("add_heap_ref: "
-                            "Referee object {0} doesn't exist" \
-                            .format(referee_id))
-        #if there aren't any edges yet
-        if not self._g.has_edge(referrer_id, referee_id):        
-            self._g.add_edge(referrer_id, referee_id, stack=0, heap=0)
-        self._g.adj[referrer_id][referee_id]["heap"] += 1
+        self._add_ref("add_heap_ref", referrer_id, referee_id, "heap")
 
     def remove_obj(self, obj_id, force=False):
         if not self._g.has_node(obj_id):
@@ -85,9 +168,40 @@ class GraphModel(model.Model):
                                 "Object {0} has outgoing references" \
                                 .format(obj_id))
         #Save queries and remove object
-        self.results[obj_id] = \
-            {"type" : self._g.node[obj_id]["type"], 
-             "queries" : self._g.node[obj_id]["queries"]}
+        node = self._g.node[obj_id]
+        type_id = node["type"]
+        obj_type = self._types.names[type_id]
+        if self.result_sink is not None:
+            self.result_sink.add(obj_id, obj_type,
+                                 self._saved_queries(obj_id),
+                                 self._types.names[node["site"]])
+        else:
+            self.results[obj_id] = \
+                {"type" : obj_type, 
+                 "queries" : self._saved_queries(obj_id)}
+        if self._agg is not None:
+            self._agg.remove_obj(obj_type, self._types.builtin[type_id],
+                                 self.in_total_refs(obj_id))
+        if self._reach is not None:
+            self._reach.remove_obj(obj_id)
+        # Forced removal drops the object's edges, changing the reference 
+        # counts of its neighbours
+        for referrer_id, _, refs in self._g.in_edges(obj_id, data=True):
+            self._g.node[referrer_id]["out_stack"] -= refs["stack"]
+            self._g.node[referrer_id]["out_heap"] -= refs["heap"]
+            if self._track_out:
+                self._dirty.add(referrer_id)
+        for _, referee_id, refs in self._g.out_edges(obj_id, data=True):
+            if self._agg is not None and referee_id != obj_id:
+                in_refs = self.in_total_refs(referee_id)
+                self._agg.move_in_refs(in_refs, in_refs - refs["stack"] -
+                                                refs["heap"])
+            self._g.node[referee_id]["in_stack"] -= refs["stack"]
+            self._g.node[referee_id]["in_heap"] -= refs["heap"]
+            if self._track_in:
+                self._dirty.add(referee_id)
+        self._dirty.discard(obj_id)
+        self._active.discard(obj_id)
         self._g.remove_node(obj_id)
 
     def remove_stack_ref(self, referrer_id, referee_id):
@@ -109,7 +223,19 @@ class GraphModel(model.Model):
                             "No references between "
                             "referrer {0} and referee {1}" \
                             .format(referrer_id, referee_id))
+        if self._agg is not None:
+            self._agg.dec_in_refs(self.in_total_refs(referee_id))
         self._g.adj[referrer_id][referee_id]["stack"] -= 1
+        self._g.node[referrer_id]["out_stack"] -= 1
+        self._g.node[referee_id]["in_stack"] -= 1
+        if self._reach is not None:
+            self._reach.remove_ref(referrer_id, referee_id,
+                                   self._g.adj[referrer_id][referee_id],
+                                   "stack")
+        if self._track_out:
+            self._dirty.add(referrer_id)
+        if self._track_in:
+            self._dirty.add(referee_id)
         # This is run if we remove objects when reference count
         # reaches 0, not waiting for deallocation event
         if self.ref_dealloc and self.in_total_refs(referee_id) == 0:
@@ -134,7 +260,19 @@ class GraphModel(model.Model):
                             "No references between "
                             "referrer {0} and referee {1}" \
                             .format(referrer_id, referee_id))
+        if self._agg is not None:
+            self._agg.dec_in_refs(self.in_total_refs(referee_id))
         self._g.adj[referrer_id][referee_id]["heap"] -= 1
+        self._g.node[referrer_id]["out_heap"] -= 1
+        self._g.node[referee_id]["in_heap"] -= 1
+        if self._reach is not None:
+            self._reach.remove_ref(referrer_id, referee_id,
+                                   self._g.adj[referrer_id][referee_id],
+                                   "heap")
+        if self._track_out:
+            self._dirty.add(referrer_id)
+        if self._track_in:
+            self._dirty.add(referee_id)
         # This is run if we remove objects when reference count
         # reaches 0, not waiting for deallocation event
         if self.ref_dealloc and self.in_total_refs(referee_id) == 0:
@@ -167,30 +305,292 @@ class GraphModel(model.Model):
         return self._g.has_edge(referrer_id, referee_id) and \
                self._g.adj[referrer_id][referee_id]["heap"] > 0
 
+    def ensure_obj(self, obj_id):
+        if obj_id in self._g._node:
+            return False
+        self.add_obj(obj_id)
+        return True
+
+    def ensure_and_add_stack_ref(self, referrer_id, referee_id):
+        nodes = self._g._node
+        if referrer_id not in nodes:
+            self.add_obj(referrer_id)
+        if referee_id not in nodes:
+            self.add_obj(referee_id)
+        self._add_ref("ensure_and_add_stack_ref",
+                      referrer_id, referee_id, "stack")
+
+    def _remove_ref_if_present(self, func, referrer_id, referee_id, kind):
+        nodes = self._g._node
+        succ = self._g._succ.get(referrer_id)
+        refs = succ.get(referee_id) if succ is not None else None
+        if refs is None or refs[kind] == 0:
+            if referrer_id not in nodes:
+                raise Exception("{0}: "
+                                "Referrer object {1} doesn't exist" \
+                                .format(func, referrer_id))
+            if referee_id not in nodes:
+                raise Exception("{0}: "
+                                "Referee object {1} doesn't exist" \
+                                .format(func, referee_id))
+            return False
+        refs[kind] -= 1
+        nodes[referrer_id]["out_" + kind] -= 1
+        referee = nodes[referee_id]
+        if self._agg is not None:
+            self._agg.dec_in_refs(referee["in_stack"] + referee["in_heap"])
+        referee["in_" + kind] -= 1
+        if self._reach is not None:
+            self._reach.remove_ref(referrer_id, referee_id, refs, kind)
+        if self._track_out:
+            self._dirty.add(referrer_id)
+        if self._track_in:
+            self._dirty.add(referee_id)
+        # This is run if we remove objects when reference count
+        # reaches 0, not waiting for deallocation event
+        if self.ref_dealloc and self.in_total_refs(referee_id) == 0:
+            self.remove_obj(referee_id)
+        return True
+
+    def remove_stack_ref_if_present(self, referrer_id, referee_id):
+        return self._remove_ref_if_present("remove_stack_ref_if_present",
+                                           referrer_id, referee_id, "stack")
+
+    def remove_heap_ref_if_present(self, referrer_id, referee_id):
+        return self._remove_ref_if_present("remove_heap_ref_if_present",
+                                           referrer_id, referee_id, "heap")
+
     #Returns node array by value, not by reference
     def get_obj_ids(self):
         return self._g.nodes()
     
+    def get_refs(self):
+        # Edges are kept when their last reference is removed
+        return [(referrer_id, referee_id, r["stack"], r["heap"]) \
+                for referrer_id, referee_id, r in self._g.edges(data=True) \
+                if r["stack"] or r["heap"]]
+
     #Returns queries by reference, to be able to apply them
     def get_obj_queries(self, obj_id):
         if not self._g.has_node(obj_id):
             raise Exception("get_obj_queries: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
+        if self._program is not None:
+            return querycompiler.CompiledQueries(
+                self._program, obj_id, self._g.node[obj_id]["queries"])
         return self._g.node[obj_id]["queries"]
 
+    def _saved_queries(self, obj_id):
+        # The queries saved in the results when an object is removed
+        return self.get_obj_queries(obj_id)
+
+    def _new_queries(self, obj_id):
+        if self._program is not None:
+            return self._program.new_state()
+        return [qf(self, obj_id) for qf in self.qry_fs]
+
+    def _all_frozen(self, queries):
+        if self._program is not None:
+            return self._program.all_frozen(queries)
+        for qry in queries:
+            if not qry.isFrozen():
+                return False
+        return True
+
+    def apply_obj_queries(self, obj_id, apply_query=None):
+        if not self._g.has_node(obj_id):
+            raise Exception("apply_obj_queries: "
+                            "Object {0} doesn't exist" \
+                            .format(obj_id))
+        queries = self._g.node[obj_id]["queries"]
+        if apply_query is not None:
+            for i, qry in enumerate(self.get_obj_queries(obj_id)):
+                apply_query(i, qry)
+        elif self._program is not None:
+            self._program.apply(obj_id, queries)
+        else:
+            for qry in queries:
+                qry.apply()
+        if self._all_frozen(queries):
+            self._active.discard(obj_id)
+
+    def apply_queries(self, obj_ids, apply_query=None):
+        active = self._active
+        for obj_id in obj_ids:
+            if obj_id in active:
+                self.apply_obj_queries(obj_id, apply_query)
+
+    def get_active_obj_ids(self):
+        return list(self._active)
+
     def reset_obj_queries(self, obj_id):
         if not self._g.has_node(obj_id):
             raise Exception("reset_obj_queries: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        self._g.node[obj_id]["queries"] = [qf(self, obj_id) \
-                                           for qf in self.qry_fs]
+        self._g.node[obj_id]["queries"] = self._new_queries(obj_id)
+        self._dirty.add(obj_id)
+        self._active.add(obj_id)
+
+    def pop_dirty_obj_ids(self):
+        if self._reach is not None:
+            # Objects that became unreachable are marked dirty
+            self._reach.resolve()
+        dirty = self._dirty
+        self._dirty = set()
+        return dirty
+
+    def set_query_deps(self, deps):
+        self._track_in = "in" in deps
+        self._track_out = "out" in deps
+        self._track_type = "type" in deps
+        self._track_reach = "reach" in deps
+
+    def _reach_changed(self, obj_id):
+        if self._track_reach:
+            self._dirty.add(obj_id)
+
+    def set_query_sets(self, query_sets):
+        if self._g.number_of_nodes() > 0:
+            raise Exception("set_query_sets: "
+                            "Model already contains objects")
+        self.qry_fs = []
+        self.qry_sets = []
+        for name, qry_fs in query_sets:
+            self.qry_sets.append((name, len(self.qry_fs),
+                                  len(self.qry_fs) + len(qry_fs)))
+            self.qry_fs.extend(qry_fs)
+        self._program = querycompiler.Program(self, self.qry_fs) \
+                        if self._compile_queries else None
+
+    def get_query_sets(self):
+        return list(self.qry_sets)
+
+    def add_data_collectors(self, data_collectors):
+        self.data_collectors.extend([(columns.open_collector(fn, to_str),
+                                      func, to_str) \
+                                     for fn, func, to_str in data_collectors])
 
     def collect_data(self, progress):
         for save_file, func, to_str in self.data_collectors:
-            save_file.write("{}, {}\n".format(progress,
-                                              to_str(func(self))))
+            if to_str is None:
+                save_file.append(progress, func(self))
+            else:
+                save_file.write("{}, {}\n".format(progress,
+                                                  to_str(func(self))))
+
+    def set_result_sink(self, sink):
+        self.result_sink = sink
+
+    def _save_queries(self, queries):
+        if isinstance(queries, querycompiler.CompiledQueries):
+            queries = queries.state
+        if isinstance(queries, bytearray):
+            return str(queries)
+        return [qry.getState() for qry in queries]
+
+    def _load_queries(self, obj_id, saved):
+        if self._program is not None:
+            return bytearray(saved)
+        queries = self._new_queries(obj_id)
+        for qry, qry_state in zip(queries, saved):
+            qry.setState(qry_state)
+        return queries
+
+    def save_state(self):
+        for save_file, _, _ in self.data_collectors:
+            save_file.flush()
+        return {
+            "compiled": self._program is not None,
+            "objects": [(obj_id, self._types.names[n["type"]], 
+                         n["in_stack"], n["in_heap"], 
+                         n["out_stack"], n["out_heap"],
+                         self._save_queries(n["queries"]),
+                         self._types.names[n["site"]]) \
+                        for obj_id, n in self._g.nodes(data=True)],
+            "refs": [(referrer_id, referee_id, r["stack"], r["heap"]) \
+                     for referrer_id, referee_id, r \
+                     in self._g.edges(data=True)],
+            "results": [(obj_id, r["type"], 
+                         self._save_queries(r["queries"])) \
+                        for obj_id, r in self.results.iteritems()],
+            "dirty": list(self._dirty),
+            "frames": self._call_stack.save_state() \
+                      if self._call_stack is not None else None,
+            "collectors": [save_file.tell() \
+                           for save_file, _, _ in self.data_collectors]}
+
+    def load_state(self, state, restore_queries=True):
+        if state["compiled"] != (self._program is not None):
+            raise Exception("load_state: "
+                            "State was saved with compile_queries={0}" \
+                            .format(state["compiled"]))
+        if (state["frames"] is not None) != (self._call_stack is not None):
+            raise Exception("load_state: "
+                            "State was saved with call_frames={0}" \
+                            .format(state["frames"] is not None))
+        if self._call_stack is not None:
+            self._call_stack.load_state(state["frames"])
+        self._g = nx.DiGraph()
+        for obj_id, obj_type, i_s, i_h, o_s, o_h, saved, site \
+            in state["objects"]:
+            queries = self._load_queries(obj_id, saved) if restore_queries \
+                      else self._new_queries(obj_id)
+            self._g.add_node(obj_id, type=self._types.intern(obj_type),
+                             site=self._types.intern(site),
+                             queries=queries,
+                             in_stack=i_s, in_heap=i_h,
+                             out_stack=o_s, out_heap=o_h)
+        for referrer_id, referee_id, stack, heap in state["refs"]:
+            self._g.add_edge(referrer_id, referee_id, stack=stack, heap=heap)
+        if self._agg is not None:
+            self._agg = self._build_aggregates()
+        if self._reach is not None:
+            self._reach = ReachabilityIndex(self._g, self._reach_changed)
+        self.results = {}
+        if not restore_queries:
+            # The new queries have never been applied
+            self._dirty = set(self._g.nodes())
+            self._active = set(self._g.nodes())
+            return
+        self._active = set(obj_id for obj_id, n in self._g._node.iteritems() \
+                           if not self._all_frozen(n["queries"]))
+        for obj_id, obj_type, saved in state["results"]:
+            queries = self._load_queries(obj_id, saved)
+            if self._program is not None:
+                queries = querycompiler.CompiledQueries(self._program,
+                                                        obj_id, queries)
+            self.results[obj_id] = {"type": obj_type, "queries": queries}
+        self._dirty = set(state["dirty"])
+        if len(state["collectors"]) != len(self.data_collectors):
+            raise Exception("load_state: "
+                            "State was saved with {0} data collectors" \
+                            .format(len(state["collectors"])))
+        # Continue writing where the data collectors were at
+        for i, offset in enumerate(state["collectors"]):
+            save_file, func, to_str = self.data_collectors[i]
+            self.data_collectors[i] = \
+                (columns.reopen_collector(save_file, offset), func, to_str)
+
+    def _build_aggregates(self):
+        agg = Aggregates()
+        for n in self._g._node.itervalues():
+            agg.add_obj(self._types.names[n["type"]],
+                        self._types.builtin[n["type"]])
+            in_refs = n["in_stack"] + n["in_heap"]
+            if in_refs:
+                agg.move_in_refs(0, in_refs)
+        return agg
+
+    def get_aggregates(self):
+        if self._agg is None:
+            raise Exception("get_aggregates: "
+                            "Model was created without aggregates")
+        return self._agg
+
+    def get_call_stack(self):
+        return self._call_stack
 
     def get_results(self):
         for save_file, _, _ in self.data_collectors:
@@ -204,63 +604,87 @@ class GraphModel(model.Model):
             raise Exception("in_stack_refs: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        return reduce(lambda x,y: x + y[2]["stack"], 
-                      self._g.in_edges(obj_id, data=True), 0)
+        return self._g.node[obj_id]["in_stack"]
 
     def in_heap_refs(self, obj_id):
         if not self._g.has_node(obj_id):
             raise Exception("in_heap_refs: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        return reduce(lambda x,y: x + y[2]["heap"], 
-                      self._g.in_edges(obj_id, data=True), 0)
+        return self._g.node[obj_id]["in_heap"]
 
     def in_total_refs(self, obj_id):
         if not self._g.has_node(obj_id):
             raise Exception("in_total_refs: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        return reduce(lambda x,y: x + y[2]["stack"] + y[2]["heap"], 
-                      self._g.in_edges(obj_id, data=True), 0)
+        node = self._g.node[obj_id]
+        return node["in_stack"] + node["in_heap"]
 
     def out_stack_refs(self, obj_id):
         if not self._g.has_node(obj_id):
             raise Exception("out_stack_refs: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        return reduce(lambda x,y: x + y[2]["stack"], 
-                      self._g.out_edges(obj_id, data=True), 0)
+        return self._g.node[obj_id]["out_stack"]
 
     def out_heap_refs(self, obj_id):
         if not self._g.has_node(obj_id):
             raise Exception("out_heap_refs: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        return reduce(lambda x,y: x + y[2]["heap"], 
-                      self._g.out_edges(obj_id, data=True), 0)
+        return self._g.node[obj_id]["out_heap"]
 
     def out_total_refs(self, obj_id):
         if not self._g.has_node(obj_id):
             raise Exception("out_total_refs: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        return reduce(lambda x,y: x + y[2]["stack"] + y[2]["heap"], 
-                      self._g.out_edges(obj_id, data=True), 0)
+        node = self._g.node[obj_id]
+        return node["out_stack"] + node["out_heap"]
 
     def is_instance_of(self, obj_id, obj_type):
-        if not self._g.has_node(obj_id):
+        node = self._g._node.get(obj_id)
+        if node is None:
             raise Exception("is_instance_of: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        return self._g.node[obj_id]["type"] == obj_type
+        return node["type"] == self._types.get_id(obj_type)
     
     def is_builtin(self, obj_id):
-        if not self._g.has_node(obj_id):
+        node = self._g._node.get(obj_id)
+        if node is None:
             raise Exception("is_builtin: "
                             "Object {0} doesn't exist" \
                             .format(obj_id))
-        t = self._g.node[obj_id]["type"]
-        return (t == "(unknown)" or
-                t.startswith("java/") or
-                t.startswith("sun/") or
-                t.startswith("["))
+        return self._types.builtin[node["type"]]
+
+    def _reach_index(self, func, obj_id):
+        if self._reach is None:
+            raise Exception("{0}: "
+                            "Model was created without reachability" \
+                            .format(func))
+        if obj_id not in self._g._node:
+            raise Exception("{0}: "
+                            "Object {1} doesn't exist" \
+                            .format(func, obj_id))
+        self._reach.resolve()
+        return self._reach
+
+    def owner_count(self, obj_id):
+        return self._reach_index("owner_count", obj_id).owners[obj_id]
+
+    def get_owner(self, obj_id):
+        return self._reach_index("get_owner", obj_id).get_owner(obj_id)
+
+    def is_root(self, obj_id):
+        return self._reach_index("is_root", obj_id).is_root(obj_id)
+
+    def is_reachable(self, obj_id):
+        return obj_id in self._reach_index("is_reachable", obj_id).reachable
+
+    # Whether the object is only reachable through its single owner
+    def is_owned(self, obj_id):
+        reach = self._reach_index("is_owned", obj_id)
+        return obj_id in reach.reachable and not reach.is_root(obj_id) and \
+               reach.owners[obj_id] == 1
@@ -38,7 +38,11 @@ class Model(object):
     have to use to fetch information from the model. It is hence for 
     now not possible to, for example, fetch information about an edge 
     between this object and another specific object, since that would 
-    require knowledge of the ID of both objects.
+    require knowledge of the ID of both objects. The properties of an 
+    object that depend on the rest of the graph, such as its number of 
+    owners or whether it's reachable from a root, can only be queried 
+    if the model keeps them up to date itself (see reachability.py and 
+    GraphModel.is_reachable).
 
     The boolean function (the query) passed in to the combinator is 
     encapsulated in a string, this is to get a string representation 
@@ -53,6 +57,10 @@ class Model(object):
     with "type" as key and the object type (string) as value, and the 
     other with "queries" as key and the objects' associated queries as 
     value.
+
+    Object IDs are ints, parsed from the log by analyser.intern_events. 
+    The class names the log uses in place of object IDs are negative 
+    ints, mapped back to the names when reporting (see symbols.py).
     """
 
     def __init__(self, qry_fs, data_collectors):
@@ -63,45 +71,63 @@ class Model(object):
         """
         raise NotImplementedError()
 
-    def add_obj(self, obj_id, obj_type):
+    def add_obj(self, obj_id, obj_type, site):
         """
-        TYPE: string * string -> void
+        TYPE: int * string * string -> void
         Add an object to the model, then generate new queries and 
-        associate them with the object.
+        associate them with the object. The allocation site is 
+        optional (see set_obj_site).
         """
         raise NotImplementedError()
 
     def set_obj_type(self, obj_id, obj_type):
         """
-        TYPE: string * string -> void
+        TYPE: int * string -> void
         Set the type property of an object.
         """
         raise NotImplementedError()
 
     def get_obj_type(self, obj_id):
         """
-        TYPE: string -> string
+        TYPE: int -> string
         Return the type property of an object.
         """
         raise NotImplementedError();
 
+    def set_obj_site(self, obj_id, site):
+        """
+        TYPE: int * string -> void
+        Set the allocation site property of an object, the class that 
+        allocated it. Queries don't observe it, it's only used to 
+        break down the results (see results.py).
+        """
+        raise NotImplementedError()
+
+    def get_obj_site(self, obj_id):
+        """
+        TYPE: int -> string
+        Return the allocation site property of an object, "(unknown)" 
+        if it hasn't been set.
+        """
+        raise NotImplementedError()
+
     def add_stack_ref(self, referrer_id, referee_id):
         """
-        TYPE: string * string -> void
+        TYPE: int * int -> void
         Add a stack reference between two objects.
         """
         raise NotImplementedError()
 
     def add_heap_ref(self, referrer_id, referee_id):
         """
-        TYPE: string * string -> void
+        TYPE: int * int -> void
         Add a heap reference between two objects.
         """
         raise NotImplementedError()
 
     def remove_obj(self, obj_id):
         """
-        TYPE: string -> void
+        TYPE: int -> void
         Remove an object from the model after saving its associated 
         queries for the final measurements.
         """
@@ -109,28 +135,28 @@ class Model(object):
 
     def remove_stack_ref(self, referrer_id, referee_id):
         """
-        TYPE: string * string -> void
+        TYPE: int * int -> void
         Remove a stack reference between two objects.
         """
         raise NotImplementedError()
 
     def remove_heap_ref(self, referrer_id, referee_id):
         """
-        TYPE: string * string -> void
+        TYPE: int * int -> void
         Remove a heap reference between two objects.
         """
         raise NotImplementedError()
 
     def has_obj(self, obj_id):
         """
-        TYPE: string -> boolean
+        TYPE: int -> boolean
         Check whether an object exists in the model.
         """
         raise NotImplementedError()
 
     def has_stack_ref(self, referrer_id, referee_id):
         """
-        TYPE: string * string -> boolean
+        TYPE: int * int -> boolean
         Return True if for two objects, there exists at least one 
         stack reference between them. Otherwise return False.
         """
@@ -138,41 +164,217 @@ class Model(object):
 
     def has_heap_ref(self, referrer_id, referee_id):
         """
-        TYPE: string * string -> boolean
+        TYPE: int * int -> boolean
         Return True if for two objects, there exists at least one 
         heap reference between them. Otherwise return False.
         """
         raise NotImplementedError()
 
+    def ensure_obj(self, obj_id):
+        """
+        TYPE: int -> boolean
+        Add an object of unknown type if it doesn't exist. Return True 
+        if it was added.
+        """
+        raise NotImplementedError()
+
+    def ensure_and_add_stack_ref(self, referrer_id, referee_id):
+        """
+        TYPE: int * int -> void
+        Add a stack reference between two objects, first adding either 
+        of them that doesn't exist.
+        """
+        raise NotImplementedError()
+
+    def remove_stack_ref_if_present(self, referrer_id, referee_id):
+        """
+        TYPE: int * int -> boolean
+        Remove a stack reference between two objects, if there is one. 
+        Return True if it was removed.
+        """
+        raise NotImplementedError()
+
+    def remove_heap_ref_if_present(self, referrer_id, referee_id):
+        """
+        TYPE: int * int -> boolean
+        Remove a heap reference between two objects, if there is one. 
+        Return True if it was removed.
+        """
+        raise NotImplementedError()
+
     def get_obj_ids(self):
         """
-        TYPE: void -> string list
+        TYPE: void -> int list
         Return a list of IDs corresponding to the currently existing 
         objects in the model.
         """
         raise NotImplementedError()
 
+    def get_refs(self):
+        """
+        TYPE: void -> (int * int * int * int) list
+        Return a list of the references between the currently existing 
+        objects, as the referrer ID, the referee ID and the number of 
+        stack and heap references between them.
+        """
+        raise NotImplementedError()
+
     def get_obj_queries(self, obj_id):
         """
-        TYPE: string -> combinator list
+        TYPE: int -> combinator list
         Return a reference to the list of queries for a given object, 
         to be able to apply the queries during execution.
         """
         raise NotImplementedError()
 
+    def apply_obj_queries(self, obj_id, apply_query=None):
+        """
+        TYPE: int * lambda -> void
+        Apply all queries of a given object, or call apply_query with 
+        the index of each query and the query, e.g. to time them, if it 
+        is given. If they are all frozen afterwards, the object is no 
+        longer active (see get_active_obj_ids).
+        """
+        raise NotImplementedError()
+
+    def apply_queries(self, obj_ids, apply_query=None):
+        """
+        TYPE: int list * lambda -> void
+        Apply all queries of the given objects that are active. A model 
+        may evaluate the queries of all the objects together, unless 
+        apply_query is given (see apply_obj_queries).
+        """
+        raise NotImplementedError()
+
+    def get_active_obj_ids(self):
+        """
+        TYPE: void -> int list
+        Return a list of IDs of the active objects, those with queries 
+        that aren't frozen yet. The queries of the other objects can't 
+        change anymore, and aren't applied by the query passes.
+        """
+        raise NotImplementedError()
+
     def reset_obj_queries(self, obj_id):
         """
-        TYPE: string -> void
+        TYPE: int -> void
         Reset all queries for a given object.
         """
         raise NotImplementedError()
 
+    def pop_dirty_obj_ids(self):
+        """
+        TYPE: void -> int set
+        Return the IDs of the objects that have been added, had their 
+        queries reset, or had their type, incoming or outgoing 
+        references changed since the last call, and start a new empty 
+        set. Queries only observe these properties of their own object, 
+        so the queries of all other objects would evaluate to the same 
+        state as before.
+        """
+        raise NotImplementedError()
+
+    def set_query_deps(self, deps):
+        """
+        TYPE: string set -> void
+        Only add objects to the dirty set (see pop_dirty_obj_ids) on 
+        changes of the properties in deps, out of "in" (incoming 
+        references), "out" (outgoing references), "type" and "reach" 
+        (owners and reachability, see reachability.py), that the 
+        queries depend on (see querycompiler.query_deps). Added objects 
+        and objects with reset queries are always added. By default, 
+        changes of all properties are.
+        """
+        raise NotImplementedError()
+
+    def set_query_sets(self, query_sets):
+        """
+        TYPE: (string * lambda list) list -> void
+        Replace the query factories with several named sets of query 
+        factories. Every object gets the queries of all sets, in the 
+        order of the sets. Can only be done before any object is added.
+        """
+        raise NotImplementedError()
+
+    def get_query_sets(self):
+        """
+        TYPE: void -> (string * int * int) list
+        Return the name of each set of query factories, along with the 
+        start and end index of its queries in the query list of an 
+        object. A model initialised with a plain list of query 
+        factories has a single set named None.
+        """
+        raise NotImplementedError()
+
+    def add_data_collectors(self, data_collectors):
+        """
+        TYPE: (string * lambda * lambda) list -> void
+        Add data collectors, each given by the file to save its data 
+        to, the collecting function and the function converting the 
+        collected data to a string. With None instead of the latter, 
+        the collected numbers are saved in binary columns (see 
+        columns.py).
+        """
+        raise NotImplementedError()
+
     def collect_data(self, progress):
         """
         TYPE: float -> void
         Run all data collection functions and save the results to 
         their respectively assigned files. The provided argument 
-        signifies the progress percentage of the execution.
+        signifies the progress percentage of the execution, NaN if it 
+        isn't known (see analyser.UNKNOWN_PROGRESS).
+        """
+        raise NotImplementedError()
+
+    def set_result_sink(self, sink):
+        """
+        TYPE: ResultSink -> void
+        Pass the type and queries of every object removed from now on 
+        to the add method of a sink (see results.py), instead of saving 
+        them in the results dictionary.
+        """
+        raise NotImplementedError()
+
+    def get_aggregates(self):
+        """
+        TYPE: void -> Aggregates
+        Return the aggregates of the live objects (see aggregates.py), 
+        kept up to date as the model changes, for data collectors to 
+        read instead of scanning every object. Only available if the 
+        model was created with aggregates=True.
+        """
+        raise NotImplementedError()
+
+    def get_call_stack(self):
+        """
+        TYPE: void -> CallStack
+        Return the call stack the stack references of method calls are 
+        kept in per call frame (see callstack.py), or None if the model 
+        was created without call_frames=True, in which case the calls 
+        only add and remove the references themselves.
+        """
+        raise NotImplementedError()
+
+    def save_state(self):
+        """
+        TYPE: void -> dict
+        Return the state of the model as a dictionary that can be 
+        pickled, including the objects and references, the state of 
+        the queries of every live and removed object, and the position 
+        in the files of the data collectors. The query factories 
+        themselves aren't saved.
+        """
+        raise NotImplementedError()
+
+    def load_state(self, state, restore_queries=True):
+        """
+        TYPE: dict * boolean -> void
+        Replace the state of the model with one returned by save_state. 
+        The model must have been initialised with the same query 
+        factories and data collectors. If restore_queries is False, only 
+        the objects and references are restored, the live objects get 
+        new queries and the results of removed objects are dropped.
         """
         raise NotImplementedError()
 
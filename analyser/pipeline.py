@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+import itertools
+import threading
+import traceback
+import Queue
+import multiprocessing
+
+# Reads the events of a log in a separate thread or process, so that
+# reading, decompressing and splitting the log overlaps with updating
+# the model (see analyser.run with pipeline="thread" or "process").
+#
+# The reader iterates over a LogStream and puts the events in batches
+# of batch_size on a queue of at most queue_size batches, blocking when
+# the queue is full so that it doesn't run ahead of the model by more
+# than that. Each batch is sent with the progress of the stream at its
+# first and last event, and the offset of the event after it.
+#
+# A thread shares the interpreter lock with the main thread, so only
+# the time spent waiting for the disk and decompressing gzip overlaps
+# with the model. A process runs in parallel, but its batches have to
+# be pickled, and unpickling a batch of split lines costs about as much
+# as splitting them. It pays off for compressed logs and binary traces,
+# which are more expensive to decode than to unpickle.
+#
+# The progress of an event is interpolated within its batch, and the
+# offset of the next event, for checkpoints, is only known at the end
+# of a batch.
+
+
+def read_batches(open_stream, offset, start, batch_size, put):
+    try:
+        stream = open_stream()
+        if offset is not None:
+            stream.seek(offset)
+        events = iter(stream)
+        if offset is None:
+            # Skip the first start events, before taking the progress of
+            # the first batch
+            for _ in itertools.islice(events, start):
+                pass
+        i = start
+        while True:
+            first = stream.progress(i)
+            batch = list(itertools.islice(events, batch_size))
+            if not batch:
+                break
+            i += len(batch)
+            put(("batch", batch, first, stream.progress(i), stream.tell()))
+        stream.close()
+        put(("end",))
+    except Exception:
+        put(("error", traceback.format_exc()))
+
+
+class PipelinedStream(object):
+    """
+    Iterate over the events of the stream returned by open_stream (a
+    LogStream), read in a separate thread, or a process if use_process
+    is set. With offset, the stream is first seeked to it, otherwise the
+    first start events are skipped. Either way, the events are numbered
+    from start, as in analyser.execute.
+    """
+
+    def __init__(self, open_stream, offset=None, start=0, batch_size=10000,
+                 queue_size=8, use_process=False):
+        if use_process:
+            self._queue = multiprocessing.Queue(queue_size)
+            self._reader = multiprocessing.Process(
+                target=read_batches,
+                args=(open_stream, offset, start, batch_size,
+                      self._queue.put))
+        else:
+            self._queue = Queue.Queue(queue_size)
+            self._reader = threading.Thread(
+                target=read_batches,
+                args=(open_stream, offset, start, batch_size,
+                      self._queue.put))
+        self._reader.daemon = True
+        self._started = False
+        self._start = start
+        # The current batch: index of its first event, number of events,
+        # progress at its first and last event, offset after it, and the
+        # number of its events consumed
+        self._batch = (start, 0, 0.0, 0.0, offset)
+        self._consumed = 0
+
+    def __iter__(self):
+        if self._started:
+            raise Exception("__iter__: "
+                            "Events can only be iterated over once")
+        self._started = True
+        self._reader.start()
+        return self._events()
+
+    def _events(self):
+        get = self._queue.get
+        i = self._start
+        while True:
+            item = get()
+            if item[0] == "end":
+                return
+            if item[0] == "error":
+                raise Exception("PipelinedStream: "
+                                "Reader failed:\n{0}".format(item[1]))
+            _, batch, first, last, offset = item
+            self._batch = (i, len(batch), first, last, offset)
+            self._consumed = 0
+            for event in batch:
+                self._consumed += 1
+                yield event
+            i += len(batch)
+
+    def progress(self, i):
+        start, count, first, last, _ = self._batch
+        if count == 0:
+            return first
+        if first is None or last is None:
+            # The stream doesn't know its progress
+            return None
+        return first + (last - first) * (i - start) / float(count)
+
+    def tell(self):
+        """
+        Return the offset of the next event, if all events of the current
+        batch have been consumed, otherwise None.
+        """
+        _, count, _, _, offset = self._batch
+        if self._consumed == count:
+            return offset
+        return None
+
+    def close(self):
+        # A reader thread blocked on a full queue is left to exit with
+        # the interpreter, it's a daemon
+        if self._started and \
+           isinstance(self._reader, multiprocessing.Process):
+            self._reader.terminate()
+            self._reader.join()
@@ -1,13 +1,39 @@
 #!usr/bin/env python
 import matplotlib.pyplot as plt
 import pandas as pd
+import numpy as np
 import argparse
 import os
+import columns
+
+# The results of data collectors are read from CSV files, or from the 
+# binary columns written by collectors without a string conversion 
+# (see columns.py). Those are downsampled to at most MAX_POINTS points 
+# before plotting, the minimum and maximum keeping their extremes.
+
+MAX_POINTS = 2000
+
+
+def load_columns(fn, names, reduce_fs):
+    """
+    Load the collected data in fn into a DataFrame with the given column 
+    names, reducing each column with the respective function of 
+    reduce_fs when downsampling binary columns.
+    """
+    if not fn.endswith(".npy"):
+        return pd.read_csv(fn, names=names)
+    data = columns.read_columns(fn)
+    if data is None:
+        return pd.DataFrame(columns=names)
+    return pd.DataFrame(dict(
+        (name, columns.downsample(data[field], MAX_POINTS, how)) \
+        for name, field, how in zip(names, data.dtype.names, reduce_fs)),
+        columns=names)
 
 
 def plot_min_max_avg(min_max_avg_fn):
-    df = pd.read_csv(min_max_avg_fn,
-                     names=["Progress", "Min", "Max", "Avg"])
+    df = load_columns(min_max_avg_fn, ["Progress", "Min", "Max", "Avg"],
+                      [np.mean, np.min, np.max, np.mean])
     fig = plt.figure(figsize=(12, 8))
     ax = plt.gca()
     df.plot(kind="line", x="Progress", y="Min", color="yellow", ax=ax)
@@ -22,8 +48,8 @@ def plot_min_max_avg(min_max_avg_fn):
 
 
 def plot_bltin_vs_custom(bltin_vs_custom_fn):
-    df = pd.read_csv(bltin_vs_custom_fn,
-                     names=["Progress", "Built-in", "Custom"])
+    df = load_columns(bltin_vs_custom_fn, ["Progress", "Built-in", "Custom"],
+                      [np.mean, np.mean, np.mean])
     fig = plt.figure(figsize=(12, 8))
     ax = plt.gca()
     df.plot(kind="line", x="Progress", y="Built-in", color="blue", ax=ax)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+
+# Opt-in instrumentation of an execution (see analyser.execute).
+#
+# When a Profiler is passed to execute(), the events, the handlers of the
+# opcodes, the query passes and the data collectors are wrapped to keep
+# cumulative times and call counts. Without one, execute() runs exactly
+# as before, so profiling costs nothing when it's disabled.
+#
+# The phases of an execution are:
+#
+#   read     Reading the log into memory (not done when streaming)
+#   parse    Reading and splitting the events, while iterating over them
+#   process  Updating the model, the sum of the times of the opcodes
+#   query    Applying the queries
+#   collect  Running the data collectors
+#   other    The rest, e.g. reporting progress and saving checkpoints
+#
+# With per_query=True, the queries of an object are applied one at a
+# time to time them separately, by the function passed to the model's
+# apply_queries, which still skips the objects that aren't active and
+# retires those whose queries are all frozen. For a model evaluating
+# the queries of all objects at once (CompactModel with
+# vectorize_queries=True), this makes the query phase slower than
+# without profiling.
+
+OPCODE_NAMES = {"1": "ALLOC",
+                "2": "FLOAD",
+                "3": "FSTORE",
+                "4": "MCALL",
+                "5": "DEALLOC",
+                "6": "MEXIT",
+                "7": "VSTORE"}
+
+
+class Profiler(object):
+
+    def __init__(self, per_query=True, sample_rate=10000):
+        self.per_query = per_query
+        self.sample_rate = sample_rate
+        self.phases = dict.fromkeys(["read", "parse", "process", "query",
+                                     "collect", "other"], 0.0)
+        self.total = 0.0
+        # Opcode name -> [calls, time]
+        self.opcodes = {}
+        # Lists of [name, calls, time], in the order of the collectors
+        # and queries of the model
+        self.collectors = []
+        # The names of the queries are only known once the queries of an
+        # object are seen
+        self.queries = []
+        self.query_passes = 0
+        self.query_objs = 0
+        # (event index, seconds since start, events/sec since the
+        # previous sample)
+        self.samples = []
+
+    def add_time(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    def events(self, events, start=0):
+        """
+        Iterate over the events, timing the iteration itself and taking
+        event rate samples.
+        """
+        clock = time.time
+        it = iter(events)
+        begin = last_t = clock()
+        last_i = start
+        sample_rate = self.sample_rate
+        i = start
+        parse_time = 0.0
+        try:
+            while True:
+                t = clock()
+                try:
+                    event = next(it)
+                except StopIteration:
+                    break
+                parse_time += clock() - t
+                yield event
+                i += 1
+                if (i - start) % sample_rate == 0:
+                    t = clock()
+                    self.samples.append((i, t - begin,
+                                         (i - last_i) / max(t - last_t,
+                                                            1e-9)))
+                    last_i, last_t = i, t
+        finally:
+            self.phases["parse"] += parse_time
+
+    def handlers(self, handlers, unknown):
+        """
+        Return the handlers of the opcodes and the handler of unknown 
+        opcodes, wrapped to be timed.
+        """
+        timed = dict((opcode, self._timed_handler(OPCODE_NAMES[opcode],
+                                                  handler)) \
+                     for opcode, handler in handlers.iteritems())
+        return timed, self._timed_handler("(unknown)", unknown)
+
+    def _timed_handler(self, name, handler):
+        stats = self.opcodes.setdefault(name, [0, 0.0])
+        clock = time.time
+        def timed(model, event):
+            t = clock()
+            handler(model, event)
+            stats[1] += clock() - t
+            stats[0] += 1
+        return timed
+
+    def query_applier(self, model):
+        """
+        Return a function applying the queries of a list of objects,
+        timing each query if per_query is set.
+        """
+        clock = time.time
+        def apply(obj_ids):
+            start = clock()
+            if self.per_query:
+                self._apply_each(model, obj_ids)
+            else:
+                model.apply_queries(obj_ids)
+            self.phases["query"] += clock() - start
+            self.query_passes += 1
+            self.query_objs += len(obj_ids)
+        return apply
+
+    def _apply_each(self, model, obj_ids):
+        # The model still skips the inactive objects, and retires those 
+        # whose queries are all frozen afterwards
+        clock = time.time
+        stats = self.queries
+        def apply_query(i, qry):
+            if i == len(stats):
+                stats.append([qry.toString(), 0, 0.0])
+            t = clock()
+            qry.apply()
+            s = stats[i]
+            s[2] += clock() - t
+            s[1] += 1
+        model.apply_queries(obj_ids, apply_query)
+
+    def install_collectors(self, model):
+        """
+        Wrap the data collectors of the model to be timed. Returns the
+        original collectors, to be restored with restore_collectors.
+        """
+        original = model.data_collectors
+        model.data_collectors = [(save_file,
+                                  self._timed_collector(save_file.name, func),
+                                  to_str) \
+                                 for save_file, func, to_str in original]
+        return original
+
+    def restore_collectors(self, model, original):
+        model.data_collectors = original
+
+    def _timed_collector(self, name, func):
+        stats = [os.path.basename(name), 0, 0.0]
+        self.collectors.append(stats)
+        clock = time.time
+        def timed(model):
+            t = clock()
+            result = func(model)
+            stats[2] += clock() - t
+            stats[1] += 1
+            return result
+        return timed
+
+    def finish(self, total):
+        """
+        Set the total time of the execution, apart from reading the log.
+        """
+        self.total = total
+        self.phases["process"] = sum(t for _, t in self.opcodes.values())
+        self.phases["collect"] = sum(t for _, _, t in self.collectors)
+        self.phases["other"] = max(0.0, total -
+                                        self.phases["parse"] -
+                                        self.phases["process"] -
+                                        self.phases["query"] -
+                                        self.phases["collect"])
+
+    def report(self):
+        """
+        Return the measurements as a dict, which can be serialised as
+        JSON.
+        """
+        stats = lambda calls, seconds: {"calls": calls, "time": seconds}
+        events = sum(calls for calls, _ in self.opcodes.values())
+        return {
+            "total": self.total,
+            "events": events,
+            "events_per_sec": events / self.total if self.total else 0.0,
+            "phases": dict(self.phases),
+            "opcodes": dict((name, stats(*s)) \
+                            for name, s in self.opcodes.iteritems()),
+            "queries": [dict(stats(calls, seconds), name=name) \
+                        for name, calls, seconds in self.queries],
+            "query_passes": self.query_passes,
+            "query_objs": self.query_objs,
+            "collectors": [dict(stats(calls, seconds), name=name) \
+                           for name, calls, seconds in self.collectors],
+            "samples": list(self.samples)}
+
+
+def print_report(report, out_file=sys.stdout):
+    stdout = sys.stdout
+    sys.stdout = out_file
+
+    total = report["total"] or 1e-9
+    print "\nPROFILE\n"
+    print "Events: {0}, {1:.0f} events/s".format(report["events"],
+                                                  report["events_per_sec"])
+    print "\nPhases:"
+    for phase in ["read", "parse", "process", "query", "collect", "other"]:
+        seconds = report["phases"][phase]
+        print "-- {0: <8} {1: >9.3f}s {2: >6.1f}%" \
+              .format(phase, seconds, seconds / total * 100)
+
+    def print_stats(title, stats):
+        print "\n{}:".format(title)
+        for s in sorted(stats, key=lambda s: -s["time"]):
+            if not s["calls"]:
+                continue
+            per_call = s["time"] / s["calls"] * 1e6
+            print "-- {0: >9.3f}s {1: >10} calls {2: >9.2f}us/call  {3}" \
+                  .format(s["time"], s["calls"], per_call, s["name"])
+
+    print_stats("Opcodes", [dict(s, name=name) \
+                            for name, s in report["opcodes"].iteritems()])
+    if report["queries"]:
+        print_stats("Queries", report["queries"])
+    print "\nQuery passes: {0}, objects: {1}".format(report["query_passes"],
+                                                     report["query_objs"])
+    if report["collectors"]:
+        print_stats("Data collectors", report["collectors"])
+
+    sys.stdout = stdout
@@ -19,5 +19,14 @@ class Query(object):
     def clone(self):
         raise NotImplementedError()
 
+    # The state of a query, without the functions it was created with, 
+    # so that it can be saved to disk and set on a new query created 
+    # by the same query factory.
+    def getState(self):
+        raise NotImplementedError()
+
+    def setState(self, state):
+        raise NotImplementedError()
+
     def toString(self):
         raise NotImplementedError()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+import query
+from combinators import *
+
+# Compiles the query factories of a model into a single flat program.
+#
+# Instead of every object carrying its own tree of combinator objects,
+# the factories are run once, against a cursor standing in for the
+# model. The resulting combinator trees are flattened in pre-order into
+# arrays of opcodes, parent indices and children, shared by all
+# objects. The only thing an object then carries is a bytearray with
+# one byte of state per combinator node.
+#
+# This relies on the getters of Observe only fetching information about
+# the object the query was created for (see the Model docstring). The
+# cursor forwards every call to the model, replacing the object ID
+# argument with the ID of the object currently being evaluated.
+
+
+OBSERVE, NOT, EVER, ALWAYS, IMMEDIATELY, ANY, ALL = range(7)
+
+# Bits of the state byte of a node
+VAL = 1  # Observe: value, Ever: success, Always: failure, Immediately: done
+SET = 2  # Observe: has been applied at least once
+ACC = 4  # isAccepting
+FRZ = 8  # isFrozen
+
+
+class Cursor(object):
+    """
+    Stand-in for the model passed to the query factories during
+    compilation. Any method called on it is forwarded to the model,
+    with the first argument (the object ID) replaced by obj_id.
+    """
+
+    def __init__(self, model):
+        self._model = model
+        self.obj_id = None
+
+    def __getattr__(self, name):
+        method = getattr(self._model, name)
+        cursor = self
+        def call(obj_id, *args):
+            return method(cursor.obj_id, *args)
+        # Cache the forwarding function, __getattr__ is only called for
+        # attributes that aren't found
+        setattr(self, name, call)
+        return call
+
+
+class Program(object):
+
+    def __init__(self, model, qry_fs):
+        self.cursor = Cursor(model)
+        self.ops = []
+        self.parents = []
+        self.children = []
+        self.tsts = []
+        self.roots = []
+        self.names = []
+        for qf in qry_fs:
+            template = qf(self.cursor, None)
+            start = len(self.ops)
+            self._flatten(template, -1)
+            self.roots.append((start, len(self.ops)))
+            self.names.append(template.toString())
+        self._active = bytearray(len(self.ops))
+        self._initial = self._initial_state()
+
+    def _flatten(self, q, parent):
+        i = len(self.ops)
+        self.parents.append(parent)
+        self.tsts.append(None)
+        self.children.append(())
+        if isinstance(q, Observe):
+            self.ops.append(OBSERVE)
+            self.tsts[i] = q.tst
+            return
+        if isinstance(q, Not):
+            self.ops.append(NOT)
+            subqueries = [q.q]
+        elif isinstance(q, Ever):
+            self.ops.append(EVER)
+            subqueries = [q.q]
+        elif isinstance(q, Always):
+            self.ops.append(ALWAYS)
+            subqueries = [q.q]
+        elif isinstance(q, Immediately):
+            self.ops.append(IMMEDIATELY)
+            subqueries = [q.q]
+        elif isinstance(q, Any):
+            self.ops.append(ANY)
+            subqueries = q.qs
+        elif isinstance(q, All):
+            self.ops.append(ALL)
+            subqueries = q.qs
+        else:
+            raise Exception("Program: "
+                            "Can't compile query {0}" \
+                            .format(q.toString()))
+        children = []
+        for subquery in subqueries:
+            children.append(len(self.ops))
+            self._flatten(subquery, i)
+        self.children[i] = tuple(children)
+
+    def _initial_state(self):
+        state = bytearray(len(self.ops))
+        for i in xrange(len(self.ops) - 1, -1, -1):
+            op = self.ops[i]
+            if op == ALWAYS:
+                state[i] = ACC
+            elif op == IMMEDIATELY:
+                state[i] = state[self.children[i][0]] & ACC
+            elif op != OBSERVE and op != EVER:
+                self._update(state, i)
+        return state
+
+    def _update(self, state, i):
+        # Recompute the state of node i from the state of its children,
+        # after they have been applied
+        op = self.ops[i]
+        if op == NOT:
+            c = state[self.children[i][0]]
+            state[i] = (c & FRZ) | (0 if c & ACC else ACC)
+        elif op == EVER:
+            if state[self.children[i][0]] & ACC:
+                state[i] = VAL | ACC | FRZ
+        elif op == ALWAYS:
+            if not state[self.children[i][0]] & ACC:
+                state[i] = VAL | FRZ
+        elif op == IMMEDIATELY:
+            state[i] = VAL | FRZ | (state[self.children[i][0]] & ACC)
+        elif op == ANY:
+            cs = [state[c] & (ACC | FRZ) for c in self.children[i]]
+            acc = ACC in [c & ACC for c in cs]
+            frz = (ACC | FRZ) in cs or all(c == FRZ for c in cs)
+            state[i] = (ACC if acc else 0) | (FRZ if frz else 0)
+        elif op == ALL:
+            cs = [state[c] & (ACC | FRZ) for c in self.children[i]]
+            acc = all(c & ACC for c in cs)
+            frz = FRZ in cs or all(c == ACC | FRZ for c in cs)
+            state[i] = (ACC if acc else 0) | (FRZ if frz else 0)
+
+    def new_state(self):
+        return bytearray(self._initial)
+
+    def apply(self, obj_id, state, start=0, end=None):
+        """
+        Apply the queries in the node range [start, end) to the given
+        state, by default all of them. The range has to cover whole
+        query trees.
+        """
+        if end is None:
+            end = len(self.ops)
+        self.cursor.obj_id = obj_id
+        ops, parents, tsts, active = \
+            self.ops, self.parents, self.tsts, self._active
+        # Pre-order pass, finding the nodes that aren't frozen and don't
+        # have a frozen ancestor, and applying the Observe nodes among
+        # them. Frozen queries return early from apply().
+        for i in xrange(start, end):
+            p = parents[i]
+            if state[i] & FRZ or (p >= 0 and not active[p]):
+                active[i] = 0
+                continue
+            active[i] = 1
+            if ops[i] == OBSERVE:
+                state[i] = SET | (VAL | ACC if tsts[i]() else 0)
+        # Post-order pass, updating the other applied nodes bottom-up
+        for i in xrange(end - 1, start - 1, -1):
+            if active[i] and ops[i] != OBSERVE:
+                self._update(state, i)
+
+    def is_accepting(self, state, root):
+        i = self.roots[root][0]
+        if self.ops[i] == OBSERVE and not state[i] & SET:
+            # Like an Observe query that has never been applied
+            return None
+        return state[i] & ACC != 0
+
+    def is_frozen(self, state, root):
+        return state[self.roots[root][0]] & FRZ != 0
+
+    def all_frozen(self, state):
+        """
+        Return True if all queries of the state are frozen, so that
+        applying them again changes nothing.
+        """
+        for start, _ in self.roots:
+            if not state[start] & FRZ:
+                return False
+        return True
+
+
+class CompiledQueries(object):
+    """
+    The queries of an object, as a sequence of Query objects wrapping
+    the object's state for each of the queries in the program.
+    """
+    __slots__ = ["program", "obj_id", "state"]
+
+    def __init__(self, program, obj_id, state):
+        self.program = program
+        self.obj_id = obj_id
+        self.state = state
+
+    def __len__(self):
+        return len(self.program.roots)
+
+    def __getitem__(self, root):
+        if not 0 <= root < len(self.program.roots):
+            raise IndexError(root)
+        return CompiledQuery(self, root)
+
+    def __iter__(self):
+        for root in xrange(len(self.program.roots)):
+            yield CompiledQuery(self, root)
+
+    def apply(self):
+        self.program.apply(self.obj_id, self.state)
+
+
+class CompiledQuery(query.Query):
+    __slots__ = ["queries", "root"]
+
+    def __init__(self, queries, root):
+        self.queries = queries
+        self.root = root
+
+    def apply(self):
+        start, end = self.queries.program.roots[self.root]
+        self.queries.program.apply(self.queries.obj_id,
+                                   self.queries.state, start, end)
+
+    def isAccepting(self):
+        return self.queries.program.is_accepting(self.queries.state,
+                                                 self.root)
+
+    def isFrozen(self):
+        return self.queries.program.is_frozen(self.queries.state, self.root)
+
+    def clone(self):
+        return CompiledQuery(CompiledQueries(self.queries.program,
+                                             self.queries.obj_id,
+                                             bytearray(self.queries.state)),
+                             self.root)
+
+    def toString(self):
+        return self.queries.program.names[self.root]
+
+    def getState(self):
+        start, end = self.queries.program.roots[self.root]
+        return str(bytearray(self.queries.state[start:end]))
+
+    def setState(self, state):
+        start, end = self.queries.program.roots[self.root]
+        self.queries.state[start:end] = bytearray(state)
+
+
+# The properties of an object the getters of the model depend on, for
+# evaluating the queries only on the objects changed in one of the
+# properties they depend on (see Model.set_query_deps). The getters a
+# query calls are taken from the names used in the code of its Observe
+# functions. Any other name may hide a call to something else, so a
+# query using one is taken to depend on all properties.
+
+GETTER_DEPS = {"in_stack_refs": "in",
+               "in_heap_refs": "in",
+               "in_total_refs": "in",
+               "out_stack_refs": "out",
+               "out_heap_refs": "out",
+               "out_total_refs": "out",
+               "get_obj_type": "type",
+               "is_instance_of": "type",
+               "is_builtin": "type",
+               "owner_count": "reach",
+               "get_owner": "reach",
+               "is_root": "reach",
+               "is_reachable": "reach",
+               "is_owned": "reach"}
+
+ALL_DEPS = frozenset(GETTER_DEPS.values())
+
+
+def code_deps(code):
+    deps = set()
+    for name in code.co_names:
+        if name not in GETTER_DEPS:
+            return ALL_DEPS
+        deps.add(GETTER_DEPS[name])
+    # Functions defined within the function, e.g. nested lambdas
+    for const in code.co_consts:
+        if hasattr(const, "co_names"):
+            deps |= code_deps(const)
+    return frozenset(deps)
+
+
+def query_deps(qry_fs):
+    """
+    Return the set of properties, out of ALL_DEPS, that the queries
+    created by the given factories depend on.
+    """
+    try:
+        program = Program(None, qry_fs)
+    except Exception:
+        # Queries that can't be compiled can't be inspected either
+        return ALL_DEPS
+    deps = set()
+    for tst in program.tsts:
+        if tst is None:
+            continue
+        code = getattr(tst, "__code__", None)
+        if code is None:
+            return ALL_DEPS
+        deps |= code_deps(code)
+    return frozenset(deps)
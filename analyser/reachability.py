@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+# The ownership and reachability of the objects of a GraphModel, kept up
+# to date as references are added and removed, for queries about more
+# than the references of the object itself (see GraphModel.owner_count,
+# get_owner, is_root, is_reachable and is_owned).
+#
+# The owners of an object are the other objects with a heap reference to
+# it. The roots are the static classes, i.e. the class names used as
+# object IDs (see symbols.py), and the objects referenced from the stack
+# frame of a method. An object is reachable if there's a path of heap
+# references to it from a root.
+#
+# The number of owners of each object is updated when the heap
+# references between two objects go from zero to one or back. Adding a
+# heap reference from a reachable object to an unreachable one, or
+# making an unreachable object a root, marks it and the unreachable
+# objects reachable from it, which is only a search over the objects
+# that just became reachable.
+#
+# Removing a reference or a root can only make the objects reachable
+# from its referee unreachable. The referee is only remembered as a
+# suspect, and the suspects are resolved in a batch when the index is
+# read (see resolve): the reachable objects reachable from a suspect are
+# candidates, the candidates that are roots or have an owner that isn't
+# a candidate are still reachable, along with the candidates reachable
+# from them, and the other candidates aren't anymore. The work is
+# proportional to the objects reachable from the suspects, not to the
+# size of the heap.
+#
+# An object that is reachable, isn't a root and has a single owner is
+# only reachable through that owner, which therefore dominates it. This
+# is the only dominance kept, the dominator tree of the whole heap
+# can't be kept up to date cheaply, but can be computed from a snapshot
+# (see snapshot.py).
+#
+# The objects whose owner count, root status or reachability change are
+# passed to on_change, which the model uses to mark them dirty.
+
+
+class ReachabilityIndex(object):
+
+    def __init__(self, graph, on_change):
+        """
+        Index the objects and references of a networkx DiGraph with the
+        node and edge attributes of GraphModel. on_change is only called
+        for the changes after this.
+        """
+        self._nodes = graph._node
+        self._succ = graph._succ
+        self._pred = graph._pred
+        self._on_change = None
+        # Object -> number of owners
+        self.owners = {}
+        self.reachable = set()
+        # Reachable objects that may have become unreachable
+        self._suspects = set()
+        for obj_id, preds in self._pred.iteritems():
+            self.owners[obj_id] = sum(1 for referrer_id, refs \
+                                      in preds.iteritems() \
+                                      if refs["heap"] and \
+                                         referrer_id != obj_id)
+        for obj_id in self._nodes:
+            if obj_id not in self.reachable and self.is_root(obj_id):
+                self._reach(obj_id)
+        self._on_change = on_change
+
+    def is_root(self, obj_id):
+        return obj_id < 0 or self._nodes[obj_id]["in_stack"] > 0
+
+    def _notify(self, obj_id):
+        if self._on_change is not None:
+            self._on_change(obj_id)
+
+    def _reach(self, obj_id):
+        # Mark an object and the unreachable objects reachable from it
+        reachable = self.reachable
+        succ = self._succ
+        reachable.add(obj_id)
+        self._notify(obj_id)
+        stack = [obj_id]
+        while stack:
+            for referee_id, refs in succ[stack.pop()].iteritems():
+                if refs["heap"] and referee_id not in reachable:
+                    reachable.add(referee_id)
+                    self._notify(referee_id)
+                    stack.append(referee_id)
+
+    def add_obj(self, obj_id):
+        self.owners[obj_id] = 0
+        if obj_id < 0:
+            self._reach(obj_id)
+
+    def remove_obj(self, obj_id):
+        """
+        Forget an object, before its references are removed along with
+        it.
+        """
+        nodes = self._nodes
+        for referee_id, refs in self._succ[obj_id].iteritems():
+            if referee_id == obj_id:
+                continue
+            if refs["heap"]:
+                self.owners[referee_id] -= 1
+                self._notify(referee_id)
+            elif nodes[referee_id]["in_stack"] == refs["stack"] and \
+                 referee_id >= 0:
+                # No longer a root
+                self._notify(referee_id)
+            else:
+                continue
+            if referee_id in self.reachable:
+                self._suspects.add(referee_id)
+        del self.owners[obj_id]
+        self.reachable.discard(obj_id)
+        self._suspects.discard(obj_id)
+
+    def add_ref(self, referrer_id, referee_id, refs, kind):
+        """
+        Update the index after a reference was added, refs being the
+        reference counts of the edge.
+        """
+        if kind == "heap":
+            if refs["heap"] != 1 or referrer_id == referee_id:
+                return
+            self.owners[referee_id] += 1
+            self._notify(referee_id)
+            if referrer_id in self.reachable and \
+               referee_id not in self.reachable:
+                self._reach(referee_id)
+        elif self._nodes[referee_id]["in_stack"] == 1:
+            # New root
+            self._notify(referee_id)
+            if referee_id not in self.reachable:
+                self._reach(referee_id)
+
+    def remove_ref(self, referrer_id, referee_id, refs, kind):
+        """
+        Update the index after a reference was removed, refs being the
+        reference counts of the edge.
+        """
+        if kind == "heap":
+            if refs["heap"] != 0 or referrer_id == referee_id:
+                return
+            self.owners[referee_id] -= 1
+            self._notify(referee_id)
+        elif self._nodes[referee_id]["in_stack"] == 0 and referee_id >= 0:
+            # No longer a root
+            self._notify(referee_id)
+        else:
+            return
+        if referee_id in self.reachable:
+            self._suspects.add(referee_id)
+
+    def resolve(self):
+        """
+        Unmark the suspects, and the objects reachable from them, that
+        aren't reachable anymore.
+        """
+        if not self._suspects:
+            return
+        reachable = self.reachable
+        succ = self._succ
+        pred = self._pred
+        # A suspect that is a root is still reachable, and so is every
+        # object reachable from it
+        stack = [obj_id for obj_id in self._suspects \
+                 if obj_id in reachable and not self.is_root(obj_id)]
+        self._suspects = set()
+        candidates = set()
+        while stack:
+            obj_id = stack.pop()
+            if obj_id in candidates:
+                continue
+            candidates.add(obj_id)
+            for referee_id, refs in succ[obj_id].iteritems():
+                if refs["heap"] and referee_id in reachable and \
+                   referee_id not in candidates:
+                    stack.append(referee_id)
+        # The objects outside the candidates are still reachable
+        stack = [obj_id for obj_id in candidates \
+                 if self.is_root(obj_id) or \
+                    any(refs["heap"] and referrer_id in reachable and \
+                        referrer_id not in candidates \
+                        for referrer_id, refs in pred[obj_id].iteritems())]
+        rescued = set()
+        while stack:
+            obj_id = stack.pop()
+            if obj_id in rescued:
+                continue
+            rescued.add(obj_id)
+            for referee_id, refs in succ[obj_id].iteritems():
+                if refs["heap"] and referee_id in candidates and \
+                   referee_id not in rescued:
+                    stack.append(referee_id)
+        for obj_id in candidates:
+            if obj_id not in rescued:
+                reachable.discard(obj_id)
+                self._notify(obj_id)
+
+    def get_owner(self, obj_id):
+        """
+        Return the ID of the only owner of an object, or None if it
+        doesn't have exactly one.
+        """
+        if self.owners[obj_id] != 1:
+            return None
+        for referrer_id, refs in self._pred[obj_id].iteritems():
+            if refs["heap"] and referrer_id != obj_id:
+                return referrer_id
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+import csv
+import columns
+
+# Streaming retention of the results of an execution.
+#
+# By default, a model keeps the queries of every removed object in its
+# results dictionary until the end of the execution, which over a long
+# log holds the combinators of every object that ever lived. When a
+# ResultSink is set on the model (see Model.set_result_sink), the
+# queries of a removed object are instead finalised right away into
+# whether each of them is accepting and frozen. Those are added to
+# running counts per query, optionally written as a row to a file, and
+# the queries are dropped.
+#
+# The rows are tab separated, starting with a header line:
+#
+#   #id   type   site   <query 1>   <query 2>   ...
+#   12    [C     Main   A-          -F          ...
+#
+# where A means accepting and F frozen.
+#
+# The counts are also kept per type and per allocation site of the
+# objects, the class that allocated them (see Model.get_obj_site).
+
+
+class FinalQuery(object):
+    """
+    The final state of a query, answering toString, isAccepting and
+    isFrozen like the query itself.
+    """
+
+    __slots__ = ["name", "accepting", "frozen"]
+
+    def __init__(self, name, accepting, frozen):
+        self.name = name
+        self.accepting = accepting
+        self.frozen = frozen
+
+    def isAccepting(self):
+        return self.accepting
+
+    def isFrozen(self):
+        return self.frozen
+
+    def toString(self):
+        return self.name
+
+
+class ResultSink(object):
+    """
+    Finalise the queries of objects as they are removed. With rows_fn,
+    a row per object is written to that file. With keep=True, the final
+    states are also kept per object, as FinalQuery lists in a results
+    dictionary like that of a model, which takes far less memory than
+    the queries themselves.
+    """
+
+    def __init__(self, rows_fn=None, keep=False):
+        self.keep = keep
+        self.results = {}
+        self.count = 0
+        # Per query index, known from the first object added
+        self.names = None
+        self.accepting = []
+        self.frozen = []
+        # Type or site -> [number of objects, accepting count per query]
+        self.types = {}
+        self.sites = {}
+        # Only opened when first written, not to truncate the rows of an
+        # execution resumed with load_state (see columns.py)
+        self._rows = columns.OutputFile(rows_fn) if rows_fn is not None \
+                     else None
+        # The object IDs are written as their tokens in the log
+        self.symbols = None
+
+    def set_symbols(self, symbol_table):
+        self.symbols = symbol_table
+
+    def add(self, obj_id, obj_type, queries, site="(unknown)"):
+        if self.names is None:
+            self._set_names([qry.toString() for qry in queries])
+        states = [(bool(qry.isAccepting()), bool(qry.isFrozen())) \
+                  for qry in queries]
+        accepting, frozen = self.accepting, self.frozen
+        for i, (a, f) in enumerate(states):
+            if a:
+                accepting[i] += 1
+            if f:
+                frozen[i] += 1
+        self.count += 1
+        for groups, key in [(self.types, obj_type), (self.sites, site)]:
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0, [0] * len(states)]
+            group[0] += 1
+            counts = group[1]
+            for i, (a, _) in enumerate(states):
+                if a:
+                    counts[i] += 1
+        if self._rows is not None:
+            self._rows.write("{0}\t{1}\t{2}\t{3}\n".format(
+                obj_id if self.symbols is None \
+                else self.symbols.format_id(obj_id),
+                obj_type, site,
+                "\t".join(("A" if a else "-") + ("F" if f else "-") \
+                          for a, f in states)))
+        if self.keep:
+            names = self.names
+            self.results[obj_id] = \
+                {"type": obj_type,
+                 "queries": [FinalQuery(names[i], a, f) \
+                             for i, (a, f) in enumerate(states)]}
+
+    def _set_names(self, names):
+        self.names = names
+        self.accepting = [0] * len(names)
+        self.frozen = [0] * len(names)
+        if self._rows is not None:
+            self._rows.write("#id\ttype\tsite\t{0}\n" \
+                             .format("\t".join(names)))
+
+    def query_stats(self, start=0, end=None):
+        """
+        Return the number of objects with each query in accepting state,
+        keyed by the string of the query, for the queries from index
+        start to end (see Model.get_query_sets).
+        """
+        if self.names is None:
+            return {}
+        return self._merge(self.accepting, start, end)
+
+    def frozen_stats(self, start=0, end=None):
+        """
+        Return the number of objects with each query in frozen state, 
+        as in query_stats.
+        """
+        if self.names is None:
+            return {}
+        return self._merge(self.frozen, start, end)
+
+    def _merge(self, counts, start, end):
+        # Queries with the same string are counted together
+        stats = {}
+        for i in xrange(start, len(self.names) if end is None else end):
+            name = self.names[i]
+            stats[name] = stats.get(name, 0) + counts[i]
+        return stats
+
+    def _group_stats(self, groups, start, end):
+        return dict((key, {"objects": count,
+                           "accepting": self._merge(counts, start, end)}) \
+                    for key, (count, counts) in groups.iteritems())
+
+    def type_stats(self, start=0, end=None):
+        """
+        Return the number of objects of each type, and the number of
+        them with each query in accepting state, as in query_stats.
+        """
+        return self._group_stats(self.types, start, end)
+
+    def site_stats(self, start=0, end=None):
+        """
+        Return the number of objects allocated by each class, and the
+        number of them with each query in accepting state, as in
+        query_stats.
+        """
+        return self._group_stats(self.sites, start, end)
+
+    def get_results(self):
+        return self.results.copy()
+
+    def save_state(self):
+        if self._rows is not None:
+            self._rows.flush()
+        return {"count": self.count,
+                "names": self.names,
+                "accepting": list(self.accepting),
+                "frozen": list(self.frozen),
+                "types": dict((key, [count, list(counts)]) \
+                              for key, (count, counts) \
+                              in self.types.iteritems()),
+                "sites": dict((key, [count, list(counts)]) \
+                              for key, (count, counts) \
+                              in self.sites.iteritems()),
+                "results": [(obj_id, r["type"],
+                             [(q.accepting, q.frozen) for q in r["queries"]]) \
+                            for obj_id, r in self.results.iteritems()],
+                "rows": self._rows.tell() if self._rows is not None \
+                        else None}
+
+    def load_state(self, state):
+        self.count = state["count"]
+        self.names = state["names"]
+        self.accepting = list(state["accepting"])
+        self.frozen = list(state["frozen"])
+        self.types = dict((key, [count, list(counts)]) \
+                          for key, (count, counts) \
+                          in state["types"].iteritems())
+        self.sites = dict((key, [count, list(counts)]) \
+                          for key, (count, counts) \
+                          in state["sites"].iteritems())
+        self.results = {}
+        for obj_id, obj_type, states in state["results"]:
+            self.results[obj_id] = \
+                {"type": obj_type,
+                 "queries": [FinalQuery(self.names[i], a, f) \
+                             for i, (a, f) in enumerate(states)]}
+        if self._rows is not None and state["rows"] is not None:
+            # Continue writing where the rows were at
+            self._rows.reopen(state["rows"])
+
+    def close(self):
+        if self._rows is not None:
+            self._rows.close()
+
+
+def write_group_stats(stats, out_fn):
+    """
+    Write the stats per type or site returned by a ResultSink to a CSV
+    file, a row per type or site with its number of objects and the
+    number of them with each query in accepting state.
+    """
+    names = sorted(set(name for group in stats.values() \
+                       for name in group["accepting"]))
+    with open(out_fn, "wb") as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(["key", "objects"] + names)
+        for key, group in sorted(stats.iteritems(),
+                                 key=lambda item: -item[1]["objects"]):
+            writer.writerow([key, group["objects"]] +
+                            [group["accepting"][name] for name in names])
@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+import traceback
+import multiprocessing
+import graphmodel
+import querycompiler
+from typetable import TypeTable, BUILTIN_PREFIXES
+
+# Evaluates the queries of a GraphModel in several worker processes.
+#
+# Most of the time of an execution is spent applying the queries, and
+# the queries of an object only depend on the properties of that object
+# (see the Model docstring). ShardedModel therefore keeps the reference
+# graph itself in the main process, where the events are processed as
+# usual, and partitions the objects and their queries over a number of
+# workers by their ID.
+#
+# Everything a worker needs to know is sent to it in a journal, in the
+# order it happened:
+#
+#   ("add", obj_id)                  Object added, create its queries
+#   ("reset", obj_id)                Queries of the object reset
+#   ("remove", obj_id)               Object removed, save its queries
+#   ("props", obj_id, type, in_stack, in_heap, out_stack, out_heap)
+#                                    Properties of a changed object
+#   ("apply", obj_id)                Apply the queries of an object
+#   ("apply_all",)                   Apply the queries of all objects
+#
+# Only the properties of the objects changed since the last query pass
+# are sent, the workers keep the properties of their other objects. The
+# journals are sent in batches of batch_size entries, and the workers
+# apply them while the main process continues with the next events.
+#
+# The query factories are inherited by the workers when they are forked,
+# so they don't have to be pickled. In the workers, the factories are
+# given a ShardState in place of the model, which answers the getters
+# of GraphModel (in_stack_refs, ..., is_builtin, get_obj_type) from the
+# properties it was sent. The reachability getters (is_reachable, ...)
+# depend on the whole graph, and aren't answered by the workers. At the
+# end of the execution, the states of the queries are sent back (see
+# Query.getState), and the queries are rebuilt in the main process to be
+# returned as results.
+#
+# Data collectors run in the main process, and see the reference graph
+# but not the queries. get_obj_queries returns copies of the queries
+# fetched from the workers, so applying them doesn't change the queries
+# kept by the workers. Profilers must therefore use per_query=False, as
+# the queries can't be applied one at a time, and QueryModes.CHECK,
+# which fetches the queries of every object, is correct but slow.
+# Checkpoints (save_state/load_state) aren't supported.
+#
+# Only the queries are evaluated in parallel. The events are still
+# processed one at a time in the main process, which also journals the
+# changes of every object, so a run can't get faster than that. In
+# QueryModes.DIRTY and EVENTS, a pass only applies the queries of the
+# changed objects, which costs little next to journaling them, and the
+# workers don't speed these modes up. The workers only pay off for full
+# passes over large heaps, on a machine with a core per worker. They
+# have only been measured on a single core, where they can't make any
+# run faster.
+
+
+class ShardState(object):
+    """
+    Stand-in for the model in a worker, holding the properties of the
+    objects of its shard and their queries.
+    """
+
+    def __init__(self, qry_fs, compile_queries,
+                 builtin_prefixes=BUILTIN_PREFIXES):
+        self.qry_fs = qry_fs
+        self.program = querycompiler.Program(self, qry_fs) \
+                       if compile_queries else None
+        # The types are sent by name, and interned in the worker's own
+        # type table
+        self.types = TypeTable(builtin_prefixes)
+        # Object ID -> (type ID, in_stack, in_heap, out_stack, out_heap)
+        self.props = {}
+        self.queries = {}
+        self.removed = {}
+        # Objects with queries that aren't frozen yet, as in GraphModel
+        self.active = set()
+
+    def _new_queries(self, obj_id):
+        if self.program is not None:
+            return self.program.new_state()
+        return [qf(self, obj_id) for qf in self.qry_fs]
+
+    def save_queries(self, queries):
+        if self.program is not None:
+            return str(queries)
+        return [qry.getState() for qry in queries]
+
+    def add(self, obj_id):
+        self.props[obj_id] = (0, 0, 0, 0, 0)
+        self.queries[obj_id] = self._new_queries(obj_id)
+        self.active.add(obj_id)
+
+    def set_props(self, obj_id, obj_type, in_stack, in_heap,
+                  out_stack, out_heap):
+        self.props[obj_id] = (self.types.intern(obj_type), in_stack, in_heap,
+                              out_stack, out_heap)
+
+    def reset(self, obj_id):
+        self.queries[obj_id] = self._new_queries(obj_id)
+        self.active.add(obj_id)
+
+    def remove(self, obj_id):
+        del self.props[obj_id]
+        self.removed[obj_id] = self.save_queries(self.queries.pop(obj_id))
+        self.active.discard(obj_id)
+
+    def apply(self, obj_id):
+        if obj_id not in self.active:
+            return
+        queries = self.queries[obj_id]
+        if self.program is not None:
+            self.program.apply(obj_id, queries)
+            if self.program.all_frozen(queries):
+                self.active.discard(obj_id)
+            return
+        for qry in queries:
+            qry.apply()
+        if all(qry.isFrozen() for qry in queries):
+            self.active.discard(obj_id)
+
+    def apply_all(self):
+        for obj_id in list(self.active):
+            self.apply(obj_id)
+
+    # Getters used in queries, as in GraphModel
+
+    def get_obj_type(self, obj_id):
+        return self.types.names[self.props[obj_id][0]]
+
+    def in_stack_refs(self, obj_id):
+        return self.props[obj_id][1]
+
+    def in_heap_refs(self, obj_id):
+        return self.props[obj_id][2]
+
+    def in_total_refs(self, obj_id):
+        p = self.props[obj_id]
+        return p[1] + p[2]
+
+    def out_stack_refs(self, obj_id):
+        return self.props[obj_id][3]
+
+    def out_heap_refs(self, obj_id):
+        return self.props[obj_id][4]
+
+    def out_total_refs(self, obj_id):
+        p = self.props[obj_id]
+        return p[3] + p[4]
+
+    def is_instance_of(self, obj_id, obj_type):
+        return self.props[obj_id][0] == self.types.get_id(obj_type)
+
+    def is_builtin(self, obj_id):
+        return self.types.builtin[self.props[obj_id][0]]
+
+
+def run_worker(conn, qry_fs, compile_queries, builtin_prefixes):
+    state = ShardState(qry_fs, compile_queries, builtin_prefixes)
+    error = None
+    while True:
+        journal = conn.recv()
+        for entry in journal:
+            op = entry[0]
+            if op == "get":
+                conn.send((error, state.save_queries(state.queries[entry[1]]) \
+                                  if error is None else None))
+                continue
+            if op == "finish":
+                if error is not None:
+                    conn.send((error, None))
+                    return
+                live = dict((obj_id, state.save_queries(queries)) \
+                            for obj_id, queries in state.queries.iteritems())
+                conn.send((None, (state.removed, live)))
+                return
+            if error is not None:
+                continue
+            try:
+                if op == "props":
+                    state.set_props(*entry[1:])
+                elif op == "apply":
+                    state.apply(entry[1])
+                elif op == "apply_all":
+                    state.apply_all()
+                elif op == "add":
+                    state.add(entry[1])
+                elif op == "reset":
+                    state.reset(entry[1])
+                elif op == "remove":
+                    state.remove(entry[1])
+            except Exception:
+                # Reported when the results are fetched
+                error = traceback.format_exc()
+
+
+class ShardedModel(graphmodel.GraphModel):
+
+    def __init__(self, qry_fs, data_collectors=[], ref_dealloc=False,
+                 compile_queries=False, aggregates=False,
+                 builtin_prefixes=BUILTIN_PREFIXES, workers=4,
+                 batch_size=10000, call_frames=False):
+        self._workers = None
+        self._worker_count = workers
+        self._batch_size = batch_size
+        self._compile_worker_queries = compile_queries
+        # The main process keeps no queries of its own
+        graphmodel.GraphModel.__init__(self, qry_fs, data_collectors,
+                                       ref_dealloc, compile_queries=False,
+                                       aggregates=aggregates,
+                                       builtin_prefixes=builtin_prefixes,
+                                       call_frames=call_frames)
+        self._journals = [[] for _ in xrange(workers)]
+        self._pending = 0
+        # Objects whose properties haven't been sent since they changed
+        self._changed = set()
+        # Query states of the objects left at the end of the execution
+        self._final_states = None
+        self._result_program = None
+        # The queries of removed objects are only known at the end, so
+        # they're passed to the result sink by get_results, along with
+        # their allocation sites
+        self._final_sink = None
+        self._removed_sites = {}
+
+    def _shard(self, obj_id):
+        return hash(obj_id) % self._worker_count
+
+    def _journal(self, obj_id, entry):
+        self._journals[self._shard(obj_id)].append(entry)
+        self._pending += 1
+
+    def _start_workers(self):
+        # The workers are forked on first use, after the query sets
+        # have been set
+        self._workers = []
+        for _ in xrange(self._worker_count):
+            conn, worker_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=run_worker,
+                args=(worker_conn, self.qry_fs,
+                      self._compile_worker_queries,
+                      self._types.builtin_prefixes))
+            process.daemon = True
+            process.start()
+            worker_conn.close()
+            self._workers.append((process, conn))
+
+    def _flush(self):
+        if self._workers is None:
+            self._start_workers()
+        for i, journal in enumerate(self._journals):
+            if journal:
+                self._workers[i][1].send(journal)
+                self._journals[i] = []
+        self._pending = 0
+
+    def _request(self, i, entry):
+        # Send the journal of a worker, followed by a request, and
+        # return the reply
+        self._journals[i].append(entry)
+        self._flush()
+        error, reply = self._workers[i][1].recv()
+        if error is not None:
+            raise Exception("ShardedModel: "
+                            "Worker {0} failed:\n{1}" \
+                            .format(i, error))
+        return reply
+
+    def _rebuild_queries(self, obj_id, saved):
+        if self._compile_worker_queries:
+            if self._result_program is None:
+                self._result_program = querycompiler.Program(self,
+                                                             self.qry_fs)
+            return querycompiler.CompiledQueries(self._result_program,
+                                                 obj_id, bytearray(saved))
+        queries = [qf(self, obj_id) for qf in self.qry_fs]
+        for qry, qry_state in zip(queries, saved):
+            qry.setState(qry_state)
+        return queries
+
+    def _new_queries(self, obj_id):
+        return None
+
+    def _saved_queries(self, obj_id):
+        if self._final_sink is not None:
+            self._removed_sites[obj_id] = self.get_obj_site(obj_id)
+        self._journal(obj_id, ("remove", obj_id))
+        # Filled in by get_results
+        return None
+
+    def add_obj(self, obj_id, obj_type="(unknown)", site="(unknown)"):
+        graphmodel.GraphModel.add_obj(self, obj_id, obj_type, site)
+        self._journal(obj_id, ("add", obj_id))
+
+    def reset_obj_queries(self, obj_id):
+        graphmodel.GraphModel.reset_obj_queries(self, obj_id)
+        self._journal(obj_id, ("reset", obj_id))
+
+    def pop_dirty_obj_ids(self):
+        dirty = graphmodel.GraphModel.pop_dirty_obj_ids(self)
+        self._changed.update(dirty)
+        return dirty
+
+    def _send_changed(self):
+        nodes = self._g._node
+        self._changed.update(self._dirty)
+        for obj_id in self._changed:
+            n = nodes.get(obj_id)
+            if n is not None:
+                self._journal(obj_id, ("props", obj_id,
+                                       self._types.names[n["type"]],
+                                       n["in_stack"], n["in_heap"],
+                                       n["out_stack"], n["out_heap"]))
+        self._changed = set()
+
+    def apply_obj_queries(self, obj_id, apply_query=None):
+        if apply_query is not None:
+            raise Exception("apply_obj_queries: "
+                            "The queries are applied in the workers")
+        if not self._g.has_node(obj_id):
+            raise Exception("apply_obj_queries: "
+                            "Object {0} doesn't exist" \
+                            .format(obj_id))
+        self._send_changed()
+        self._journal(obj_id, ("apply", obj_id))
+        if self._pending >= self._batch_size:
+            self._flush()
+
+    def apply_queries(self, obj_ids, apply_query=None):
+        if apply_query is not None:
+            raise Exception("apply_queries: "
+                            "The queries are applied in the workers")
+        self._send_changed()
+        if len(obj_ids) == self._g.number_of_nodes():
+            # All objects
+            for journal in self._journals:
+                journal.append(("apply_all",))
+            self._pending += len(self._journals)
+            # Every object is up to date after a full pass
+            self._dirty = set()
+        else:
+            for obj_id in obj_ids:
+                self._journal(obj_id, ("apply", obj_id))
+        if self._pending >= self._batch_size:
+            self._flush()
+
+    def get_obj_queries(self, obj_id):
+        if not self._g.has_node(obj_id):
+            raise Exception("get_obj_queries: "
+                            "Object {0} doesn't exist" \
+                            .format(obj_id))
+        if self._final_states is not None:
+            saved = self._final_states[obj_id]
+        else:
+            saved = self._request(self._shard(obj_id), ("get", obj_id))
+        return self._rebuild_queries(obj_id, saved)
+
+    def set_query_sets(self, query_sets):
+        if self._workers is not None:
+            raise Exception("set_query_sets: "
+                            "Workers have already been started")
+        graphmodel.GraphModel.set_query_sets(self, query_sets)
+
+    def set_result_sink(self, sink):
+        self._final_sink = sink
+
+    def save_state(self):
+        raise Exception("save_state: "
+                        "Checkpoints aren't supported by ShardedModel")
+
+    def load_state(self, state, restore_queries=True):
+        raise Exception("load_state: "
+                        "Checkpoints aren't supported by ShardedModel")
+
+    def get_results(self):
+        results = graphmodel.GraphModel.get_results(self)
+        if self._workers is None:
+            self._start_workers()
+        removed, self._final_states = {}, {}
+        for i in xrange(self._worker_count):
+            worker_removed, worker_live = self._request(i, ("finish",))
+            removed.update(worker_removed)
+            self._final_states.update(worker_live)
+        for process, conn in self._workers:
+            process.join()
+            conn.close()
+        if self._final_sink is not None:
+            for obj_id, data in results.iteritems():
+                self._final_sink.add(obj_id, data["type"],
+                                     self._rebuild_queries(obj_id,
+                                                           removed[obj_id]),
+                                     self._removed_sites[obj_id])
+            self.results = {}
+            return {}
+        for obj_id, data in results.iteritems():
+            data["queries"] = self._rebuild_queries(obj_id, removed[obj_id])
+        # The results of removed objects are kept by the model as well
+        self.results = results.copy()
+        return results
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+import argparse
+import numpy as np
+
+# Snapshots of the heap, for analysing the whole reference graph at a
+# given moment offline (reachability, strongly connected components,
+# dominators, ...).
+#
+# The models only keep what the queries need, and building a networkx
+# graph on every event just to have it at some point would be far too
+# slow. Instead, a snapshot of the objects and references of any model
+# (see Model.get_refs) is taken at chosen events (see analyser.run) and
+# written to a .npz file of arrays:
+#
+#   index         The number of events processed before the snapshot
+#   ids           The object IDs, sorted (see symbols.py)
+#   types, sites  The type and allocation site of each object, as
+#                 indices into names
+#   names         The type and site names
+#   symbols       The names used as object IDs, for negative IDs
+#   indptr        The references in CSR format: the referees of the
+#   indices       object at position i in ids are at the positions
+#                 indices[indptr[i]:indptr[i + 1]], with stack and heap
+#   stack, heap   the number of stack and heap references
+#
+# A snapshot is loaded with load, and only turned into a networkx graph
+# or a SciPy sparse matrix on demand. SciPy is optional, only needed for
+# to_sparse.
+
+
+def save(snapshot_fn, model, index, symbol_table=None):
+    """
+    Write a snapshot of the objects and references of the model, after
+    index events.
+    """
+    ids = np.array(sorted(model.get_obj_ids()), dtype=np.int64)
+    names, name_ids = [], {}
+    def intern(name):
+        name_id = name_ids.get(name)
+        if name_id is None:
+            name_id = name_ids[name] = len(names)
+            names.append(name)
+        return name_id
+    types = np.array([intern(model.get_obj_type(obj_id)) for obj_id in ids],
+                     dtype=np.int32)
+    sites = np.array([intern(model.get_obj_site(obj_id)) for obj_id in ids],
+                     dtype=np.int32)
+    refs = model.get_refs()
+    referrers = np.array([ref[0] for ref in refs], dtype=np.int64)
+    referees = np.array([ref[1] for ref in refs], dtype=np.int64)
+    stack = np.array([ref[2] for ref in refs], dtype=np.int32)
+    heap = np.array([ref[3] for ref in refs], dtype=np.int32)
+    # Positions of the objects in ids, ordered by referrer then referee
+    rows = np.searchsorted(ids, referrers)
+    cols = np.searchsorted(ids, referees)
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    if len(ids) > 0:
+        np.cumsum(np.bincount(rows, minlength=len(ids)), out=indptr[1:])
+    with open(snapshot_fn, "wb") as f:
+        np.savez_compressed(f,
+                            index=np.int64(index),
+                            ids=ids,
+                            types=types,
+                            sites=sites,
+                            names=np.array(names, dtype=np.str_),
+                            symbols=np.array(symbol_table.names \
+                                             if symbol_table is not None \
+                                             else [], dtype=np.str_),
+                            indptr=indptr,
+                            indices=cols[order].astype(np.int32),
+                            stack=stack[order],
+                            heap=heap[order])
+
+
+def load(snapshot_fn):
+    with np.load(snapshot_fn) as arrays:
+        return Snapshot(dict((key, arrays[key]) for key in arrays.files))
+
+
+class Snapshot(object):
+    """
+    The arrays of a snapshot file, as described at the top of this file.
+    """
+
+    def __init__(self, arrays):
+        self.index = int(arrays["index"])
+        self.ids = arrays["ids"]
+        self.types = arrays["types"]
+        self.sites = arrays["sites"]
+        self.names = arrays["names"].tolist()
+        self.symbols = arrays["symbols"].tolist()
+        self.indptr = arrays["indptr"]
+        self.indices = arrays["indices"]
+        self.stack = arrays["stack"]
+        self.heap = arrays["heap"]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def ref_count(self):
+        return len(self.indices)
+
+    def format_id(self, obj_id):
+        """
+        Return the token of the log an object ID was parsed from.
+        """
+        if obj_id < 0:
+            return self.symbols[-obj_id - 1]
+        return str(obj_id)
+
+    def referees(self, i):
+        """
+        Return the positions of the objects referenced by the object at
+        position i.
+        """
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def to_networkx(self):
+        """
+        Build a DiGraph with the object IDs as nodes, with the type and
+        site names of the objects, and the stack and heap counts of the
+        references, like the graph of GraphModel.
+        """
+        import networkx as nx
+        g = nx.DiGraph()
+        ids = self.ids.tolist()
+        for obj_id, type_id, site_id in zip(ids, self.types.tolist(),
+                                            self.sites.tolist()):
+            g.add_node(obj_id, type=self.names[type_id],
+                       site=self.names[site_id])
+        indptr, indices = self.indptr.tolist(), self.indices.tolist()
+        stack, heap = self.stack.tolist(), self.heap.tolist()
+        for i, referrer_id in enumerate(ids):
+            for j in xrange(indptr[i], indptr[i + 1]):
+                g.add_edge(referrer_id, ids[indices[j]],
+                           stack=stack[j], heap=heap[j])
+        return g
+
+    def to_sparse(self, weight="total"):
+        """
+        Build a SciPy CSR matrix indexed by the positions of the objects
+        in ids, holding the number of 'stack', 'heap' or 'total'
+        references between each pair of objects.
+        """
+        try:
+            import scipy.sparse
+        except ImportError:
+            raise Exception("to_sparse: "
+                            "Converting a snapshot to a sparse matrix "
+                            "requires 'scipy'")
+        if weight == "stack":
+            data = self.stack
+        elif weight == "heap":
+            data = self.heap
+        elif weight == "total":
+            data = self.stack + self.heap
+        else:
+            raise Exception("to_sparse: "
+                            "Unknown weight {0}".format(weight))
+        return scipy.sparse.csr_matrix((data, self.indices, self.indptr),
+                                       shape=(len(self.ids), len(self.ids)))
+
+
+def parse_args():
+    prog_desc = ("Print a summary of a heap snapshot, optionally "
+                 "exporting it to GraphML.")
+    sf_help = ("The snapshot file.")
+    gm_help = ("Write the snapshot as a GraphML file, with the object IDs "
+               "as they appear in the log.")
+
+    parser = argparse.ArgumentParser(prog="snapshot", description=prog_desc)
+    parser.add_argument("snapshot",
+                        help=sf_help)
+    parser.add_argument("-g", "--graphml",
+                        help=gm_help, default=None)
+
+    args = parser.parse_args()
+    return args.snapshot, args.graphml
+
+
+def main():
+    snapshot_fn, graphml_fn = parse_args()
+    snap = load(snapshot_fn)
+    print "Snapshot after {0} events".format(snap.index)
+    print "-- objects = {0}".format(len(snap))
+    print "-- references = {0}".format(snap.ref_count())
+    if graphml_fn is not None:
+        import networkx as nx
+        g = nx.relabel_nodes(snap.to_networkx(), snap.format_id)
+        nx.write_graphml(g, graphml_fn)
+        print "Written to {0}".format(graphml_fn)
+
+
+if __name__ == "__main__":
+    main()
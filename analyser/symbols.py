@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+# Integer keys for the objects of the log.
+#
+# The object IDs in the log are decimal integers, which are parsed into
+# ints before the events reach the model, so that the model, queries and
+# results work on ints instead of a new string per event. Some events
+# use a class name where an object ID is expected, e.g. the owner of a
+# static method, or "-" for no caller. Those are interned in a
+# SymbolTable as negative ints, which no object ID in the log is, and
+# are mapped back to the name when the results are reported.
+
+
+class SymbolTable(object):
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def intern(self, name):
+        """
+        Return the (negative) key of a name, adding it if it's new.
+        """
+        key = self.ids.get(name)
+        if key is None:
+            self.names.append(name)
+            key = self.ids[name] = -len(self.names)
+        return key
+
+    def obj_id(self, token):
+        """
+        Return the key of a token of the log used as an object ID, which
+        is an int or a string, the int it's the decimal of, or the key of
+        the name it is.
+        """
+        if token.__class__ is not str:
+            return token
+        if token.isdigit():
+            return int(token)
+        return self.intern(token)
+
+    def format_id(self, obj_id):
+        """
+        Return the token of the log a key was parsed from.
+        """
+        if obj_id < 0:
+            return self.names[-obj_id - 1]
+        return str(obj_id)
+
+    def save_state(self):
+        return list(self.names)
+
+    def load_state(self, names):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.intern(name)
@@ -1,12 +1,18 @@
 #!usr/bin/env python
 import analyser
 import graphmodel
+import compactmodel
+import shard
 from combinators import *
 import plot
+import profiler
+import results
+import typetable
 import sys
 import os
 import datetime
 import argparse
+import json
 
 
 # Implemented by API:
@@ -22,17 +28,12 @@ import argparse
 # model, provided with query factories, data collectors and other parameters.
 
 
-def str_to_int(s):
-    try:
-        return int(s)
-    except:
-        return -1
-
-
 def print_query_results(results, exec_info, verbose=False, out_file=sys.stdout):
     stdout = sys.stdout
     sys.stdout = out_file
-    res_len = len(results)
+    # Results finalised by a result sink only hold the objects it kept, 
+    # the number of objects and the query stats are in exec_info
+    res_len = exec_info.get("objects", len(results))
 
     padding = len(str(max(exec_info["query_rate"], exec_info["collect_rate"])))
     print "\nEXECUTION PARAMETERS\n"
@@ -42,6 +43,9 @@ def print_query_results(results, exec_info, verbose=False, out_file=sys.stdout):
                                           .format(exec_info["query_rate"])
     print     "-- Collect rate = {: >PAD}".replace("PAD", str(padding)) \
                                           .format(exec_info["collect_rate"])
+    print     "-- Query mode   = {}".format(exec_info["query_mode"])
+    if exec_info.get("query_set"):
+        print "-- Query set    = {}".format(exec_info["query_set"])
     
     print "\n", "-"*50
     print "\nRESULTS"
@@ -51,15 +55,22 @@ def print_query_results(results, exec_info, verbose=False, out_file=sys.stdout):
         print "-"*50
     
     query_stats = {}
+    frozen_stats = {}
+    # Object IDs are ints, names used as object IDs are negative and 
+    # sorted first (see symbols.py)
     zipped = sorted(zip(results.keys(), results.values()),
-                    key=lambda tup: str_to_int(tup[0]))
+                    key=lambda tup: max(tup[0], -1))
+    format_id = exec_info["symbols"].format_id
     
     for obj_id, data in zipped:
         if verbose:
-            print "OBJECT: {0}, TYPE: {1}".format(obj_id, data["type"])
+            print "OBJECT: {0}, TYPE: {1}".format(format_id(obj_id),
+                                                  data["type"])
         for qry in data["queries"]:
             query_stats[qry.toString()] = \
                 query_stats.get(qry.toString(), 0) + qry.isAccepting()
+            frozen_stats[qry.toString()] = \
+                frozen_stats.get(qry.toString(), 0) + qry.isFrozen()
             if verbose:
                 print "\t[{0}] [{1}]  {2}".format(
                     "A" if qry.isAccepting() else " ", 
@@ -67,11 +78,41 @@ def print_query_results(results, exec_info, verbose=False, out_file=sys.stdout):
                     qry.toString())
         if verbose:
             print "-"*50
+    if "query_stats" in exec_info:
+        query_stats = exec_info["query_stats"]
+        frozen_stats = exec_info["frozen_stats"]
 
     print "\nExecution time:", exec_info["exec_time"]
     print "Number of objects created during the execution:", res_len
     print "Queries in accepting state:\n"
-    
+    print_query_stats(query_stats, res_len)
+    # Frozen queries can't change anymore, the objects with all of 
+    # their queries frozen were left out of the query passes
+    print "\nQueries in frozen state:\n"
+    print_query_stats(frozen_stats, res_len)
+
+    if "type_stats" in exec_info:
+        print_group_stats("type", exec_info["type_stats"])
+    if "site_stats" in exec_info:
+        print_group_stats("allocation site", exec_info["site_stats"])
+
+    sys.stdout = stdout
+
+
+def split_exec_info(exec_info, name):
+    """
+    Return the execution info of one query set, out of that of a run 
+    with several sets, whose stats are keyed by the name of the set.
+    """
+    info = dict(exec_info)
+    for key in ["query_stats", "frozen_stats", "type_stats", "site_stats"]:
+        if key in exec_info:
+            info[key] = exec_info[key][name]
+    info["query_set"] = name
+    return info
+
+
+def print_query_stats(query_stats, res_len):
     for qry in query_stats:
         print "{0: >X}/{1} ~= {2:6.2f}%\t{3}" \
             .replace("X", str(len(str(res_len)))) \
@@ -81,25 +122,33 @@ def print_query_results(results, exec_info, verbose=False, out_file=sys.stdout):
                 round((float(query_stats[qry]) / float(res_len)) * 100, 2),
                 qry)
 
-    sys.stdout = stdout
 
+def print_group_stats(title, stats, limit=10):
+    groups = sorted(stats.iteritems(), key=lambda item: -item[1]["objects"])
+    print "\nQueries in accepting state per {0} " \
+          "({1} most common of {2}):".format(title, min(limit, len(groups)),
+                                            len(groups))
+    for key, group in groups[:limit]:
+        count = group["objects"]
+        print "\n{0}: {1} objects".format(key, count)
+        for qry, accepting in sorted(group["accepting"].iteritems()):
+            print "    {0: >X}/{1} ~= {2:6.2f}%\t{3}" \
+                .replace("X", str(len(str(count)))) \
+                .format(accepting, count,
+                        round(float(accepting) / count * 100, 2), qry)
+
+
+# The data collectors read the aggregates kept by the model, instead of 
+# scanning every object on each collection (see aggregates.py)
 
 def min_max_avg(model):
-    try:
-        inc_refs = [model.in_total_refs(o) for o in model.get_obj_ids()]
-        return min(inc_refs), max(inc_refs), sum(inc_refs)/float(len(inc_refs))
-    except:
-        return 0, 0, 0.0
+    agg = model.get_aggregates()
+    return agg.min_in_refs(), agg.max_in_refs(), agg.avg_in_refs()
 
 
 def bltin_vs_custom(model):
-    b, c = 0, 0
-    for o in model.get_obj_ids():
-        if model.is_builtin(o):
-            b += 1
-        else:
-            c += 1
-    return b, c
+    agg = model.get_aggregates()
+    return agg.builtin_count(), agg.custom_count()
     
 
 def rate_type(num):
@@ -114,45 +163,170 @@ def parse_args():
                  "parameters.")
     lf_help = ("The logfile to be parsed.")
     qr_help = ("The query rate. Default is 1.")
+    qm_help = ("The query mode. 'full' applies the queries of all objects "
+               "on each query pass, 'dirty' only those of objects changed "
+               "since the last pass, 'check' is 'dirty' while verifying "
+               "equivalence with 'full'. 'events' applies the queries after "
+               "every event, only to objects changed in a property the "
+               "queries depend on, ignoring the query rate. Default is "
+               "'full'.")
     cr_help = ("The collect rate. Default is 1.")
     ur_help = ("The update rate. Default is 1.")
     np_help = ("Determines whether to plot the data after execution.")
+    st_help = ("Stream the logfile instead of reading it into memory. "
+               "The logfile may be compressed with gzip or zstd.")
+    cq_help = ("Compile the query factories into a single program shared by "
+               "all objects, instead of creating combinators per object.")
+    vq_help = ("Evaluate the query conditions of all objects at once on "
+               "the columns of the compact model. Implies --backend compact.")
+    be_help = ("The model backend, 'graph' (networkx) or 'compact' "
+               "(arrays). Default is 'graph'.")
+    pf_help = ("Profile the execution, writing the time spent per phase, "
+               "opcode, query and data collector to the results.")
+    wk_help = ("Evaluate the queries in this many worker processes, "
+               "sharding the objects between them (see shard.py). Only "
+               "with the 'graph' backend. The events are still processed "
+               "serially, and the 'dirty' and 'events' query modes aren't "
+               "made faster. Default is 0, no workers.")
+    pl_help = ("Stream the logfile through a reader 'thread' or 'process', "
+               "which reads and splits it while the events are processed "
+               "(see pipeline.py). Implies --stream.")
+    ob_help = ("Write the final state of the queries of every object to "
+               "objects-<postfix>.tsv in the results directory.")
+    lc_help = ("Number of lines in the logfile, used for reporting progress "
+               "when streaming. Default is to estimate it from the bytes "
+               "read.")
+    bp_help = ("A prefix of the names of builtin types, may be given several "
+               "times. Default is {0}.".format(
+                   ", ".join("'{0}'".format(prefix) \
+                             for prefix in typetable.BUILTIN_PREFIXES)))
+    ss_help = ("Save a snapshot of the heap after this many events, to "
+               "snapshot-<postfix>-<events>.npz in the results directory "
+               "(see snapshot.py). May be given several times.")
+    qs_help = ("Evaluate the queries as the named sets 'unaliased' and "
+               "'custom' in a single pass, each with its own data "
+               "collectors, and write the results of each set to "
+               "query_results-<set>-<postfix>.txt.")
+    ck_help = ("Save a checkpoint of the execution every this many events, "
+               "to checkpoint-<postfix>.gz in the results directory (see "
+               "checkpoint.py).")
+    rs_help = ("Resume the execution whose results directory is given, "
+               "from its checkpoint, continuing to write its results. The "
+               "other parameters should be those of the execution.")
+    cf_help = ("Keep the stack references of method calls per call frame, "
+               "removing them all when the call exits (see callstack.py).")
     
     parser = argparse.ArgumentParser(prog="test", description=prog_desc)
     parser.add_argument("logfile",
                         help=lf_help)
     parser.add_argument("-q", "--qrate",
                         help=qr_help, type=rate_type, default=1)
+    parser.add_argument("-m", "--qmode",
+                        help=qm_help, default=analyser.QueryModes.FULL,
+                        choices=[analyser.QueryModes.FULL,
+                                 analyser.QueryModes.DIRTY,
+                                 analyser.QueryModes.CHECK,
+                                 analyser.QueryModes.EVENTS])
     parser.add_argument("-c", "--crate",
                         help=cr_help, type=rate_type, default=1)
     parser.add_argument("-u", "--urate",
                         help=ur_help, type=rate_type, default=1000)
     parser.add_argument("-n", "--noplot",
                         help=np_help, action="store_true")
+    parser.add_argument("-s", "--stream",
+                        help=st_help, action="store_true")
+    parser.add_argument("-k", "--compile",
+                        help=cq_help, action="store_true")
+    parser.add_argument("-x", "--vectorize",
+                        help=vq_help, action="store_true")
+    parser.add_argument("-b", "--backend",
+                        help=be_help, default="graph",
+                        choices=["graph", "compact"])
+    parser.add_argument("-l", "--linecount",
+                        help=lc_help, type=rate_type, default=None)
+    parser.add_argument("-p", "--profile",
+                        help=pf_help, action="store_true")
+    parser.add_argument("-w", "--workers",
+                        help=wk_help, type=int, default=0)
+    parser.add_argument("-t", "--pipeline",
+                        help=pl_help, default=None,
+                        choices=["thread", "process"])
+    parser.add_argument("-o", "--objects",
+                        help=ob_help, action="store_true")
+    parser.add_argument("-i", "--builtin",
+                        help=bp_help, action="append", default=None)
+    parser.add_argument("-S", "--snapshot",
+                        help=ss_help, type=rate_type, action="append",
+                        default=None)
+    parser.add_argument("-f", "--frames",
+                        help=cf_help, action="store_true")
+    parser.add_argument("-Q", "--qsets",
+                        help=qs_help, action="store_true")
+    parser.add_argument("-C", "--checkpoint",
+                        help=ck_help, type=rate_type, default=None)
+    parser.add_argument("-r", "--resume",
+                        help=rs_help, default=None)
     
     args = parser.parse_args()
-    lf, qr, cr, ur, np = (args.logfile,
-                          args.qrate,
-                          args.crate,
-                          args.urate,
-                          args.noplot)
+    (lf, qr, qm, cr, ur, np, st, lc, cq, vq, be, pf, wk, pl, ob, bp, ss, cf,
+     qs, ck, rs) = (
+                                                                  args.logfile,
+                                                                  args.qrate,
+                                                                  args.qmode,
+                                                                  args.crate,
+                                                                  args.urate,
+                                                                  args.noplot,
+                                                                  args.stream,
+                                                                  args.linecount,
+                                                                  args.compile,
+                                                                  args.vectorize,
+                                                                  args.backend,
+                                                                  args.profile,
+                                                                  args.workers,
+                                                                  args.pipeline,
+                                                                  args.objects,
+                                                                  args.builtin,
+                                                                  args.snapshot,
+                                                                  args.frames,
+                                                                  args.qsets,
+                                                                  args.checkpoint,
+                                                                  args.resume)
 
     if not os.path.isfile(lf):
         parser.error("'{}' is not a file.".format(lf))
+    if rs is not None and not os.path.isdir(rs):
+        parser.error("'{}' is not a directory.".format(rs))
+
+    if vq:
+        be = "compact"
+
+    if wk < 0:
+        parser.error("Number of workers can't be negative.")
+    if wk and be != "graph":
+        parser.error("Workers are only supported by the 'graph' backend.")
 
-    return lf, qr, cr, ur, np
+    if bp is None:
+        bp = typetable.BUILTIN_PREFIXES
+
+    return (lf, qr, qm, cr, ur, np, st, lc, cq, vq, be, pf, wk, pl, ob, bp, ss,
+            cf, qs, ck, rs)
 
 
 def main():
-    lf, qr, cr, ur, np = parse_args()
+    (lf, qr, qm, cr, ur, np, st, lc, cq, vq, be, pf, wk, pl, ob, bp, ss, cf,
+     qs, ck, rs) = parse_args()
 
     log_fn = lf
-    now = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    base = os.path.splitext(os.path.basename(log_fn))[0]
-    postfix = "{}-{}".format(now, base)
-    results_dir = "../data/results-{}".format(postfix)
-
-    os.mkdir(results_dir)
+    if rs is not None:
+        # The results of a resumed execution continue in its directory
+        results_dir = os.path.normpath(rs)
+        postfix = os.path.basename(results_dir)[len("results-"):]
+    else:
+        now = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        base = os.path.splitext(os.path.basename(log_fn))[0]
+        postfix = "{}-{}".format(now, base)
+        results_dir = "../data/results-{}".format(postfix)
+        os.mkdir(results_dir)
     
     #Create model and query factories
 
@@ -175,28 +349,106 @@ def main():
                        custom_obj,
                        custom_le4_inc_refs]
     
-    min_max_avg_fn = "{0}/min_max_avg-{1}.csv" \
-                     .format(results_dir, postfix)
-    bltin_vs_custom_fn = "{0}/bltin_vs_custom-{1}.csv" \
-                         .format(results_dir, postfix)
+    # With --qsets, the queries are evaluated as named sets, each with 
+    # its own data collectors and results files (see analyser.run)
+    query_sets = {"unaliased": [always_unaliased],
+                  "custom": [custom_obj, custom_le4_inc_refs]} \
+                 if qs else None
+    set_postfix = lambda name: "{}-{}".format(name, postfix) \
+                               if name is not None else postfix
+    
+    # The collected data is saved in binary columns (see columns.py)
+    min_max_avg_fn = "{0}/min_max_avg-{1}.npy" \
+                     .format(results_dir,
+                             set_postfix("unaliased" if qs else None))
+    bltin_vs_custom_fn = "{0}/bltin_vs_custom-{1}.npy" \
+                         .format(results_dir,
+                                 set_postfix("custom" if qs else None))
     
     data_collectors = [
-        (min_max_avg_fn,     min_max_avg,     lambda x: str(x).strip("()")),
-        (bltin_vs_custom_fn, bltin_vs_custom, lambda x: str(x).strip("()"))]
+        (min_max_avg_fn,     min_max_avg,     None),
+        (bltin_vs_custom_fn, bltin_vs_custom, None)]
+    collector_sets = None
+    if qs:
+        collector_sets = {"unaliased": data_collectors[:1],
+                          "custom": data_collectors[1:]}
+        data_collectors = []
 
-    gm = graphmodel.GraphModel(query_factories, data_collectors)
+    if be == "compact":
+        gm = compactmodel.CompactModel(query_factories, data_collectors,
+                                       compile_queries=cq,
+                                       vectorize_queries=vq,
+                                       aggregates=True,
+                                       builtin_prefixes=bp,
+                                       call_frames=cf)
+    elif wk:
+        gm = shard.ShardedModel(query_factories, data_collectors,
+                                compile_queries=cq, aggregates=True,
+                                builtin_prefixes=bp, workers=wk,
+                                call_frames=cf)
+    else:
+        gm = graphmodel.GraphModel(query_factories, data_collectors,
+                                   compile_queries=cq, aggregates=True,
+                                   builtin_prefixes=bp, call_frames=cf)
+    
+    # The queries of removed objects are only kept as counts, and
+    # optionally as rows in a file
+    objects_fn = "{0}/objects-{1}.tsv".format(results_dir, postfix)
+    sink = results.ResultSink(rows_fn=objects_fn if ob else None)
     
-    out_file = "{0}/query_results-{1}.txt".format(results_dir, postfix)
-    of = open(out_file, "w")
+    # Formatted with the number of events processed by analyser.run
+    snapshot_fn = "{0}/snapshot-{1}-{{0}}.npz".format(results_dir, postfix) \
+                  if ss else None
+    checkpoint_fn = "{0}/checkpoint-{1}.gz".format(results_dir, postfix) \
+                    if ck or rs is not None else None
     
     query_results, exec_info = analyser.run(gm,
                                             log_fn=log_fn,
                                             query_rate=qr,
+                                            query_mode=qm,
                                             collect_rate=cr,
-                                            update_rate=ur)
+                                            update_rate=ur,
+                                            stream=st,
+                                            line_count=lc,
+                                            pipeline_mode=pl,
+                                            result_sink=sink,
+                                            query_sets=query_sets,
+                                            collector_sets=collector_sets,
+                                            snapshot_fn=snapshot_fn,
+                                            snapshot_at=ss,
+                                            checkpoint_fn=checkpoint_fn,
+                                            checkpoint_rate=ck,
+                                            resume=rs is not None,
+                                            profiler=profiler.Profiler(
+                                                         per_query=not wk) \
+                                                     if pf else None)
     
-    print_query_results(query_results, exec_info, verbose=False, out_file=of)
-    of.close()
+    # One results file, and type and site stats, per query set
+    if query_sets is None:
+        set_results = [(None, query_results, exec_info)]
+    else:
+        set_results = [(name, query_results[name],
+                        split_exec_info(exec_info, name)) \
+                       for name in exec_info["query_sets"]]
+    for name, res, info in set_results:
+        out_file = "{0}/query_results-{1}.txt".format(results_dir,
+                                                      set_postfix(name))
+        with open(out_file, "w") as of:
+            print_query_results(res, info, verbose=False, out_file=of)
+        types_fn = "{0}/types-{1}.csv".format(results_dir, set_postfix(name))
+        sites_fn = "{0}/sites-{1}.csv".format(results_dir, set_postfix(name))
+        results.write_group_stats(info["type_stats"], types_fn)
+        results.write_group_stats(info["site_stats"], sites_fn)
+    if pf:
+        # Appended to the results file of the first set
+        out_file = "{0}/query_results-{1}.txt" \
+                   .format(results_dir, set_postfix(set_results[0][0]))
+        of = open(out_file, "a")
+        profiler.print_report(exec_info["profile"], out_file=of)
+        profile_fn = "{0}/profile-{1}.json".format(results_dir, postfix)
+        with open(profile_fn, "w") as profile_file:
+            json.dump(exec_info["profile"], profile_file, indent=2)
+        of.close()
 
     if not np:
         print "\nPlotting..."
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+import unittest
+import analyser
+import graphmodel
+import compactmodel
+import symbols
+import tracegen
+from combinators import *
+
+# Replays the same events on every model backend and query mode, and
+# checks that they end with the same query results. Run from the
+# analyser directory with:
+#
+#   python -m unittest discover -s tests -t .
+
+# Events exercising the anomalies of the agent's output the handlers
+# deal with (see notes/objectives.org): an object passed to <init>
+# before its allocation, an unallocated string argument, an MEXIT
+# with the wrong method owner, and a deallocation of an object that
+# still has references.
+ANOMALIES = [line.split(" ") for line in """\
+4 <clinit> - Main
+4 <init> Main 10
+1 10 com/example/Node Main
+4 put Main 10 11 12
+1 11 java/lang/String 10
+3 next 11 0 10 10
+7 11 0 10
+6 put 0 Main Main 11 12
+3 next 12 11 10 10
+4 get 10 11
+6 get 0 10 11
+5 11
+7 0 12 10
+3 next 0 12 10 10
+5 10
+1 13 [I Main
+3 data 13 0 Main Main
+6 <clinit> 0 - Main
+""".splitlines()]
+
+
+def query_factories():
+    unaliased = lambda m, o: Observe("Object is unaliased",
+                                     lambda: m.in_total_refs(o) <= 1)
+    is_builtin = lambda m, o: Observe("Object is built-in",
+                                      lambda: m.is_builtin(o))
+    le4 = lambda m, o: Observe("Object has <= 4 incoming references",
+                               lambda: m.in_total_refs(o) <= 4)
+    out_heap = lambda m, o: Observe("Object has > 1 outgoing heap refs",
+                                    lambda: m.out_heap_refs(o) > 1)
+    no_stack = lambda m, o: Observe("Object has no stack references",
+                                    lambda: m.in_stack_refs(o) == 0)
+    return [lambda m, o: Always(unaliased(m, o)),
+            lambda m, o: Immediately(Not(is_builtin(m, o))),
+            lambda m, o: All([Immediately(Not(is_builtin(m, o))),
+                              Always(le4(m, o))]),
+            lambda m, o: Any([Ever(out_heap(m, o)),
+                              Always(no_stack(m, o))])]
+
+
+def trace(count, seed):
+    gen = tracegen.TraceGenerator(seed=seed, heap_size=100, hub_count=5)
+    return list(gen.events(count))
+
+
+def replay(model, events, query_rate=1, query_mode=analyser.QueryModes.FULL):
+    """
+    Process the events on the model, returning the type and the state
+    of the queries of every object, removed or not.
+    """
+    events = list(analyser.intern_events([list(event) for event in events],
+                                         symbols.SymbolTable()))
+    analyser.execute(model, events, query_rate, collect_rate=10 ** 9,
+                     update_rate=10 ** 9, query_mode=query_mode)
+    results = model.get_results()
+    analyser.get_remaining_results(model, results)
+    return dict((obj_id, (data["type"],
+                          [(qry.isAccepting(), qry.isFrozen()) \
+                           for qry in data["queries"]])) \
+                for obj_id, data in results.iteritems())
+
+
+def refs(model):
+    return dict((obj_id, (model.in_stack_refs(obj_id),
+                          model.in_heap_refs(obj_id),
+                          model.out_stack_refs(obj_id),
+                          model.out_heap_refs(obj_id))) \
+                for obj_id in model.get_obj_ids())
+
+
+BACKENDS = [
+    ("graph", graphmodel.GraphModel, {}),
+    ("graph compiled", graphmodel.GraphModel, {"compile_queries": True}),
+    ("compact", compactmodel.CompactModel, {}),
+    ("compact compiled", compactmodel.CompactModel,
+     {"compile_queries": True}),
+    ("compact vectorized", compactmodel.CompactModel,
+     {"vectorize_queries": True}),
+]
+
+
+class BackendTest(unittest.TestCase):
+
+    def check_backends(self, events, query_rate=1):
+        expected = replay(graphmodel.GraphModel(query_factories()), events,
+                          query_rate)
+        for name, Model, kwargs in BACKENDS[1:]:
+            results = replay(Model(query_factories(), **kwargs), events,
+                             query_rate)
+            self.assertEqual(results, expected, name)
+
+    def test_anomalies(self):
+        self.check_backends(ANOMALIES)
+
+    def test_trace(self):
+        self.check_backends(trace(1500, seed=1))
+
+    def test_trace_query_rate(self):
+        self.check_backends(trace(1500, seed=2), query_rate=7)
+
+    def test_reference_counts(self):
+        events = trace(1500, seed=3)
+        graph = graphmodel.GraphModel(query_factories())
+        compact = compactmodel.CompactModel(query_factories())
+        replay(graph, events)
+        replay(compact, events)
+        self.assertEqual(refs(compact), refs(graph))
+        self.assertEqual(sorted(compact.get_refs()), sorted(graph.get_refs()))
+
+
+class QueryModeTest(unittest.TestCase):
+
+    # Only applying the queries of the dirty objects gives the same
+    # results as applying those of all objects, at any query rate
+
+    def check_modes(self, events, query_rate):
+        for name, Model, kwargs in BACKENDS:
+            expected = replay(Model(query_factories(), **kwargs), events,
+                              query_rate, analyser.QueryModes.FULL)
+            for mode in [analyser.QueryModes.DIRTY,
+                         analyser.QueryModes.CHECK]:
+                results = replay(Model(query_factories(), **kwargs),
+                                 events, query_rate, mode)
+                self.assertEqual(results, expected, "{0} {1}" \
+                                 .format(name, mode))
+            if query_rate == 1:
+                results = replay(Model(query_factories(), **kwargs), events,
+                                 query_rate, analyser.QueryModes.EVENTS)
+                self.assertEqual(results, expected, "{0} events" \
+                                 .format(name))
+
+    def test_anomalies(self):
+        self.check_modes(ANOMALIES, 1)
+
+    def test_trace(self):
+        self.check_modes(trace(1000, seed=4), 1)
+
+    def test_trace_query_rate(self):
+        self.check_modes(trace(1000, seed=5), 13)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+import random
+import argparse
+import bintrace
+
+# Generates synthetic logs, in the format of the agent's output (see
+# notes/objectives.org), for benchmarking the analyser.
+#
+# The generator simulates a program with a call stack, a heap of objects
+# with fields, and a few long-lived hub objects that many fields and
+# variables point to. Every event is consistent with the ones before it:
+# objects are only referenced while they are alive, MEXIT lists the
+# arguments and local variables of the exiting method, and FSTORE and
+# VSTORE report the value previously stored in a field or variable.
+# Like in the agent's output, the objects of user-defined classes are
+# passed to an <init> method before their allocation event.
+#
+# The same seed and parameters always give the same trace.
+
+# Types of allocated objects, with their relative frequencies
+TYPES = [("java/lang/String", 30),
+         ("[C", 10),
+         ("[I", 5),
+         ("[Ljava/lang/Object;", 5),
+         ("java/util/HashMap", 5),
+         ("java/util/ArrayList", 8),
+         ("java/lang/Integer", 7),
+         ("sun/misc/Cleaner", 2),
+         ("com/example/Node", 12),
+         ("com/example/Tree", 4),
+         ("com/example/Visitor", 6),
+         ("com/example/Point", 6)]
+
+# Static classes, appearing as callers and owners of static methods
+CLASSES = ["Main", "com/example/Util", "com/example/Cache"]
+
+FIELDS = ["next", "left", "right", "value", "data", "parent"]
+METHODS = ["get", "put", "visit", "compute", "toString", "apply", "run"]
+
+# Relative frequencies of the events, apart from DEALLOC which is given
+# by dealloc_rate and MEXIT which follows from MCALL
+WEIGHTS = [("alloc", 14),
+           ("fload", 18),
+           ("fstore", 14),
+           ("call", 17),
+           ("vstore", 14)]
+
+
+class Frame(object):
+
+    def __init__(self, name, caller, owner, args):
+        self.name = name
+        self.caller = caller
+        self.owner = owner
+        self.args = args
+        # Local variable -> object ID, or "0"
+        self.vars = {}
+
+
+class TraceGenerator(object):
+    """
+    Generate the events of a synthetic trace.
+
+    heap_size:    Number of live objects that deallocations keep the
+                  heap at. The heap grows past it if dealloc_rate < 1.
+    hub_count:    Number of long-lived objects, never deallocated.
+    hub_fan_in:   Probability that a stored or passed object is a hub.
+    call_depth:   Maximum depth of the call stack.
+    dealloc_rate: Number of deallocations per allocation, once the heap
+                  has reached heap_size.
+    """
+
+    def __init__(self, seed=0, heap_size=1000, hub_count=10,
+                 hub_fan_in=0.1, call_depth=20, dealloc_rate=1.0):
+        self.rand = random.Random(seed)
+        self.heap_size = heap_size
+        self.hub_count = hub_count
+        self.hub_fan_in = hub_fan_in
+        self.call_depth = call_depth
+        self.dealloc_rate = dealloc_rate
+        self.next_id = 1
+        self.live = []
+        self.live_index = {}
+        self.hubs = []
+        # (owner, field) -> object ID, and object ID -> set of
+        # (owner, field) it is stored in
+        self.fields = {}
+        self.stored_in = {}
+        self.stack = []
+        self._types = self._cumulative(TYPES)
+        self._actions = self._cumulative(WEIGHTS)
+
+    def _cumulative(self, weights):
+        total = float(sum(w for _, w in weights))
+        acc, cumulative = 0, []
+        for value, w in weights:
+            acc += w
+            cumulative.append((acc / total, value))
+        return cumulative
+
+    def _pick(self, cumulative):
+        r = self.rand.random()
+        for p, value in cumulative:
+            if r < p:
+                return value
+        return cumulative[-1][1]
+
+    def _add_live(self, obj):
+        self.live_index[obj] = len(self.live)
+        self.live.append(obj)
+
+    def _remove_live(self, obj):
+        i = self.live_index.pop(obj)
+        last = self.live.pop()
+        if last != obj:
+            self.live[i] = last
+            self.live_index[last] = i
+
+    def _some_obj(self):
+        if self.hubs and self.rand.random() < self.hub_fan_in:
+            return self.rand.choice(self.hubs)
+        return self.rand.choice(self.live)
+
+    def _context(self):
+        # The object or class executing the current method
+        return self.stack[-1].owner
+
+    def _is_user_type(self, obj_type):
+        return obj_type.startswith("com/")
+
+    def _alloc(self):
+        obj = str(self.next_id)
+        self.next_id += 1
+        obj_type = self._pick(self._types)
+        caller = self._context()
+        events = []
+        if self._is_user_type(obj_type):
+            # The constructor is called before the allocation event
+            events.append(["4", "<init>", caller, obj])
+            events.append(["1", obj, obj_type, caller])
+            events.append(["6", "<init>", "0", caller, obj, obj])
+        else:
+            events.append(["1", obj, obj_type, caller])
+        self._add_live(obj)
+        if len(self.hubs) < self.hub_count:
+            self.hubs.append(obj)
+        # Keep the new object in a variable of the current method
+        events.append(self._vstore(obj))
+        return events
+
+    def _vstore(self, obj=None):
+        frame = self.stack[-1]
+        var = self.rand.randrange(4)
+        if obj is None:
+            obj = self._some_obj() if self.rand.random() < 0.85 else "0"
+        old = frame.vars.get(var, "0")
+        frame.vars[var] = obj
+        return ["7", obj, old, frame.owner]
+
+    def _field_owner(self):
+        if self.rand.random() < 0.9:
+            return self.rand.choice(self.live)
+        return self.rand.choice(CLASSES)
+
+    def _fload(self):
+        owner, field = self._field_owner(), self.rand.choice(FIELDS)
+        return ["2", field, self.fields.get((owner, field), "0"),
+                self._context(), owner]
+
+    def _fstore(self):
+        owner, field = self._field_owner(), self.rand.choice(FIELDS)
+        obj = self._some_obj() if self.rand.random() < 0.9 else "0"
+        old = self.fields.get((owner, field), "0")
+        if old != "0":
+            self.stored_in[old].discard((owner, field))
+        self.fields[(owner, field)] = obj
+        if obj != "0":
+            self.stored_in.setdefault(obj, set()).add((owner, field))
+        return ["3", field, obj, old, self._context(), owner]
+
+    def _call(self):
+        caller = self._context()
+        owner = self.rand.choice(self.live) if self.rand.random() < 0.8 \
+                else self.rand.choice(CLASSES)
+        args = [self._some_obj() for _ in xrange(self.rand.randrange(4))]
+        name = self.rand.choice(METHODS)
+        self.stack.append(Frame(name, caller, owner, args))
+        return ["4", name, caller, owner] + args
+
+    def _call_main(self):
+        caller = self._context()
+        self.stack.append(Frame("main", caller, CLASSES[0], []))
+        return ["4", "main", caller, CLASSES[0]]
+
+    def _exit(self):
+        frame = self.stack.pop()
+        ret = self.rand.choice(self.live) if self.rand.random() < 0.3 \
+              else "0"
+        local_vars = [obj for obj in frame.vars.values() if obj != "0"]
+        return ["6", frame.name, ret, frame.caller, frame.owner] + \
+               frame.args + local_vars
+
+    def _dealloc(self):
+        # Objects executing a method and hubs are never deallocated
+        active = set(frame.owner for frame in self.stack)
+        for _ in xrange(8):
+            obj = self.rand.choice(self.live)
+            if obj not in active and obj not in self.hubs:
+                break
+        else:
+            return []
+        self._forget(obj)
+        return ["5", obj]
+
+    def _forget(self, obj):
+        # Remove all traces of a deallocated object, so that it's never
+        # referred to again
+        self._remove_live(obj)
+        for key in self.stored_in.pop(obj, ()):
+            self.fields[key] = "0"
+        for field in FIELDS:
+            old = self.fields.pop((obj, field), "0")
+            if old != "0":
+                self.stored_in[old].discard((obj, field))
+        for frame in self.stack:
+            frame.args = [arg for arg in frame.args if arg != obj]
+            for var, value in frame.vars.items():
+                if value == obj:
+                    frame.vars[var] = "0"
+
+    def _step(self):
+        if not self.live:
+            return self._alloc()
+        alloc_p = self._actions[0][0]
+        if len(self.live) > self.heap_size / 2 and \
+           self.rand.random() < alloc_p * self.dealloc_rate * \
+                                min(1.0, len(self.live) /
+                                         float(self.heap_size)):
+            return [self._dealloc()]
+        action = self._pick(self._actions)
+        if action == "alloc":
+            return self._alloc()
+        if action == "fload":
+            return [self._fload()]
+        if action == "fstore":
+            return [self._fstore()]
+        if action == "vstore":
+            return [self._vstore()]
+        # Calls and exits, as a random walk on the depth of the stack,
+        # not counting the frames of the header event and main
+        depth = len(self.stack) - 2
+        if depth > 0 and (depth >= self.call_depth or
+                          self.rand.random() < 0.5):
+            return [self._exit()]
+        return [self._call()]
+
+    def events(self, count):
+        """
+        Generate count events, each a list of tokens like the split
+        lines of a log. The trace starts like the agent's output.
+        """
+        header = bintrace.FIXED_HEADER_EVENT
+        self.stack.append(Frame(header[1], header[2], header[3], []))
+        yield header
+        # The main method, which never exits
+        yield self._call_main()
+        emitted = 2
+        while emitted < count:
+            for event in self._step():
+                if event and emitted < count:
+                    yield event
+                    emitted += 1
+
+
+def generate(out_fn, count, binary=False, **params):
+    """
+    Write a trace of count events, as a text log or a binary trace (see
+    bintrace.py). The parameters are those of TraceGenerator.
+    """
+    gen = TraceGenerator(**params)
+    with open(out_fn, "wb") as out_file:
+        if binary:
+            writer = bintrace.TraceWriter(out_file)
+            for event in gen.events(count):
+                writer.write_event(event)
+        else:
+            for event in gen.events(count):
+                out_file.write(" ".join(event) + "\n")
+
+
+def parse_args():
+    prog_desc = ("Generate a synthetic log for benchmarking the analyser.")
+    out_help = ("The log to write.")
+    n_help = ("Number of events. Default is 100000.")
+    s_help = ("Seed of the random generator. Default is 0.")
+    hs_help = ("Number of live objects the heap is kept at. "
+               "Default is 1000.")
+    hc_help = ("Number of long-lived hub objects. Default is 10.")
+    hf_help = ("Probability that a stored or passed object is a hub. "
+               "Default is 0.1.")
+    cd_help = ("Maximum call depth. Default is 20.")
+    dr_help = ("Deallocations per allocation once the heap has reached "
+               "its size. Default is 1.0.")
+    b_help = ("Write a binary trace (see bintrace.py) instead of text.")
+
+    parser = argparse.ArgumentParser(prog="tracegen", description=prog_desc)
+    parser.add_argument("outfile", help=out_help)
+    parser.add_argument("-n", "--events",
+                        help=n_help, type=int, default=100000)
+    parser.add_argument("-s", "--seed",
+                        help=s_help, type=int, default=0)
+    parser.add_argument("--heapsize",
+                        help=hs_help, type=int, default=1000)
+    parser.add_argument("--hubs",
+                        help=hc_help, type=int, default=10)
+    parser.add_argument("--hubfanin",
+                        help=hf_help, type=float, default=0.1)
+    parser.add_argument("--calldepth",
+                        help=cd_help, type=int, default=20)
+    parser.add_argument("--deallocrate",
+                        help=dr_help, type=float, default=1.0)
+    parser.add_argument("-b", "--binary",
+                        help=b_help, action="store_true")
+
+    args = parser.parse_args()
+
+    params = {"seed": args.seed,
+              "heap_size": args.heapsize,
+              "hub_count": args.hubs,
+              "hub_fan_in": args.hubfanin,
+              "call_depth": args.calldepth,
+              "dealloc_rate": args.deallocrate}
+
+    return args.outfile, args.events, args.binary, params
+
+
+def main():
+    out_fn, count, binary, params = parse_args()
+    print "\nGenerating..."
+    generate(out_fn, count, binary, **params)
+    print "Done"
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+import numpy as np
+
+# Interned type names.
+#
+# The models store the type of an object as the index of its name in a
+# TypeTable, instead of a string per object. The properties of a type
+# that queries ask about, such as whether it's builtin, are computed
+# once when the type is first seen, so that is_builtin is a list lookup
+# and is_instance_of an integer comparison.
+#
+# A type is builtin if its name starts with one of builtin_prefixes,
+# which are those of the JDK classes and arrays by default. The unknown
+# type, of objects whose allocation wasn't seen, is always builtin.
+
+UNKNOWN = "(unknown)"
+
+BUILTIN_PREFIXES = ("java/", "sun/", "[")
+
+
+class TypeTable(object):
+
+    def __init__(self, builtin_prefixes=BUILTIN_PREFIXES):
+        self.builtin_prefixes = tuple(builtin_prefixes)
+        self.names = []
+        self.ids = {}
+        self.builtin = []
+        self._builtin_array = None
+        self.intern(UNKNOWN)
+
+    def intern(self, name):
+        """
+        Return the ID of a type name, adding it if it's new.
+        """
+        type_id = self.ids.get(name)
+        if type_id is None:
+            type_id = len(self.names)
+            self.names.append(name)
+            self.ids[name] = type_id
+            self.builtin.append(name == UNKNOWN or
+                                name.startswith(self.builtin_prefixes))
+            self._builtin_array = None
+        return type_id
+
+    def get_id(self, name):
+        """
+        Return the ID of a type name, or -1 if it has never been seen,
+        which is the ID of no object.
+        """
+        return self.ids.get(name, -1)
+
+    def builtin_array(self):
+        """
+        Return the builtin flags as a boolean array indexed by type ID.
+        """
+        if self._builtin_array is None:
+            self._builtin_array = np.array(self.builtin, dtype=bool)
+        return self._builtin_array
+
+    def save_state(self):
+        return list(self.names)
+
+    def load_state(self, names):
+        self.names = []
+        self.ids = {}
+        self.builtin = []
+        self._builtin_array = None
+        for name in names:
+            self.intern(name)
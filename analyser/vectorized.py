@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+import numpy as np
+import querycompiler
+from querycompiler import OBSERVE, NOT, EVER, ALWAYS, IMMEDIATELY, ANY, ALL, \
+                          VAL, SET, ACC, FRZ
+
+# Evaluates a compiled query program for many objects at once.
+#
+# The query factories are run a second time against a ColumnCursor. Its
+# methods don't return the value of a property of a single object, but
+# an expression over the column holding that property for all objects.
+# Calling the getter of an Observe query then builds an expression of
+# the whole condition, e.g. the getter of
+#
+# >>> Observe("Object is unaliased", lambda: m.in_total_refs(o) <= 1)
+#
+# evaluates to the expression 'in_total <= 1', which can be evaluated
+# for all objects in a single NumPy operation. The state updates of the
+# other combinators are then applied as operations on the columns of a
+# state matrix, with one row per object and one column per node.
+#
+# Only comparisons, arithmetic and the bitwise operators &, | and ~ can
+# be used in the conditions, since 'and', 'or' and 'not' can't be
+# overloaded.
+
+
+class Expr(object):
+
+    def __init__(self, func):
+        self.func = func
+
+    def evaluate(self, cols):
+        return self.func(cols)
+
+    def _op(self, other, op):
+        if isinstance(other, Expr):
+            return Expr(lambda cols: op(self.func(cols), other.func(cols)))
+        return Expr(lambda cols: op(self.func(cols), other))
+
+    def __lt__(self, other): return self._op(other, lambda x, y: x < y)
+    def __le__(self, other): return self._op(other, lambda x, y: x <= y)
+    def __eq__(self, other): return self._op(other, lambda x, y: x == y)
+    def __ne__(self, other): return self._op(other, lambda x, y: x != y)
+    def __gt__(self, other): return self._op(other, lambda x, y: x > y)
+    def __ge__(self, other): return self._op(other, lambda x, y: x >= y)
+    def __add__(self, other): return self._op(other, lambda x, y: x + y)
+    def __sub__(self, other): return self._op(other, lambda x, y: x - y)
+    def __and__(self, other): return self._op(other, lambda x, y: x & y)
+    def __or__(self, other): return self._op(other, lambda x, y: x | y)
+    __radd__ = __add__
+    __rand__ = __and__
+    __ror__ = __or__
+
+    def __invert__(self):
+        return Expr(lambda cols: ~self.func(cols))
+
+    def __nonzero__(self):
+        raise Exception("Expr: "
+                        "Conditions can't use 'and', 'or' or 'not', "
+                        "use '&', '|' or '~' instead")
+
+
+def column(name):
+    return Expr(lambda cols: cols[name])
+
+
+class ColumnCursor(object):
+    """
+    Stand-in for the model passed to the query factories, returning
+    column expressions instead of the properties of a single object.
+    """
+
+    def in_stack_refs(self, obj_id):
+        return column("in_stack")
+
+    def in_heap_refs(self, obj_id):
+        return column("in_heap")
+
+    def in_total_refs(self, obj_id):
+        return column("in_total")
+
+    def out_stack_refs(self, obj_id):
+        return column("out_stack")
+
+    def out_heap_refs(self, obj_id):
+        return column("out_heap")
+
+    def out_total_refs(self, obj_id):
+        return column("out_total")
+
+    def is_builtin(self, obj_id):
+        return column("is_builtin")
+
+    def is_instance_of(self, obj_id, obj_type):
+        return Expr(lambda cols: cols["type"] == \
+                                 cols["types"].get_id(obj_type))
+
+
+class VectorProgram(querycompiler.Program):
+
+    def __init__(self, model, qry_fs):
+        querycompiler.Program.__init__(self, model, qry_fs)
+        cursor = ColumnCursor()
+        tsts = []
+        for qf in qry_fs:
+            self._observe_tsts(qf(cursor, None), tsts)
+        self.exprs = [None] * len(self.ops)
+        observes = [i for i, op in enumerate(self.ops) if op == OBSERVE]
+        for i, tst in zip(observes, tsts):
+            expr = tst()
+            if not isinstance(expr, Expr):
+                raise Exception("VectorProgram: "
+                                "Condition of query {0} can't be "
+                                "evaluated on columns" \
+                                .format(self._name_of(i)))
+            self.exprs[i] = expr
+
+    def _observe_tsts(self, q, tsts):
+        # Same pre-order as Program._flatten
+        if hasattr(q, "tst"):
+            tsts.append(q.tst)
+        elif hasattr(q, "qs"):
+            for subquery in q.qs:
+                self._observe_tsts(subquery, tsts)
+        else:
+            self._observe_tsts(q.q, tsts)
+
+    def _name_of(self, i):
+        for root, (start, end) in enumerate(self.roots):
+            if start <= i < end:
+                return self.names[root]
+
+    def apply_rows(self, states, rows, cols):
+        """
+        Apply all queries to the given rows of the state matrix, using
+        the model columns restricted to the same rows.
+        """
+        if len(rows) == 0:
+            return
+        s = states[rows]
+        active = np.empty(s.shape, dtype=bool)
+        for i, op in enumerate(self.ops):
+            p = self.parents[i]
+            a = (s[:, i] & FRZ) == 0
+            if p >= 0:
+                a &= active[:, p]
+            active[:, i] = a
+            if op == OBSERVE:
+                value = np.asarray(self.exprs[i].evaluate(cols), dtype=bool)
+                s[a, i] = np.where(value[a], SET | VAL | ACC, SET)
+        for i in xrange(len(self.ops) - 1, -1, -1):
+            op = self.ops[i]
+            a = active[:, i]
+            if op == OBSERVE or not a.any():
+                continue
+            if op in (ANY, ALL):
+                cs = s[:, list(self.children[i])] & (ACC | FRZ)
+                if op == ANY:
+                    acc = (cs & ACC).any(axis=1)
+                    frz = (cs == ACC | FRZ).any(axis=1) | \
+                          (cs == FRZ).all(axis=1)
+                else:
+                    acc = (cs & ACC).all(axis=1)
+                    frz = (cs == FRZ).any(axis=1) | \
+                          (cs == ACC | FRZ).all(axis=1)
+                new = np.where(acc, ACC, 0) | np.where(frz, FRZ, 0)
+            else:
+                c = s[:, self.children[i][0]]
+                if op == NOT:
+                    new = (c & FRZ) | np.where(c & ACC, 0, ACC)
+                elif op == EVER:
+                    new = np.where(c & ACC, VAL | ACC | FRZ, s[:, i])
+                elif op == ALWAYS:
+                    new = np.where(c & ACC, s[:, i], VAL | FRZ)
+                elif op == IMMEDIATELY:
+                    new = VAL | FRZ | (c & ACC)
+            s[:, i] = np.where(a, new, s[:, i])
+        states[rows] = s
+
+    def all_frozen_rows(self, states, rows):
+        """
+        Return for each of the given rows of the state matrix whether
+        all of its queries are frozen.
+        """
+        starts = [start for start, _ in self.roots]
+        return ((states[rows][:, starts] & FRZ) != 0).all(axis=1)
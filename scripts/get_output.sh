@@ -4,6 +4,8 @@
 #The first line in that file will be binary and unable to parse, 
 #but it will always be the same so it will be replaced with what 
 #it is supposed to say.
+#With -b, the fixed log is also converted into a binary trace
+#(see analyser/bintrace.py), written next to it with a .bin extension.
 
 #output_path="../../java-alias-agent/agent/output"
 #output_file="./output.log"
@@ -11,7 +13,7 @@
 #sed -i -e '1 d' -e '2 i 4 <clinit> - sun/launcher/LauncherHelper' $output_file
 
 if [ "$#" -lt 1 ]; then
-    echo "Usage: $0 <output_file>"
+    echo "Usage: $0 <output_file> [-b]"
     exit
 fi
 
@@ -27,3 +29,7 @@ if ! [ "$1" -ef $name ]; then
 fi
 
 sed -i -e '1 d' -e '2 i 4 <clinit> - sun/launcher/LauncherHelper' "./$name"
+
+if [ "$2" = "-b" ]; then
+    python "$(dirname "$0")/../analyser/bintrace.py" "./$name" "./${name%.*}.bin"
+fi